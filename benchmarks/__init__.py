@@ -0,0 +1,8 @@
+"""
+Benchmarks for the BuildDSL transpiler and runtime. Run them from the repository root with
+`python -m benchmarks.<name>`.
+
+`python -m benchmarks.phases` times every transpile and runtime phase on a file produced by the synthetic
+generator in :mod:`benchmarks.generate` and writes the results as JSON. Use `python -m benchmarks.compare` to
+compare the results of two commits.
+"""
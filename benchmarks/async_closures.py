@@ -0,0 +1,94 @@
+"""
+Compares the execution of I/O-bound closures with :meth:`Context.exec` (closures run one after another) and
+:meth:`Context.exec_async` (closures are awaited concurrently on one event loop).
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, Callable, List
+
+from builddsl import Context
+from builddsl.closure import ClosureFunction
+from builddsl.targets import ObjectTarget
+
+SYNC_CODE = """
+for name in names:
+    artifact name, {
+        manifest = read_manifest(self)
+    }
+"""
+
+ASYNC_CODE = """
+for name in names:
+    artifact name, {
+        manifest = await read_manifest(self)
+    }
+await resolve_all()
+"""
+
+
+class Artifact:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.manifest: Any = None
+
+
+class SyncStore:
+    def __init__(self, names: List[str], latency: float) -> None:
+        self.names = names
+        self.latency = latency
+
+    def read_manifest(self, artifact: Artifact) -> str:
+        time.sleep(self.latency)
+        return f"manifest of {artifact.name}"
+
+    def artifact(self, name: str, closure: Callable[[Artifact], Any]) -> None:
+        closure(Artifact(name))
+
+
+class AsyncStore:
+    def __init__(self, names: List[str], latency: float) -> None:
+        self.names = names
+        self.latency = latency
+        self.pending: List[ClosureFunction] = []
+        self.artifacts: List[Artifact] = []
+
+    async def read_manifest(self, artifact: Artifact) -> str:
+        await asyncio.sleep(self.latency)
+        return f"manifest of {artifact.name}"
+
+    def artifact(self, name: str, closure: ClosureFunction) -> None:
+        self.artifacts.append(Artifact(name))
+        self.pending.append(closure)
+
+    async def resolve_all(self) -> None:
+        await asyncio.gather(*(c.call_async(a) for c, a in zip(self.pending, self.artifacts)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--closures", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.01, help="Simulated I/O latency in seconds.")
+    args = parser.parse_args()
+
+    names = [f"artifact-{i}" for i in range(args.closures)]
+
+    sync_store = SyncStore(names, args.latency)
+    tstart = time.perf_counter()
+    Context(ObjectTarget(sync_store)).exec(SYNC_CODE)
+    sync_time = time.perf_counter() - tstart
+
+    async_store = AsyncStore(names, args.latency)
+    tstart = time.perf_counter()
+    asyncio.run(Context(ObjectTarget(async_store)).exec_async(ASYNC_CODE))
+    async_time = time.perf_counter() - tstart
+    assert all(a.manifest is not None for a in async_store.artifacts)
+
+    print(f"{args.closures} closures with {args.latency * 1000:.1f}ms simulated latency each")
+    print(f"  exec():       {sync_time * 1000:8.1f}ms")
+    print(f"  exec_async(): {async_time * 1000:8.1f}ms ({sync_time / async_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Times the overhead of calling a :class:`~builddsl.closure.ClosureFunction` with an empty body for three
+signatures: the default signature of a closure without an argument list (`self, *arguments, **kwarguments`), the
+signature that :class:`builddsl.optimizer.IgnoreUnusedArguments` emits if the closure does not use its variable
+arguments, and a closure that does not use the closure target (see :class:`builddsl.optimizer.SkipClosureState`).
+Each is called with a single argument and with extra arguments that are ignored.
+
+    $ python -m benchmarks.closure_call_overhead --calls 1000000
+"""
+
+import argparse
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from builddsl.closure import ClosureFunction, ClosureState
+from builddsl.targets import MutableMappingTarget
+
+
+def default(__closure__: ClosureState, self: Any, *arguments: Any, **kwarguments: Any) -> None:
+    pass
+
+
+def tightened(__closure__: ClosureState, self: Any) -> None:
+    pass
+
+
+def stateless(__closure__: None, self: Any) -> None:
+    pass
+
+
+CALLS: Dict[str, Tuple[Tuple[Any, ...], Dict[str, Any]]] = {
+    "f(x)": ((None,), {}),
+    "f(x, 1, 2, key=3)": ((None, 1, 2), {"key": 3}),
+}
+
+
+def _time(closure: Callable[..., Any], args: Tuple[Any, ...], kwargs: Dict[str, Any], calls: int) -> float:
+    tstart = time.perf_counter()
+    for _ in range(calls):
+        closure(*args, **kwargs)
+    return time.perf_counter() - tstart
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    state = ClosureState(None, None, MutableMappingTarget({}))
+    closures: Dict[str, ClosureFunction] = {
+        "default": state.definition(default),
+        "ignore_extra_arguments": state.definition(ClosureState.ignore_extra_arguments(tightened)),
+        "stateless": state.definition(ClosureState.stateless(ClosureState.ignore_extra_arguments(stateless))),
+    }
+
+    for call, (call_args, call_kwargs) in CALLS.items():
+        for name, closure in closures.items():
+            timing = min(_time(closure, call_args, call_kwargs, args.calls) for _ in range(args.repeat))
+            print(f"{call:<20} {name:<24} {timing * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Times calling a small closure many times from Python, which is dominated by creating the
+:class:`~builddsl.closure.ClosureState` for every invocation and resolving the names that the closure uses,
+with different #TranspileOptions.
+
+    $ python -m benchmarks.closure_calls --calls 100000
+"""
+
+import argparse
+import dataclasses
+import time
+from typing import Any, Callable, Dict
+
+from builddsl import Context
+from builddsl.targets import ObjectTarget
+from builddsl.transpiler import TranspileOptions
+
+CODE = """
+repeat calls, i -> {
+  record add(i * scale, offset), label
+}
+"""
+
+
+class Project:
+    scale = 2
+    offset = 1
+    label = "value"
+
+    def __init__(self, calls: int) -> None:
+        self.calls = calls
+        self.total = 0
+
+    def add(self, a: int, b: int) -> int:
+        return a + b
+
+    def record(self, value: int, label: str) -> None:
+        self.total += value
+
+    def repeat(self, count: int, closure: Callable[[int], Any]) -> None:
+        for i in range(count):
+            closure(i)
+
+
+OPTIONS: Dict[str, TranspileOptions] = {
+    "default": Context.OPTIONS,
+    "prefetch_free_names": dataclasses.replace(Context.OPTIONS, prefetch_free_names=True),
+    "optimize=2,snapshot": dataclasses.replace(Context.OPTIONS, optimize=2, optimize_snapshot=True),
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for name, options in OPTIONS.items():
+
+        class BenchmarkContext(Context):
+            OPTIONS = options
+
+        timings = []
+        for _ in range(args.repeat):
+            project = Project(args.calls)
+            tstart = time.perf_counter()
+            BenchmarkContext(ObjectTarget(project)).exec(CODE, "<benchmark>")
+            timings.append(time.perf_counter() - tstart)
+        print(f"{name:<24} {min(timings) * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Times a loop that registers callbacks, once with closures that are defined in every iteration and once with
+the closures hoisted out of the loop by the optimizer (see :class:`builddsl.optimizer.HoistClosures`).
+
+    $ python -m benchmarks.closure_hoisting --iterations 100000
+"""
+
+import argparse
+import dataclasses
+import time
+from typing import Any, Callable, List
+
+from builddsl import Context
+from builddsl.targets import ObjectTarget
+
+CODE = """
+for i in range(iterations):
+  on_event "build", event -> event.upper()
+  on_event "test", (event, status) -> {
+    return event + ": " + status
+  }
+"""
+
+
+class Project:
+    def __init__(self, iterations: int) -> None:
+        self.iterations = iterations
+        self.callbacks: List[Callable[..., Any]] = []
+
+    def on_event(self, name: str, callback: Callable[..., Any]) -> None:
+        self.callbacks.append(callback)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for optimize in (0, 1):
+
+        class BenchmarkContext(Context):
+            OPTIONS = dataclasses.replace(Context.OPTIONS, optimize=optimize)
+
+        timings = []
+        for _ in range(args.repeat):
+            project = Project(args.iterations)
+            tstart = time.perf_counter()
+            BenchmarkContext(ObjectTarget(project)).exec(CODE, "<benchmark>")
+            timings.append(time.perf_counter() - tstart)
+        closures = len({id(callback) for callback in project.callbacks})
+        print(f"optimize={optimize}  {min(timings) * 1000:8.1f}ms  {closures:>8} closure objects")
+
+
+if __name__ == "__main__":
+    main()
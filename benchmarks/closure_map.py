@@ -0,0 +1,85 @@
+"""
+Measures the throughput of a closure that is applied to many objects, called in a loop, with
+:meth:`ClosureFunction.map` and with :meth:`ClosureFunction.map` on a thread pool. The closure is defined in
+another closure and reads a local variable of it, like the closures that configure the tasks of a project. The
+threads share the interpreter lock, thus the pool only helps closures that wait for I/O.
+
+    $ python -m benchmarks.closure_map --objects 20000
+"""
+
+import argparse
+import concurrent.futures
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, List
+
+from builddsl import Context
+from builddsl.targets import ObjectTarget
+
+CODE = """
+project {
+  def scale = 3
+  configure {
+    size = size * scale
+    return size + offset
+  }
+}
+"""
+
+
+class Project:
+    offset = 1
+
+    def __init__(self) -> None:
+        self.closure: Callable[..., Any]
+
+    def project(self, closure: Callable[..., Any]) -> None:
+        closure(self)
+
+    def configure(self, closure: Callable[..., Any]) -> None:
+        self.closure = closure
+
+
+def _objects(count: int) -> List[SimpleNamespace]:
+    return [SimpleNamespace(size=i) for i in range(count)]
+
+
+def _measure(func: Callable[[List[SimpleNamespace]], List[Any]], count: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        objects = _objects(count)
+        tstart = time.perf_counter()
+        func(objects)
+        best = min(best, time.perf_counter() - tstart)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--objects", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    project = Project()
+    Context(ObjectTarget(project)).exec(CODE)
+    closure = project.closure
+
+    with concurrent.futures.ThreadPoolExecutor(args.workers) as executor:
+        results = [
+            ("loop", _measure(lambda objects: [closure(o) for o in objects], args.objects, args.repeat)),
+            ("map", _measure(closure.map, args.objects, args.repeat)),
+            (
+                f"map ({args.workers} threads)",
+                _measure(lambda objects: closure.map(objects, executor), args.objects, args.repeat),
+            ),
+        ]
+
+    loop_time = results[0][1]
+    for name, duration in results:
+        throughput = args.objects / duration
+        print(f"{name:<18} {duration * 1000:9.1f}ms {throughput:12,.0f} objects/s {loop_time / duration:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
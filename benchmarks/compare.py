@@ -0,0 +1,47 @@
+"""
+Compares two JSON result files written by `python -m benchmarks.phases` and exits with a non-zero status if
+a phase regressed by more than the threshold.
+
+    $ python -m benchmarks.compare before.json after.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent.")
+    args = parser.parse_args()
+
+    with open(args.baseline) as fp:
+        baseline = json.load(fp)
+    with open(args.current) as fp:
+        current = json.load(fp)
+
+    if baseline["meta"]["params"] != current["meta"]["params"]:
+        print("warning: the results were recorded with different parameters", file=sys.stderr)
+
+    regressions = []
+    print(f"{'phase':<24} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, timing in current["phases"].items():
+        if name not in baseline["phases"]:
+            print(f"{name:<24} {'-':>12} {timing['median'] * 1000:10.2f}ms {'new':>9}")
+            continue
+        before = baseline["phases"][name]["median"]
+        after = timing["median"]
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{name:<24} {before * 1000:10.2f}ms {after * 1000:10.2f}ms {change:+8.1f}%")
+        if change > args.threshold:
+            regressions.append(name)
+
+    if regressions:
+        print(f"regressed by more than {args.threshold}%: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
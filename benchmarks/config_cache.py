@@ -0,0 +1,62 @@
+"""
+Compares executing a configuration script with restoring its effect from a
+:class:`builddsl.config_cache.ConfigurationCache`, in memory and from a cache directory.
+
+    $ python -m benchmarks.config_cache --settings 200
+"""
+
+import argparse
+import tempfile
+import time
+from typing import Any, Callable, List
+
+from builddsl import Context
+from builddsl.config_cache import ConfigurationCache
+from builddsl.targets import MutableMappingTarget
+
+SETTING = """
+setting_{i} = {{"name": "setting-{i}", "values": list(map(x -> x * {i}, range(base, base + 10))), "enabled": flag}}
+"""
+
+
+def _measure(repeat: int, func: Callable[[], Any]) -> float:
+    timings: List[float] = []
+    for _ in range(repeat):
+        tstart = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - tstart)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--settings", type=int, default=200, help="Number of assignments in the script.")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    code = "".join(SETTING.format(i=i) for i in range(args.settings))
+    names = [f"setting_{i}" for i in range(args.settings)]
+
+    def run(cache: "ConfigurationCache | None") -> None:
+        values = {"base": 3, "flag": True, **dict.fromkeys(names)}
+        Context(MutableMappingTarget(values)).exec(code, "<benchmark>", config_cache=cache)
+        assert values[names[-1]]["values"][0] == 3 * (args.settings - 1)
+
+    memory_cache = ConfigurationCache()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        directory_cache = ConfigurationCache(tmpdir)
+        run(memory_cache)
+        run(directory_cache)
+        timings = {
+            "exec": _measure(args.repeat, lambda: run(None)),
+            "memory hit": _measure(args.repeat, lambda: run(memory_cache)),
+            "directory hit": _measure(args.repeat, lambda: run(directory_cache)),
+        }
+    assert memory_cache.hits == directory_cache.hits == args.repeat
+
+    for name, duration in timings.items():
+        print(f"{name:<14} {duration * 1000:8.2f}ms  ({timings['exec'] / duration:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Measures the transpile time with and without :attr:`TranspileOptions.pure_python_fast_path` on a corpus of
+modules from the Python standard library. Most modules use syntax that the rewriter does not support (e.g.
+comprehensions or `try` statements), thus the corpus only contains the top-level statements of every module
+that the rewriter accepts. Modules for which the fast path produces a different AST are listed, which happens
+where the rewriter misreads plain Python.
+
+    $ python -m benchmarks.fast_path
+"""
+
+import argparse
+import ast
+import dataclasses
+import os
+import sysconfig
+import time
+from typing import List, Tuple
+
+from builddsl import Context
+from builddsl.transpiler import transpile_to_ast
+
+
+def _corpus(limit: int) -> List[Tuple[str, str]]:
+    """
+    Returns the top-level statements of the stdlib modules that the rewriter accepts, joined per module.
+    """
+
+    stdlib = sysconfig.get_paths()["stdlib"]
+    files = []
+    for name in sorted(os.listdir(stdlib)):
+        if not name.endswith(".py"):
+            continue
+        with open(os.path.join(stdlib, name), encoding="utf8") as fp:
+            code = fp.read()
+        try:
+            module = ast.parse(code)
+        except SyntaxError:
+            continue
+        lines = code.splitlines(keepends=True)
+        statements = []
+        for node in module.body:
+            start = min([node.lineno, *(d.lineno for d in getattr(node, "decorator_list", []))])
+            statement = "".join(lines[start - 1 : node.end_lineno])
+            try:
+                transpile_to_ast(statement, name, Context.OPTIONS)
+            except Exception:
+                continue
+            statements.append(statement)
+        files.append((name, "".join(statements)))
+        if limit and len(files) == limit:
+            break
+    return files
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=0, help="Number of stdlib modules to read (default: all).")
+    args = parser.parse_args()
+
+    slow_options = Context.OPTIONS
+    fast_options = dataclasses.replace(Context.OPTIONS, pure_python_fast_path=True)
+
+    slow_time = fast_time = 0.0
+    accepted = rejected = mismatched = lines = 0
+    for name, code in _corpus(args.limit):
+        tstart = time.perf_counter()
+        try:
+            slow = transpile_to_ast(code, name, slow_options)
+        except Exception:
+            rejected += 1  # The statements that the rewriter accepts are not accepted together.
+            continue
+        slow_time += time.perf_counter() - tstart
+
+        tstart = time.perf_counter()
+        fast = transpile_to_ast(code, name, fast_options)
+        fast_time += time.perf_counter() - tstart
+
+        if ast.dump(fast) != ast.dump(slow):
+            print(f"different AST: {name}")
+            mismatched += 1
+        accepted += 1
+        lines += code.count("\n")
+
+    print(f"{accepted} modules ({lines} lines), {mismatched} with a different AST")
+    print(f"{rejected} modules rejected by the rewriter")
+    print(f"rewriter   {slow_time * 1000:9.1f}ms")
+    print(f"fast path  {fast_time * 1000:9.1f}ms")
+    print(f"speedup: {slow_time / fast_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Generates synthetic BuildDSL files for benchmarking.
+
+    $ python -m benchmarks.generate --statements 100 --closure-depth 4 > build.dsl
+"""
+
+import argparse
+import random
+from typing import List
+
+
+def _dict_literal(rng: random.Random, depth: int) -> str:
+    if depth <= 0:
+        return repr(rng.choice(["a", "b", "c"])) if rng.random() < 0.5 else str(rng.randint(0, 100))
+    items = ", ".join(f'"key{i}": {_dict_literal(rng, depth - 1)}' for i in range(2))
+    return "{" + items + "}"
+
+
+def _call(rng: random.Random, func: str, args: List[str], unparen_ratio: float) -> str:
+    if rng.random() < unparen_ratio:
+        return f"{func} {', '.join(args)}"
+    return f"{func}({', '.join(args)})"
+
+
+def _block(rng: random.Random, indent: int, depth: int, dict_depth: int, unparen_ratio: float, index: int) -> List[str]:
+    prefix = "  " * indent
+    lines = [
+        prefix + f'version = "1.{index}.{depth}"',
+        prefix + _call(rng, "depends_on", [f'"dep-{index}"', f'"dep-{index + 1}"'], unparen_ratio),
+        prefix + f"settings = {_dict_literal(rng, dict_depth)}",
+    ]
+    if depth > 0:
+        lines.append(prefix + f'configure "level-{depth}" {{')
+        lines += _block(rng, indent + 1, depth - 1, dict_depth, unparen_ratio, index)
+        lines.append(prefix + "}")
+        lines.append(prefix + "callbacks.append(x -> x * 2 + offset)")
+    return lines
+
+
+def generate(
+    statements: int = 200,
+    closure_depth: int = 3,
+    dict_depth: int = 2,
+    unparen_ratio: float = 0.5,
+    seed: int = 0,
+) -> str:
+    """
+    Generate BuildDSL code.
+
+    :param statements: The number of top-level statements.
+    :param closure_depth: How deep closures are nested in every `configure` block.
+    :param dict_depth: How deep dictionary literals are nested.
+    :param unparen_ratio: The fraction of function calls that are written without parentheses.
+    :param seed: The seed for the random number generator.
+    """
+
+    rng = random.Random(seed)
+    lines: List[str] = []
+    for index in range(statements):
+        kind = index % 3
+        if kind == 0:
+            lines.append(f'configure "project-{index}" {{')
+            lines += _block(rng, 1, closure_depth - 1, dict_depth, unparen_ratio, index)
+            lines.append("}")
+        elif kind == 1:
+            lines.append(f"settings = {_dict_literal(rng, dict_depth)}")
+        else:
+            lines.append(_call(rng, "depends_on", [f'"dep-{index}"', f"offset + {index}"], unparen_ratio))
+    return "\n".join(lines) + "\n"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--statements", type=int, default=200)
+    parser.add_argument("--closure-depth", type=int, default=3)
+    parser.add_argument("--dict-depth", type=int, default=2)
+    parser.add_argument("--unparen-ratio", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(generate(args.statements, args.closure_depth, args.dict_depth, args.unparen_ratio, args.seed), end="")
+
+
+if __name__ == "__main__":
+    main()
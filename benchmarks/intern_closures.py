@@ -0,0 +1,124 @@
+"""
+Executes many nearly identical build files that define the same closures at different lines and calls every
+closure, with #TranspileOptions.lazy_closures and with #TranspileOptions.intern_closures in addition. Reports
+the time to execute the files, the time of the first calls of the closures, which compile them, and the memory
+kept alive by the executed files.
+
+    $ python -m benchmarks.intern_closures --files 500
+"""
+
+import argparse
+import dataclasses
+import gc
+import time
+import tracemalloc
+from typing import Any, Callable, List, Tuple
+
+from builddsl import Context
+from builddsl.closure import INTERNED_CLOSURES
+from builddsl.targets import ObjectTarget
+
+HEADER = """
+version = "1.{i}.0"
+"""
+
+BODY = """
+task "compile" {
+  depends_on "generate"
+  action {
+    for source in sources:
+      if source.endswith(".c"):
+        run "cc", "-c", source, "-o", "build/" + name + ".o"
+  }
+}
+task "test" {
+  depends_on "compile"
+  action {
+    run "pytest", "-q"
+  }
+}
+task "package" {
+  depends_on "test"
+  action {
+    run "tar", "czf", "build/" + name + ".tar.gz", "build/"
+  }
+}
+"""
+
+
+class Task:
+    sources = ["main.c", "README.md"]
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.actions: List[Callable[..., Any]] = []
+
+    def depends_on(self, name: str) -> None:
+        pass
+
+    def action(self, closure: Callable[..., Any]) -> None:
+        self.actions.append(closure)
+
+    def run(self, *args: str) -> None:
+        pass
+
+
+class Project:
+    def __init__(self) -> None:
+        self.tasks: List[Task] = []
+        self.version = ""
+
+    def task(self, name: str, closure: Callable[[Task], Any]) -> None:
+        task = Task(name)
+        closure(task)
+        self.tasks.append(task)
+
+
+def _run(context: "type[Context]", files: List[Tuple[str, str]]) -> Tuple[float, float, int]:
+    gc.collect()
+    tracemalloc.start()
+    exec_time = call_time = 0.0
+    projects = []
+    for filename, code in files:
+        project = Project()
+        tstart = time.perf_counter()
+        context(ObjectTarget(project)).exec(code, filename)
+        exec_time += time.perf_counter() - tstart
+        tstart = time.perf_counter()
+        for task in project.tasks:
+            for action in task.actions:
+                action(task)
+        call_time += time.perf_counter() - tstart
+        projects.append(project)
+    gc.collect()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return exec_time, call_time, memory
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=500)
+    args = parser.parse_args()
+
+    # The headers have a different number of lines, thus the closures are at different lines in every file.
+    files = [(f"build-{i}.dsl", HEADER.format(i=i) * (i % 7 + 1) + BODY) for i in range(args.files)]
+
+    class LazyContext(Context):
+        OPTIONS = dataclasses.replace(Context.OPTIONS, lazy_closures=True)
+
+    class InternContext(Context):
+        OPTIONS = dataclasses.replace(Context.OPTIONS, lazy_closures=True, intern_closures=True)
+
+    lazy = _run(LazyContext, files)
+    interned = _run(InternContext, files)
+
+    print(f"{args.files} files, {INTERNED_CLOSURES.misses} closures compiled, {INTERNED_CLOSURES.hits} interned")
+    print(f"{'':<18} {'exec':>11} {'closures':>11} {'memory':>12}")
+    for name, (exec_time, call_time, memory) in [("lazy closures", lazy), ("interned closures", interned)]:
+        print(f"{name:<18} {exec_time * 1000:9.1f}ms {call_time * 1000:9.1f}ms {memory / 1024:8.1f} KiB")
+    print(f"first calls of the closures: {lazy[1] / interned[1]:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Times the configuration phase of a build file that defines many tasks whose actions are registered but never
+called, once with every closure compiled up front and once with #TranspileOptions.lazy_closures.
+
+    $ python -m benchmarks.lazy_closures --tasks 500
+"""
+
+import argparse
+import dataclasses
+import time
+from typing import Any, Callable, List
+
+from builddsl import Context
+from builddsl.stats import Stats
+from builddsl.targets import ObjectTarget
+
+TASK = """
+task "task-{i}" {{
+  depends_on "task-{previous}"
+  def output = "build/" + name + ".o"
+  action {{
+    for source in sources:
+      if source.endswith(".c"):
+        run "cc", "-c", source, "-o", output
+      else:
+        print("skipping", source)
+    artifacts.append(output)
+  }}
+  on_failure e -> {{
+    print("task", name, "failed:", e)
+    return False
+  }}
+}}
+"""
+
+
+class Task:
+    sources = ["main.c", "README.md"]
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.artifacts: List[str] = []
+        self.callbacks: List[Callable[..., Any]] = []
+
+    def depends_on(self, name: str) -> None:
+        pass
+
+    def action(self, closure: Callable[..., Any]) -> None:
+        self.callbacks.append(closure)
+
+    def on_failure(self, closure: Callable[..., Any]) -> None:
+        self.callbacks.append(closure)
+
+
+class Project:
+    def __init__(self) -> None:
+        self.tasks: List[Task] = []
+
+    def task(self, name: str, closure: Callable[[Task], Any]) -> None:
+        task = Task(name)
+        self.tasks.append(task)
+        closure(task)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    code = "".join(TASK.format(i=i, previous=max(i - 1, 0)) for i in range(args.tasks))
+    for lazy_closures in (False, True):
+
+        class BenchmarkContext(Context):
+            OPTIONS = dataclasses.replace(Context.OPTIONS, lazy_closures=lazy_closures)
+
+        timings = []
+        for _ in range(args.repeat):
+            stats = Stats()
+            tstart = time.perf_counter()
+            BenchmarkContext(ObjectTarget(Project())).exec(code, "<benchmark>", stats)
+            timings.append((time.perf_counter() - tstart, stats))
+        total, stats = min(timings, key=lambda x: x[0])
+        phases = "  ".join(f"{p.name}={p.duration * 1000:.1f}ms" for p in stats.phases)
+        print(f"lazy_closures={lazy_closures!s:<6} {total * 1000:8.1f}ms  {phases}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Times tokenizing and rewriting files that embed very large string literals, such as inline scripts, templates
+and JSON blobs in triple-quoted strings, long single-line strings with escapes and f-strings with many nested
+replacement fields.
+
+    $ python -m benchmarks.literals --size 1048576
+"""
+
+import argparse
+import time
+from typing import Callable, Dict
+
+from benchmarks.phases import _tokenize
+from builddsl.rewriter import Rewriter
+
+_SCRIPT_LINE = "echo \"building {target}\" && make -C 'src' # not a comment \\\n"
+
+
+def _triple_quoted(size: int) -> str:
+    body = _SCRIPT_LINE * (size // len(_SCRIPT_LINE))
+    return f'task {{\n  script """{body}"""\n}}\n'
+
+
+def _single_quoted(size: int) -> str:
+    return 'blob = "' + '{\\"k\\": 1}, ' * (size // 12) + '"\n'
+
+
+def _fstring(size: int) -> str:
+    return 'message = f"""' + '{values["key"]!r:>{width}}\n' * (size // 27) + '"""\n'
+
+
+GENERATORS: Dict[str, Callable[[int], str]] = {
+    "triple_quoted": _triple_quoted,
+    "single_quoted": _single_quoted,
+    "fstring": _fstring,
+}
+
+
+def _time(func: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        tstart = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - tstart)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=1 << 20, help="The size of every literal in bytes.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for name, generate in GENERATORS.items():
+        code = generate(args.size)
+        tokenize = _time(lambda: _tokenize(code), args.repeat)
+        rewrite = _time(lambda: Rewriter(code, "<benchmark>").rewrite(), args.repeat)
+        print(f"{name} ({len(code)} bytes)")
+        print(f"  tokenize: {tokenize * 1000:8.1f}ms")
+        print(f"  rewrite:  {rewrite * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
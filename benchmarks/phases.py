@@ -0,0 +1,209 @@
+"""
+Times every phase of transpiling and executing a synthetic BuildDSL file separately and writes the results as
+JSON, which can be compared between commits with `python -m benchmarks.compare`.
+
+    $ python -m benchmarks.phases --statements 300 --output before.json
+"""
+
+import argparse
+import ast
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from nr.io.lexer import Tokenizer
+
+from benchmarks.generate import generate
+from builddsl import Context
+from builddsl.ast_utils import DynamicLookupRewriter
+from builddsl.closure import ClosureState
+from builddsl.rewriter import Rewriter, Token, rule_set
+from builddsl.targets import ObjectTarget
+from builddsl.transpiler import ClosureLookupRewriter, ClosureRewriter
+
+T = TypeVar("T")
+
+
+class Project:
+    """A permissive target that accepts all names used by the generated code."""
+
+    offset = 1
+
+    def __init__(self) -> None:
+        self.version = ""
+        self.settings: Any = None
+        self.dependencies: List[str] = []
+        self.callbacks: List[Callable[[int], int]] = []
+        self.children: List[Project] = []
+
+    def depends_on(self, *names: str) -> None:
+        self.dependencies.extend(names)
+
+    def configure(self, name: str, closure: Callable[["Project"], None]) -> None:
+        child = Project()
+        self.children.append(child)
+        closure(child)
+
+
+def _time(func: Callable[[T], Any], setup: Callable[[], T], repeat: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(repeat):
+        arg = setup()
+        tstart = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - tstart)
+    return {"min": min(timings), "median": statistics.median(timings), "mean": statistics.mean(timings)}
+
+
+def _tokenize(code: str) -> int:
+    count = 0
+    tokenizer = Tokenizer(rule_set, code)
+    while tokenizer.current.type != Token.Eof:
+        tokenizer.next()
+        count += 1
+    return count
+
+
+def _parse(code: str, filename: str) -> ast.Module:
+    return ast.parse(code, filename, mode="exec")
+
+
+def _resolution_benchmark(repeat: int, lookups: int) -> Dict[str, Dict[str, float]]:
+    """
+    Times name lookups through a hierarchy of :class:`ClosureState` objects, for names that are resolved in the
+    closure's own target, in the target of a parent closure three levels up, and in the builtins.
+    """
+
+    root = ClosureState(None, None, ObjectTarget(Project()))
+    state = root
+    for _ in range(3):
+        state = ClosureState(ObjectTarget(Project()), sys._getframe(), state)
+    state = ClosureState(ObjectTarget(type("Leaf", (), {"leaf_name": 1})()), None, state)
+
+    results = {}
+    for level, key in (("target", "leaf_name"), ("parent", "offset"), ("builtins", "len")):
+
+        def lookup(_: None, key: str = key) -> None:
+            for _i in range(lookups):
+                state[key]
+
+        results[f"resolve[{level}]"] = _time(lookup, lambda: None, repeat)
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    statements: int,
+    closure_depth: int,
+    dict_depth: int,
+    unparen_ratio: float,
+    repeat: int,
+    lookups: int,
+) -> Dict[str, Any]:
+    filename = "<benchmark>"
+    code = generate(statements, closure_depth, dict_depth, unparen_ratio)
+    options = Context.OPTIONS
+
+    rewrite = Rewriter(code, filename, options.grammar).rewrite()
+    assert options.closure_target is not None
+    closure_target = options.closure_target
+
+    def closure_pass() -> ast.Module:
+        module = ClosureRewriter(filename, options, rewrite.closures).visit(_parse(rewrite.code, filename))
+        return module  # type: ignore[no-any-return]
+
+    def lookup_pass(module: ast.Module) -> ast.Module:
+        rewriter = DynamicLookupRewriter(closure_target, options.pure_builtins, options.local_vardef_prefix)
+        return rewriter.visit(module)  # type: ignore[no-any-return]
+
+    def transpiled() -> ast.Module:
+        return ast.fix_missing_locations(lookup_pass(closure_pass()))
+
+    compiled = compile(transpiled(), filename, "exec")
+
+    def execute(_: None) -> None:
+        exec(compiled, {closure_target: ClosureState(None, None, ObjectTarget(Project()))})
+
+    phases = {
+        "tokenize": _time(_tokenize, lambda: code, repeat),
+        "rewrite": _time(lambda _: Rewriter(code, filename, options.grammar).rewrite(), lambda: None, repeat),
+        "ast.parse": _time(lambda _: _parse(rewrite.code, filename), lambda: None, repeat),
+        "ClosureRewriter": _time(
+            lambda m: ClosureRewriter(filename, options, rewrite.closures).visit(m),
+            lambda: _parse(rewrite.code, filename),
+            repeat,
+        ),
+        "DynamicLookupRewriter": _time(lookup_pass, closure_pass, repeat),
+        "fix_missing_locations": _time(ast.fix_missing_locations, lambda: lookup_pass(closure_pass()), repeat),
+        "ClosureLookupRewriter": _time(
+            lambda m: ClosureLookupRewriter(filename, options, rewrite.closures).visit(m),
+            lambda: _parse(rewrite.code, filename),
+            repeat,
+        ),
+        "compile": _time(lambda m: compile(m, filename, "exec"), transpiled, repeat),
+        "exec": _time(execute, lambda: None, repeat),
+    }
+    phases.update(_resolution_benchmark(repeat, lookups))
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "python": sys.version,
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "params": {
+                "statements": statements,
+                "closure_depth": closure_depth,
+                "dict_depth": dict_depth,
+                "unparen_ratio": unparen_ratio,
+                "repeat": repeat,
+                "lookups": lookups,
+            },
+        },
+        "counts": {
+            "source_bytes": len(code.encode()),
+            "tokens": _tokenize(code),
+            "closures": len(rewrite.closures),
+            "ast_nodes": sum(1 for _ in ast.walk(transpiled())),
+        },
+        "phases": phases,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--statements", type=int, default=300)
+    parser.add_argument("--closure-depth", type=int, default=3)
+    parser.add_argument("--dict-depth", type=int, default=2)
+    parser.add_argument("--unparen-ratio", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--lookups", type=int, default=100_000, help="Name lookups per resolution measurement.")
+    parser.add_argument("-o", "--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    results = run(args.statements, args.closure_depth, args.dict_depth, args.unparen_ratio, args.repeat, args.lookups)
+
+    print(f"{'phase':<24} {'median':>12} {'min':>12}")
+    for name, timing in results["phases"].items():
+        print(f"{name:<24} {timing['median'] * 1000:10.2f}ms {timing['min'] * 1000:10.2f}ms")
+    print(", ".join(f"{k}={v}" for k, v in results["counts"].items()))
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
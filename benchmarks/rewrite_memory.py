@@ -0,0 +1,47 @@
+"""
+Measures the memory that a :class:`builddsl.rewriter.RewriteResult` of a large generated file keeps alive, and
+estimates how much it would be if every closure had a string of its own instead of sharing one source string.
+
+    $ python -m benchmarks.rewrite_memory --statements 300
+"""
+
+import argparse
+import gc
+import sys
+import tracemalloc
+from typing import Any, Callable
+
+from benchmarks.generate import generate
+from builddsl.rewriter import Rewriter
+
+
+def _retained(func: Callable[[], Any]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()  # noqa: F841
+        gc.collect()
+        return tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--statements", type=int, default=300)
+    parser.add_argument("--closure-depth", type=int, default=4)
+    args = parser.parse_args()
+
+    code = generate(statements=args.statements, closure_depth=args.closure_depth)
+    result = Rewriter(code, "<generated>").rewrite()
+    shared = _retained(lambda: Rewriter(code, "<generated>").rewrite())
+    source = next(iter(result.closures.values())).source if result.closures else ""
+    owned = shared - sys.getsizeof(source) + sum(sys.getsizeof(c.text) for c in result.closures.values())
+
+    print(f"{len(code)} bytes of code, {len(result.closures)} closures")
+    print(f"shared source         {shared / 1024:8.1f} KiB")
+    print(f"owned text (estimate) {owned / 1024:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Measures the throughput of :func:`builddsl.exec_concurrently` with a growing number of threads. Throughput only
+scales with the thread count on free-threaded Python builds (e.g. CPython 3.13t); with the GIL enabled, the
+numbers show the overhead of running on a thread pool.
+"""
+
+import argparse
+import sys
+import time
+from typing import Any, Callable, Dict
+
+from builddsl import Context, exec_concurrently
+from builddsl.targets import ObjectTarget
+
+CODE = """
+for i in range(20):
+    task "task-" + str(i) do: {
+        depends_on "compile"
+        outputs = list(map(str.upper, inputs))
+    }
+version = "1.0." + str(len(tasks))
+"""
+
+
+class Project:
+    def __init__(self) -> None:
+        self.tasks: Dict[str, Callable[..., Any]] = {}
+        self.version = "0.0.0"
+
+    def task(self, name: str, *, do: Callable[..., Any]) -> None:
+        self.tasks[name] = do
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=400, help="Number of scripts to execute per measurement.")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if is_gil_enabled else 'disabled'}")
+
+    baseline = None
+    for threads in args.threads:
+        projects = [Project() for _ in range(args.jobs)]
+        tstart = time.perf_counter()
+        exec_concurrently([(Context(ObjectTarget(p)), CODE, "<bench>") for p in projects], max_workers=threads)
+        elapsed = time.perf_counter() - tstart
+        assert all(p.version == "1.0.20" for p in projects)
+        throughput = args.jobs / elapsed
+        baseline = baseline or throughput
+        print(f"  {threads:3d} threads: {throughput:8.1f} scripts/s ({throughput / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Times the :class:`Rewriter` on files that consist mostly of unparenthesized calls with many arguments, which
+is where the rewriter has to decide the most often whether the next token continues the argument list.
+
+Besides the time, the number of tokens extracted by the tokenizer (including tokens that are extracted again
+after backtracking), the number of backtracks and the number of syntax errors raised while speculatively
+parsing ahead are reported.
+"""
+
+import argparse
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from builddsl.rewriter import Rewriter, SyntaxError
+
+_VALUES = ['"value"', "42", "name", "[1, 2, 3]", "(a, b)", '{"k": v}', "x -> x + 1", "obj.attr", "not flag", "-1"]
+
+
+def generate(statements: int, args: int, seed: int = 0) -> str:
+    """
+    Generate a file with *statements* unparenthesized calls with up to *args* arguments each. Half of the
+    arguments are passed as keyword arguments with the colon syntax, and every third call continues its
+    argument list on indented lines.
+    """
+
+    rng = random.Random(seed)
+    lines: List[str] = []
+    for i in range(statements):
+        values = [rng.choice(_VALUES) for _ in range(rng.randint(1, args))]
+        values = [f"key{j}: {v}" if rng.random() < 0.5 else v for j, v in enumerate(values)]
+        # Positional arguments must come first, and the first argument must not start with an opening bracket as
+        # it would be parsed as a subscript or call.
+        values = [f'"{i}"'] + sorted(values, key=lambda v: v.startswith("key"))
+        if i % 3 == 0:
+            lines.append(f"option{i}")
+            lines.extend("  " + v for v in values)
+        else:
+            lines.append(f"option{i} " + ", ".join(values))
+    return "\n".join(lines) + "\n"
+
+
+def _run(code: str, repeat: int) -> Dict[str, Any]:
+    timings = []
+    errors = {"speculative": 0, "reported": 0}
+    for _ in range(repeat):
+        rewriter = Rewriter(code, "<benchmark>")
+        original = rewriter._syntax_error
+
+        def _syntax_error(msg: str, pos: Optional[Any] = None) -> SyntaxError:
+            errors["speculative" if rewriter._speculation_depth else "reported"] += 1
+            return original(msg, pos)
+
+        rewriter._syntax_error = _syntax_error  # type: ignore[method-assign]
+        tstart = time.perf_counter()
+        rewriter.rewrite()
+        timings.append(time.perf_counter() - tstart)
+    return {
+        "time": min(timings),
+        "speculative_errors": errors["speculative"] // repeat,
+        "backtracks": rewriter.backtrack_count,
+        "tokens": rewriter.tokenizer.token_count,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--statements", type=int, default=300)
+    parser.add_argument("--args", type=int, default=8, help="The maximum number of arguments per call.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    code = generate(args.statements, args.args, args.seed)
+    result = _run(code, args.repeat)
+    print(f"{args.statements} unparenthesized calls with up to {args.args} arguments ({len(code)} bytes)")
+    print(f"  rewrite:            {result['time'] * 1000:8.1f}ms")
+    print(f"  tokens:             {result['tokens']:>8}")
+    print(f"  backtracks:         {result['backtracks']:>8}")
+    print(f"  speculative errors: {result['speculative_errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
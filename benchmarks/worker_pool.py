@@ -0,0 +1,90 @@
+"""
+Compares the latency of executing a build script in a cold `python -m builddsl` process with running it as a
+:class:`builddsl.pool.Job` in a warm :class:`builddsl.pool.WorkerPool`.
+
+    $ python -m benchmarks.worker_pool --scripts 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from builddsl.pool import Job, WorkerPool
+
+CODE = """
+for i in range(20):
+    task "task-" + str(i) do: {
+        depends_on "compile"
+        outputs = list(map(str.upper, inputs))
+    }
+version = "1.0." + str(len(tasks))
+"""
+
+
+class Project:
+    def __init__(self) -> None:
+        self.tasks: Dict[str, Callable[..., Any]] = {}
+        self.version = "0.0.0"
+
+    def task(self, name: str, *, do: Callable[..., Any]) -> None:
+        self.tasks[name] = do
+
+    def result(self) -> str:
+        return self.version
+
+
+def _report(name: str, timings: List[float]) -> None:
+    print(
+        f"{name:<12} median={statistics.median(timings) * 1000:8.1f}ms  min={min(timings) * 1000:8.1f}ms  "
+        f"max={max(timings) * 1000:8.1f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scripts", type=int, default=20, help="Number of scripts to execute per measurement.")
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    # The workers and the cold processes cannot import the target from `__main__`.
+    target = "benchmarks.worker_pool:Project"
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), *sys.path, env.get("PYTHONPATH")]))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filenames = []
+        for i in range(args.scripts):
+            filename = os.path.join(tmpdir, f"script-{i}.dsl")
+            with open(filename, "w") as fp:
+                fp.write(CODE)
+            filenames.append(filename)
+
+        cold = []
+        for filename in filenames:
+            tstart = time.perf_counter()
+            subprocess.run([sys.executable, "-m", "builddsl", filename, "-t", target], env=env, check=True)
+            cold.append(time.perf_counter() - tstart)
+
+        warm = []
+        # The `__main__` module, i.e. this one, is preloaded by the forkserver anyway.
+        with WorkerPool(args.workers) as pool:
+            jobs = [Job(filename, target=target, result=target + ".result") for filename in filenames]
+            pool.submit(jobs[0]).get()  # Wait until the workers are started.
+            for job in jobs:
+                tstart = time.perf_counter()
+                result = pool.submit(job).get()
+                warm.append(time.perf_counter() - tstart)
+                assert result.ok and result.value == "1.0.20", result.error
+
+    _report("cold", cold)
+    _report("warm pool", warm)
+    print(f"speedup: {statistics.median(cold) / statistics.median(warm):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 import argparse
+import dataclasses
 import importlib
 import os
 import sys
 
-from builddsl import Context
+from builddsl import Context, daemon
+from builddsl.closure import NameStats
+from builddsl.config_cache import ConfigurationCache
+from builddsl.stats import Stats
 from builddsl.targets import ChainedTarget, ObjectTarget, Target
 
 parser = argparse.ArgumentParser(prog=os.path.basename(sys.executable) + " -m builddsl")
@@ -23,6 +27,87 @@ parser.add_argument(
     action="store_true",
     help="Transpile the input BuildDSL code to Python. Requires the `astor` package which must be installed extra.",
 )
+parser.add_argument(
+    "-O",
+    "--optimize",
+    metavar="LEVEL",
+    type=int,
+    default=0,
+    help="The optimization level for the generated Python code (0, 1 or 2). From level 1, a closure that is defined "
+    "in a loop or function is the same object every time. Level 2 assumes that the target does not shadow Python "
+    "builtins.",
+)
+parser.add_argument(
+    "--optimize-snapshot",
+    action="store_true",
+    help="Let the optimizer assume that lookups have no side effects and that names which are never assigned in "
+    "the code keep their value while a function runs.",
+)
+parser.add_argument(
+    "--prefetch-free-names",
+    action="store_true",
+    help="Resolve all names that a closure uses with a single call when the closure is entered.",
+)
+parser.add_argument(
+    "--lazy-closures",
+    action="store_true",
+    help="Compile the body of a closure only when the closure is first called.",
+)
+parser.add_argument(
+    "--intern-closures",
+    action="store_true",
+    help="Share the compiled code of identical closures between files. Requires --lazy-closures.",
+)
+parser.add_argument(
+    "--fast-path",
+    action="store_true",
+    help="Parse top-level statements that contain no BuildDSL-only syntax as Python without rewriting them.",
+)
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="Print the wall time and counters of every transpile and execution phase to stderr.",
+)
+parser.add_argument(
+    "--profile-names",
+    action="store_true",
+    help="Print how often every name is looked up, assigned or deleted at runtime and where it is resolved to "
+    "stderr.",
+)
+parser.add_argument(
+    "--profile-trace",
+    metavar="FILE",
+    help="Write the wall time of every phase to FILE in the Chrome trace event JSON format. Events from an "
+    "existing FILE are preserved, so the same FILE can be used to trace multiple invocations.",
+)
+parser.add_argument(
+    "--config-cache",
+    metavar="DIR",
+    help="Store the names that the script assigns on the target in DIR and restore them instead of executing the "
+    "script again if the names and files it reads did not change.",
+)
+parser.add_argument(
+    "--daemon",
+    action="store_true",
+    help="Run a daemon that executes the files submitted with --client and keeps their compiled code and the "
+    "imported target entrypoints in memory between runs.",
+)
+parser.add_argument(
+    "--client",
+    action="store_true",
+    help="Execute the file in the daemon instead of the current process. Starts the daemon if it is not running.",
+)
+parser.add_argument(
+    "--daemon-stop",
+    action="store_true",
+    help="Stop the daemon if it is running.",
+)
+parser.add_argument(
+    "--daemon-socket",
+    metavar="PATH",
+    help="The Unix socket of the daemon. Defaults to `builddsl-<uid>.sock` in $XDG_RUNTIME_DIR or the temporary "
+    "directory.",
+)
 
 
 def main() -> None:
@@ -32,6 +117,14 @@ def main() -> None:
         if args.target:
             parser.error("conflicting arguments: -t/--target and -E/--transpile")
 
+    if args.daemon or args.client or args.daemon_stop:
+        if sum((args.daemon, args.client, args.daemon_stop)) > 1:
+            parser.error("conflicting arguments: --daemon, --client and --daemon-stop")
+        if args.transpile or args.profile or args.profile_names or args.profile_trace or args.config_cache:
+            parser.error("-E/--transpile, --config-cache and the --profile options are not supported with the daemon")
+        main_daemon(args)
+        return
+
     if args.file:
         with open(args.file) as fp:
             code = fp.read()
@@ -40,17 +133,72 @@ def main() -> None:
         code = sys.stdin.read()
         filename = "<stdin>"
 
-    if args.transpile:
-        print(Context.transpile(code, filename))
+    class OptimizedContext(Context):
+        OPTIONS = dataclasses.replace(
+            Context.OPTIONS,
+            optimize=args.optimize,
+            optimize_snapshot=args.optimize_snapshot,
+            prefetch_free_names=args.prefetch_free_names,
+            lazy_closures=args.lazy_closures,
+            intern_closures=args.intern_closures,
+            pure_python_fast_path=args.fast_path,
+        )
+
+    stats = Stats() if args.profile or args.profile_trace else None
+    name_stats = NameStats() if args.profile_names else None
+    try:
+        if args.transpile:
+            print(OptimizedContext.transpile(code, filename, stats))
+            return
+
+        if args.target:
+            module_name, _, member = args.target.partition(":")
+            target: Target = ObjectTarget(getattr(importlib.import_module(module_name), member)())
+        else:
+            target = ChainedTarget()  # Intentionally empty
+
+        config_cache = ConfigurationCache(args.config_cache) if args.config_cache else None
+        OptimizedContext(target).exec(code, filename, stats, name_stats, config_cache)
+    finally:
+        if stats is not None and args.profile:
+            print(stats.report(), file=sys.stderr)
+        if stats is not None and args.profile_trace:
+            stats.write_chrome_trace(args.profile_trace)
+        if name_stats is not None:
+            print(name_stats.report(), file=sys.stderr)
+
+
+def main_daemon(args: argparse.Namespace) -> None:
+    if args.daemon:
+        daemon.Daemon(args.daemon_socket).serve_forever()
         return
 
-    if args.target:
-        module_name, member = args.target.partition(":")
-        target: Target = ObjectTarget(getattr(importlib.import_module(module_name), member)())
+    if args.daemon_stop:
+        if daemon.is_running(args.daemon_socket):
+            daemon.submit(daemon.Request("", stop=True), args.daemon_socket)
+        return
+
+    if args.file:
+        request = daemon.Request(args.file)
     else:
-        target = ChainedTarget()  # Intentionally empty
+        request = daemon.Request("<stdin>", sys.stdin.read())
+    request.target = args.target
+    request.cwd = os.getcwd()
+    request.options = {
+        "optimize": args.optimize,
+        "optimize_snapshot": args.optimize_snapshot,
+        "prefetch_free_names": args.prefetch_free_names,
+        "lazy_closures": args.lazy_closures,
+        "intern_closures": args.intern_closures,
+        "pure_python_fast_path": args.fast_path,
+    }
 
-    Context(target).exec(code, filename)
+    if not daemon.is_running(args.daemon_socket):
+        daemon.start(args.daemon_socket)
+    response = daemon.submit(request, args.daemon_socket)
+    sys.stdout.write(response.stdout)
+    sys.stderr.write(response.stderr)
+    sys.exit(response.status)
 
 
 if __name__ == "__main__":
@@ -1,14 +1,29 @@
 """
 The :class:`Context` class is the main entry point for using the BuildDSL package.
+
+Thread safety: transpiling and executing code is safe to do concurrently from multiple threads, including on
+free-threaded Python builds. The transpiler keeps no shared mutable state (the module-level token rule set in
+:mod:`builddsl.rewriter` is never modified after import) and every execution gets its own :class:`ClosureState`
+hierarchy. The targets that are passed to a :class:`Context` are not synchronized by BuildDSL, so code that is
+executed concurrently should operate on separate targets, or the targets must synchronize access themselves.
+Use :func:`exec_concurrently` to run many scripts on a thread pool.
 """
 
+import ast
+import concurrent.futures
+import inspect
+import types
 from pathlib import Path
-from typing import Any, Callable, Dict, Mapping, TextIO, cast
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Mapping, TextIO, Tuple, cast
 
-from builddsl.closure import ClosureState
+from builddsl.closure import ClosureState, LazyClosures, NameStats, TracingClosureState
+from builddsl.stats import Stats, phase
 from builddsl.targets import ObjectTarget, Target
 from builddsl.transpiler import TranspileOptions, transpile_to_ast, transpile_to_source
 
+if TYPE_CHECKING:
+    from builddsl.config_cache import ConfigurationCache
+
 
 class Context:
     """
@@ -21,7 +36,12 @@ class Context:
         closure_arglist_prefix="__closure__,",
     )
 
-    def __init__(self, target: Target, target_factory: Callable[[Any], Target] = ObjectTarget) -> None:
+    def __init__(
+        self,
+        target: Target,
+        target_factory: Callable[[Any], Target] = ObjectTarget,
+        lazy_closures: "LazyClosures | None" = None,
+    ) -> None:
         """
         :param target: The main target for the global scope of the BuildDSL code. Any names references on the
             global scope will be resolved in this target. Frequently a :class:`MutableMappingTarget` is used
@@ -29,27 +49,108 @@ class Context:
         :param target_factory: A factory function that creates a new :class:`Target` for any object that is
             passed as the target of a BuildDSL closure (i.e. its first argument). The default is the
             :class:`ObjectTarget` class which serves as a proxy for the members of an object.
+        :param lazy_closures: The cache for closures that are compiled on their first call if
+            :attr:`TranspileOptions.lazy_closures` is enabled. Pass the same object to contexts that execute the
+            same code repeatedly to compile every closure only once. Defaults to a new cache per execution.
         """
 
         self.target = target
         self.target_factory = target_factory
-
-    def exec(self, code: str, filename: "str | Path" = "<string>") -> None:
+        self.lazy_closures = lazy_closures
+
+    def exec(
+        self,
+        code: "str | types.CodeType",
+        filename: "str | Path" = "<string>",
+        stats: "Stats | None" = None,
+        name_stats: "NameStats | None" = None,
+        config_cache: "ConfigurationCache | None" = None,
+    ) -> None:
         """
         Execute a piece of BuildDSL code.
 
+        :param code: The code to execute, or the code object returned by :meth:`compile` for it.
+        :param filename: The filename of the code. This is used in case errors occur.
+        :param stats: If specified, the wall time and counters of the transpile phases, compilation and
+            execution are recorded in this object.
+        :param name_stats: If specified, every dynamic name lookup and assignment during the execution is
+            recorded in this object (see :class:`TracingClosureState`). This slows down name resolution.
+        :param config_cache: If specified, the effect of the code on the :attr:`target` is restored from this
+            cache instead of executing the code if the inputs of the code did not change since it was last
+            executed, see :mod:`builddsl.config_cache`.
+        """
+
+        if config_cache is not None:
+            config_cache.exec(self, code, filename, stats, name_stats)
+            return
+
+        filename = str(filename)
+        compiled_code = code if isinstance(code, types.CodeType) else self.compile(code, filename, stats)
+        with phase(stats, "exec", filename):
+            exec(compiled_code, self._create_scope(name_stats))
+
+    async def exec_async(
+        self,
+        code: str,
+        filename: "str | Path" = "<string>",
+        stats: "Stats | None" = None,
+        name_stats: "NameStats | None" = None,
+    ) -> None:
+        """
+        Execute a piece of BuildDSL code that may use `await` at the top-level of the script and in closures.
+        Closures whose body awaits are turned into coroutine functions, allowing independent closures to run
+        concurrently on the same event loop (see :meth:`ClosureFunction.call_async`).
+
+        Requires Python 3.8 or newer.
+
         :param code: The code to execute.
         :param filename: The filename of the code. This is used in case errors occur.
+        :param stats: See :meth:`exec`.
+        :param name_stats: See :meth:`exec`.
         """
 
-        module = transpile_to_ast(code, str(filename), self.OPTIONS)
-        scope = {}
+        filename = str(filename)
+        module = transpile_to_ast(code, filename, self.OPTIONS, stats)
+        with phase(stats, "compile", filename):
+            flags = getattr(ast, "PyCF_ALLOW_TOP_LEVEL_AWAIT", 0)
+            compiled_code = compile(module, filename, "exec", flags=flags)
+        with phase(stats, "exec", filename):
+            result = eval(compiled_code, self._create_scope(name_stats))
+            if compiled_code.co_flags & inspect.CO_COROUTINE:
+                await result
+
+    def _create_scope(self, name_stats: "NameStats | None" = None) -> Dict[str, Any]:
         assert self.OPTIONS.closure_target is not None
-        scope[self.OPTIONS.closure_target] = ClosureState(None, None, self.target, self.target_factory)
-        exec(compile(module, str(filename), "exec"), scope)
+        lazy_closures = self.lazy_closures
+        if lazy_closures is None and self.OPTIONS.lazy_closures:
+            lazy_closures = LazyClosures(self.OPTIONS)
+        if name_stats is not None:
+            state: ClosureState = TracingClosureState(
+                None, None, self.target, self.target_factory, name_stats, lazy_closures
+            )
+        else:
+            state = ClosureState(None, None, self.target, self.target_factory, lazy_closures)
+        return {self.OPTIONS.closure_target: state}
 
     @classmethod
-    def transpile(cls, code: str, filename: "str | Path" = "<string>") -> str:
+    def compile(cls, code: str, filename: "str | Path" = "<string>", stats: "Stats | None" = None) -> types.CodeType:
+        """
+        Transpile and compile a piece of BuildDSL code. The returned code object can be passed to :meth:`exec`
+        any number of times.
+
+        :param code: The code to compile.
+        :param filename: The filename of the code. This is used for error messages.
+        :param stats: If specified, the wall time and counters of the transpile phases and compilation are
+            recorded in this object.
+        """
+
+        filename = str(filename)
+        module = transpile_to_ast(code, filename, cls.OPTIONS, stats)
+        with phase(stats, "compile", filename):
+            return compile(module, filename, "exec")
+
+    @classmethod
+    def transpile(cls, code: str, filename: "str | Path" = "<string>", stats: "Stats | None" = None) -> str:
         """
         Transpile a piece of BuildDSL code to Python code.
 
@@ -57,9 +158,30 @@ class Context:
 
         :param code: The code to transpile to pure Python code.
         :param filename: The filename of the code. This is used for error messages.
+        :param stats: If specified, the wall time and counters of the transpile phases are recorded in this object.
         """
 
-        return transpile_to_source(code, str(filename), cls.OPTIONS)
+        return transpile_to_source(code, str(filename), cls.OPTIONS, stats)
+
+
+def exec_concurrently(
+    jobs: Iterable[Tuple[Context, str, "str | Path"]],
+    max_workers: "int | None" = None,
+) -> None:
+    """
+    Executes BuildDSL code for each `(context, code, filename)` tuple in *jobs* on a thread pool. All jobs are
+    run to completion, after which the exception of the first failed job (in the order of *jobs*) is re-raised.
+
+    :param jobs: The contexts and code to execute. Jobs should use separate targets unless the targets are
+        safe for concurrent use.
+    :param max_workers: The maximum number of threads to use. Defaults to the :class:`ThreadPoolExecutor`
+        default.
+    """
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = [executor.submit(context.exec, code, filename) for context, code, filename in jobs]
+    for future in futures:
+        future.result()
 
 
 def execute(
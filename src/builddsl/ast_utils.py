@@ -87,7 +87,11 @@ class DynamicLookupRewriter(ast.NodeTransformer):
         with self._with_locals_from_target(node.target):
             return self.generic_visit(node)
 
-    def visit_FunctionDef(self, node: ast.FunctionDef) -> ast.AST:
+    def visit_AsyncFor(self, node: ast.AsyncFor) -> ast.AST:
+        with self._with_locals_from_target(node.target):
+            return self.generic_visit(node)
+
+    def visit_FunctionDef(self, node: "ast.FunctionDef | ast.AsyncFunctionDef") -> ast.AST:
         self._add_to_locals({node.name})
         names: t.Set[str] = set()
         for arg in node.args.args:
@@ -101,6 +105,9 @@ class DynamicLookupRewriter(ast.NodeTransformer):
         with self._with_locals(names):
             return self.generic_visit(node)
 
+    def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef) -> ast.AST:
+        return self.visit_FunctionDef(node)
+
     def visit_ClassDef(self, node: ast.ClassDef) -> ast.AST:
         self._add_to_locals({node.name})
         return self.generic_visit(node)
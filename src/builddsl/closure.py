@@ -1,16 +1,28 @@
 """
 Helpers for added runtime capabilities of transpiled BuildDSL code, specifically around variable
 name resolution when enabling #TranspileOptions.closure_target.
+
+A :class:`ClosureState` hierarchy is created per execution and per closure invocation, thus closures may be
+invoked from multiple threads concurrently. Name resolution does not synchronize access to the targets.
 """
 
 import builtins
+import collections
+import concurrent.futures
 import enum
+import inspect
+import re
 import sys
+import threading
 import types
 from dataclasses import dataclass
-from typing import Any, Callable
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Tuple
+
+from builddsl.targets import ObjectTarget, Target, _prefetching, lookup_many
+from builddsl.transpiler import ClosureSpan, transpile_closure_span
 
-from builddsl.targets import ObjectTarget, Target
+if TYPE_CHECKING:
+    from builddsl.transpiler import TranspileOptions
 
 # import weakref
 
@@ -21,6 +33,10 @@ class NotSet(enum.Enum):
 
 undefined = NotSet.Value
 
+#: The code of the function of a lazily compiled closure, whether the function ignores extra arguments and
+#: whether it does not use its `__closure__` argument, see :meth:`LazyClosures.compile`.
+CompiledClosure = Tuple[types.CodeType, bool, bool]
+
 
 class ClosureState(Target):
     """
@@ -42,11 +58,11 @@ class ClosureState(Target):
 
     ```py
     @__closure__.subclosure
-    def _closure_1(__closure__, self, *args, **kwargs):
+    def _closure_2(__closure__, self, *args, **kwargs):
         @__closure__.subclosure
-        def _closure_1_closure_2(__closure__, self, *args, **kwargs):
+        def _closure_1(__closure__, self, *args, **kwargs):
             __closure__["depends_on"](__closure__["task"]("a"))
-        __closure__["task"](_closure_1_closure_2)
+        __closure__["task"](_closure_1)
     ```
 
     As you can see, we build a hierarchy of :class:`ClosureState` objects by decorating each function definition
@@ -63,6 +79,8 @@ class ClosureState(Target):
         frame: "types.FrameType | None" = None,
         parent: "Target | None" = None,
         target_factory: Callable[[Any], Target] = ObjectTarget,
+        lazy_closures: "LazyClosures | None" = None,
+        value: Any = undefined,
     ) -> None:
         """
         :param target: The target which is the priority for name resolution. There may be no target if the
@@ -74,12 +92,27 @@ class ClosureState(Target):
             be resolved in the current target or frame.
         :param target_factory: A factory that creates the :class:`Target` for the first argument passed into
             a :class:`ClosureFunction` call (created by :meth:`subclosure`).
+        :param lazy_closures: Compiles the closures defined with :meth:`lazy_definition`. Only needed for the
+            root of the hierarchy, nested states use the object of their parent.
+        :param value: If specified instead of *target*, the target is created from this value with the
+            *target_factory* when a name lookup first reaches it.
         """
 
         self._parent = parent
         self._frame = frame  # weakref.ref(frame) if frame else None  # NOTE (@NiklasRosenstein): Cannot create weakref to frame  # noqa: E501
-        self._target = target
+        if target is not None or value is undefined:
+            self._target = target
+        else:
+            self._value = value
         self._target_factory = target_factory
+        self._lazy_closures = lazy_closures
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called if the attribute does not exist, i.e. when the target from the *value* is first needed.
+        if name == "_target":
+            self._target = self._target_factory(self._value)
+            return self._target
+        raise AttributeError(name)
 
     def __repr__(self) -> str:
         return f"ClosureState(target={self._target!r})"
@@ -91,10 +124,80 @@ class ClosureState(Target):
 
         if frame is None:
             frame = sys._getframe(1)
-        closure = ClosureFunction(self, frame, func)
+        function_type = StatelessClosureFunction if getattr(func, "__stateless__", False) else ClosureFunction
+        closure = function_type(self, frame, func, getattr(func, "__ignore_extra_arguments__", False))
         del frame
         return closure
 
+    def lazy_definition(
+        self,
+        span: ClosureSpan,
+        frame: "types.FrameType | None" = None,
+        enclosing: "Callable[[], Any] | None" = None,
+    ) -> "ClosureFunction":
+        """
+        Defines a closure that is compiled from its *span* when it is first called, see
+        #TranspileOptions.lazy_closures.
+
+        :param enclosing: A function that references the variables of the enclosing Python functions that the
+            closure uses. It is not called, but it makes Python keep the variables in cells of the frame that
+            defines the closure, where :meth:`lookup_enclosing` finds them.
+        """
+
+        if frame is None:
+            frame = sys._getframe(1)
+        closure = LazyClosureFunction(self, frame, _uncompiled, span=span, lazy_closures=self._find_lazy_closures())
+        del frame
+        return closure
+
+    def _find_lazy_closures(self) -> "LazyClosures":
+        state: "Target | None" = self
+        while isinstance(state, ClosureState):
+            if state._lazy_closures is not None:
+                return state._lazy_closures
+            state = state._parent
+        raise RuntimeError("lazy closure definition requires a ClosureState with lazy_closures")
+
+    def lookup_enclosing(self, key: str) -> Any:
+        """
+        Resolves *key* in the local variables of the frames that enclose the definition of the closure, skipping
+        the targets. Closures that are compiled lazily use this for the names of their enclosing scopes, which they
+        would otherwise reference as Python closure variables.
+        """
+
+        state: "Target | None" = self
+        while isinstance(state, ClosureState):
+            frame = state._frame
+            if frame and key in frame.f_locals:
+                return frame.f_locals[key]
+            state = state._parent
+        raise NameError(f"{key!r} is not defined in an enclosing scope")
+
+    @staticmethod
+    def ignore_extra_arguments(func: Callable[..., Any]) -> Callable[..., Any]:
+        """
+        A decorator for a closure function that is applied before :meth:`definition`. Calling the closure
+        passes only as many positional arguments as the function accepts and ignores all keyword arguments. The
+        transpiler uses this for closures without an explicit argument list whose body does not use the
+        variable arguments of the #TranspileOptions.closure_default_arglist, see
+        :class:`builddsl.optimizer.IgnoreUnusedArguments`.
+        """
+
+        func.__ignore_extra_arguments__ = True  # type: ignore[attr-defined]
+        return func
+
+    @staticmethod
+    def stateless(func: Callable[..., Any]) -> Callable[..., Any]:
+        """
+        A decorator for a closure function that is applied before :meth:`definition`. The function does not use
+        its `__closure__` argument, thus the closure is called without creating a :class:`ClosureState` (see
+        :class:`StatelessClosureFunction`). The transpiler uses this for closures that do not resolve any names
+        dynamically, see :class:`builddsl.optimizer.SkipClosureState`.
+        """
+
+        func.__stateless__ = True  # type: ignore[attr-defined]
+        return func
+
     # Target
 
     def get(self) -> Any:
@@ -118,6 +221,49 @@ class ClosureState(Target):
             return getattr(builtins, key)
         raise NameError(f"{key!r} in {self!r}")
 
+    def lookup_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Resolves the *keys* in the same order as :meth:`__getitem__`, but walks the hierarchy only once for all
+        keys. Keys that cannot be resolved are omitted from the result.
+        """
+
+        result: Dict[str, Any] = {}
+        remaining = list(keys)
+        frame = self._frame
+        if frame:
+            f_locals = frame.f_locals
+            for key in remaining:
+                if key in f_locals:
+                    result[key] = f_locals[key]
+            remaining = [key for key in remaining if key not in result]
+        for target in (self._target, self._parent):
+            if target is not None and remaining:
+                result.update(lookup_many(target, remaining))
+                remaining = [key for key in remaining if key not in result]
+        for key in remaining:
+            if hasattr(builtins, key):
+                result[key] = getattr(builtins, key)
+        return result
+
+    def prefetch(self, keys: Tuple[str, ...]) -> Tuple[Any, ...]:
+        """
+        Resolves all *keys* with :meth:`lookup_many` and returns their values in the same order. This is called
+        on entry of a closure that is transpiled with #TranspileOptions.prefetch_free_names.
+
+        :raise NameError: If one of the *keys* cannot be resolved.
+        :raise RuntimeError: If one of the *keys* is provided lazily by a :class:`~builddsl.targets.LazyTarget`.
+        """
+
+        previous, _prefetching.active = getattr(_prefetching, "active", False), True
+        try:
+            values = self.lookup_many(keys)
+        finally:
+            _prefetching.active = previous
+        if len(values) != len(keys):
+            missing = next(key for key in keys if key not in values)
+            raise NameError(f"{missing!r} in {self!r}")
+        return tuple(values[key] for key in keys)
+
     def __setitem__(self, key: str, value: Any) -> None:
         frame = self._frame
         if frame and key in frame.f_locals:
@@ -155,18 +301,555 @@ class ClosureState(Target):
         raise NameError(f"unclear where to delete {key!r}")
 
 
+class _FrameLocals:
+    """
+    Stands in for the frame in which a closure is defined while :meth:`ClosureFunction.map` applies the closure,
+    as reading :attr:`types.FrameType.f_locals` of a function frame copies its local variables every time.
+    """
+
+    __slots__ = ("f_locals",)
+
+    def __init__(self, f_locals: Dict[str, Any]) -> None:
+        self.f_locals = f_locals
+
+
 @dataclass
 class ClosureFunction:
     """
     Represents the function definition of a sub-closure. Calling this object will invoke the wrapped function
     with a new :class:`ClosureState`.
+
+    If the closure body uses `await`, the wrapped function is a coroutine function and calling the closure
+    returns an awaitable. Use :meth:`call_async` to invoke synchronous and asynchronous closures alike from
+    a coroutine, e.g. to run independent closures concurrently with :func:`asyncio.gather`.
     """
 
     parent: ClosureState
     frame: types.FrameType
     func: Callable[..., Any]
 
+    #: Pass only as many positional arguments to the function as it accepts and no keyword arguments, see
+    #: :meth:`ClosureState.ignore_extra_arguments`.
+    ignore_extra_arguments: bool = False
+
     def __call__(self, *args: Any, **kwargs: Any) -> Any:
-        target = self.parent._target_factory(args[0]) if args else None
-        __closure__ = ClosureState(target, self.frame, self.parent, self.parent._target_factory)
+        value = args[0] if args else undefined
+        __closure__ = ClosureState(None, self.frame, self.parent, self.parent._target_factory, value=value)
+        # Passing the single argument directly avoids repacking the arguments in the common case.
+        if len(args) == 1 and not kwargs:
+            return self.func(__closure__, args[0])
+        return self._call_with(__closure__, args, kwargs)
+
+    def _call_with(self, __closure__: "ClosureState | None", args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Any:
+        if self.ignore_extra_arguments:
+            return self.func(__closure__, *args[: self.func.__code__.co_argcount - 1])
         return self.func(__closure__, *args, **kwargs)
+
+    def map(
+        self,
+        objects: Iterable[Any],
+        executor: "concurrent.futures.Executor | None" = None,
+        chunksize: int = 1000,
+    ) -> List[Any]:
+        """
+        Call the closure with every object in *objects* as its only argument and return the results in order.
+        This is faster than calling the closure in a loop, as the setup that is the same for every call is done
+        once per batch. In particular, the local variables of the scope that defines the closure are read once
+        instead of on every name lookup; the closure cannot assign them, but it does not see changes that another
+        thread makes to them while the batch is applied.
+
+        :param executor: If specified, the objects are split into chunks of *chunksize* that are applied
+            concurrently on the executor, e.g. a :class:`~concurrent.futures.ThreadPoolExecutor` for closures
+            that wait for I/O. Closures cannot be sent to other processes. The executor is not shut down.
+        :param chunksize: The number of objects per chunk if an *executor* is given.
+        :raise Exception: The first exception raised by the closure. With an *executor*, chunks that did not
+            start yet are cancelled.
+        """
+
+        objects = list(objects)
+        if executor is None:
+            return self._apply(objects)
+
+        futures = [executor.submit(self._apply, objects[i : i + chunksize]) for i in range(0, len(objects), chunksize)]
+        results: List[Any] = []
+        try:
+            for future in futures:
+                results += future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+        return results
+
+    def _apply(self, objects: List[Any]) -> List[Any]:
+        func, parent = self.func, self.parent
+        frame = _FrameLocals(self.frame.f_locals) if self.frame is not None else None
+        target_factory = parent._target_factory
+        if self.ignore_extra_arguments and func.__code__.co_argcount < 2:
+            return [func(ClosureState(None, frame, parent, target_factory, value=obj)) for obj in objects]
+        return [func(ClosureState(None, frame, parent, target_factory, value=obj), obj) for obj in objects]
+
+    @property
+    def is_async(self) -> bool:
+        """
+        Whether the closure body awaits, i.e. calling the closure returns an awaitable.
+        """
+
+        return inspect.iscoroutinefunction(self.func)
+
+    async def call_async(self, *args: Any, **kwargs: Any) -> Any:
+        """
+        Call the closure and await the result if the closure is asynchronous.
+        """
+
+        result = self(*args, **kwargs)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+
+@dataclass
+class StatelessClosureFunction(ClosureFunction):
+    """
+    A :class:`ClosureFunction` for a function that does not use its `__closure__` argument, see
+    :meth:`ClosureState.stateless`. The function is called with `None` in its place.
+    """
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        if len(args) == 1 and not kwargs:
+            return self.func(None, args[0])
+        return self._call_with(None, args, kwargs)
+
+    def _apply(self, objects: List[Any]) -> List[Any]:
+        func = self.func
+        if self.ignore_extra_arguments and func.__code__.co_argcount < 2:
+            return [func(None) for _ in objects]
+        return [func(None, obj) for obj in objects]
+
+
+def _uncompiled(__closure__: ClosureState, *args: Any, **kwargs: Any) -> Any:
+    raise RuntimeError("LazyClosureFunction was not compiled")
+
+
+@dataclass
+class LazyClosureFunction(ClosureFunction):
+    """
+    A :class:`ClosureFunction` whose function is compiled from the source span of the closure when it is first
+    called, see #TranspileOptions.lazy_closures.
+    """
+
+    span: ClosureSpan = ("", (), ())
+    lazy_closures: "LazyClosures | None" = None
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        if self.func is _uncompiled:
+            self.compile()
+        return super().__call__(*args, **kwargs)
+
+    def map(
+        self,
+        objects: Iterable[Any],
+        executor: "concurrent.futures.Executor | None" = None,
+        chunksize: int = 1000,
+    ) -> List[Any]:
+        self.compile()
+        return super().map(objects, executor, chunksize)
+
+    def compile(self) -> None:
+        """
+        Compile the function of the closure if that did not happen yet.
+        """
+
+        if self.func is _uncompiled:
+            assert self.lazy_closures is not None
+            code, self.ignore_extra_arguments, stateless = self.lazy_closures.compile(self.span)
+            self.func = types.FunctionType(code, self.frame.f_globals, code.co_name)
+            if stateless:
+                self.__class__ = LazyStatelessClosureFunction
+
+    @property
+    def is_async(self) -> bool:
+        self.compile()
+        return super().is_async
+
+
+@dataclass
+class LazyStatelessClosureFunction(LazyClosureFunction, StatelessClosureFunction):
+    """
+    A :class:`LazyClosureFunction` whose compiled function does not use its `__closure__` argument. Compiling a
+    lazy closure changes its class to this if the function is decorated with :meth:`ClosureState.stateless`.
+    """
+
+
+class _DeferredDefinition:
+    """
+    Stands in for the closure target while the function of a lazily compiled closure is created.
+    """
+
+    @staticmethod
+    def definition(func: Callable[..., Any]) -> Callable[..., Any]:
+        return func
+
+    ignore_extra_arguments = staticmethod(ClosureState.ignore_extra_arguments)
+    stateless = staticmethod(ClosureState.stateless)
+
+
+#: The filename of the closures compiled by the :class:`ClosureCodeCache`, replaced when the code is relocated.
+_INTERNED_FILENAME = "<builddsl-interned-closure>"
+_CLOSURE_ID = re.compile(r"\b_closure_\d+\b")
+
+
+class ClosureCodeCache:
+    """
+    Shares the compiled code of identical closures between files and :class:`LazyClosures` objects, see
+    #TranspileOptions.intern_closures. Closures are identical if they have the same code, parameters and
+    enclosing names and are compiled with the same options. The code of a closure is compiled once with a
+    placeholder filename and line numbers relative to the closure, and relocated for every file and line where
+    the closure is defined. Relocated code objects share their bytecode, names and constants with the compiled
+    code. A single object may be shared between threads.
+
+    Requires Python 3.8 or newer (:meth:`types.CodeType.replace`), otherwise every closure is compiled.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self._cache: Dict[Tuple[str, ClosureSpan], CompiledClosure] = {}
+        self._lock = threading.Lock()
+
+    def compile(self, span: ClosureSpan, options: "TranspileOptions") -> CompiledClosure:
+        """
+        Returns the code of the function of the closure in *span* and its flags, like :meth:`LazyClosures.compile`.
+        """
+
+        filename, enclosing_names, records = span
+        if not hasattr(types.CodeType, "replace"):
+            return _compile_closure_span(span, options)
+
+        line_offset = records[0][1] - 1
+        key = (options.fingerprint(), _normalize_span(span, line_offset))
+        with self._lock:
+            result = self._cache.get(key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if result is None:
+            try:
+                result = _compile_closure_span(key[1], options)
+            except SyntaxError as exc:
+                # Locate the error like the code objects, see #_relocate().
+                if exc.filename == _INTERNED_FILENAME:
+                    exc.filename = filename
+                    if exc.lineno is not None:
+                        exc.lineno += line_offset
+                    if getattr(exc, "end_lineno", None) is not None:
+                        exc.end_lineno += line_offset
+                raise
+            with self._lock:
+                result = self._cache.setdefault(key, result)
+        code, ignore_extra_arguments, stateless = result
+        return _relocate(code, filename, line_offset), ignore_extra_arguments, stateless
+
+
+def _normalize_span(span: ClosureSpan, line_offset: int) -> ClosureSpan:
+    """
+    Returns the *span* with the placeholder filename and line numbers relative to *line_offset*. The closure IDs
+    (see :meth:`Rewriter._parse_closure`), which depend on the number of closures before the closure in the same
+    file, are replaced by their position in the span if they are only used to reference the nested closures.
+    The IDs of closures outside of the span are removed from the enclosing names, as the closure cannot use them.
+    """
+
+    _filename, enclosing_names, records = span
+    ids: Dict[str, str] = {}
+    if all(_CLOSURE_ID.findall(record[6]) == list(record[5]) for record in records):
+        ids = {record[0]: f"_closure_{index + 1}" for index, record in enumerate(records)}
+        enclosing_names = tuple(name for name in enclosing_names if not _CLOSURE_ID.fullmatch(name))
+
+    def _rename(match: "re.Match[str]") -> str:
+        return ids[match.group(0)]
+
+    normalized = []
+    for closure_id, line, indent, parameters, is_expr, nested, text in records:
+        if ids:
+            closure_id, nested, text = ids[closure_id], tuple(ids[n] for n in nested), _CLOSURE_ID.sub(_rename, text)
+        normalized.append((closure_id, line - line_offset, indent, parameters, is_expr, nested, text))
+    return (_INTERNED_FILENAME, enclosing_names, tuple(normalized))
+
+
+def _relocate(code: types.CodeType, filename: str, line_offset: int) -> types.CodeType:
+    """
+    Replaces the filename of *code* and of the code objects and closure spans in its constants, and moves their
+    line numbers by *line_offset*.
+    """
+
+    consts = []
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            const = _relocate(const, filename, line_offset)
+        elif isinstance(const, tuple) and len(const) == 3 and const[0] == _INTERNED_FILENAME:
+            # The span of a nested closure, see #ClosureState.lazy_definition().
+            records = tuple((r[0], r[1] + line_offset, *r[2:]) for r in const[2])
+            const = (filename, const[1], records)
+        consts.append(const)
+    return code.replace(  # type: ignore[no-any-return,attr-defined]
+        co_filename=filename, co_firstlineno=code.co_firstlineno + line_offset, co_consts=tuple(consts)
+    )
+
+
+def _compile_closure_span(span: ClosureSpan, options: "TranspileOptions") -> CompiledClosure:
+    assert options.closure_target is not None
+    filename, _enclosing_names, records = span
+    namespace: Dict[str, Any] = {}
+    module = transpile_closure_span(span, options)
+    exec(compile(module, filename, "exec"), {options.closure_target: _DeferredDefinition}, namespace)
+    func = namespace[records[0][0]]
+    return func.__code__, getattr(func, "__ignore_extra_arguments__", False), getattr(func, "__stateless__", False)
+
+
+#: The cache that is used for #TranspileOptions.intern_closures.
+INTERNED_CLOSURES = ClosureCodeCache()
+
+
+class LazyClosures:
+    """
+    Compiles the closures that are defined with :meth:`ClosureState.lazy_definition`. The code is cached per
+    :data:`~builddsl.transpiler.ClosureSpan`, thus a closure that is defined many times, e.g. in a loop, is
+    compiled only once. A single object may be shared between threads.
+
+    With #TranspileOptions.intern_closures, closures that are not in the cache are compiled by the
+    *code_cache*, which defaults to :data:`INTERNED_CLOSURES`.
+    """
+
+    def __init__(self, options: "TranspileOptions", code_cache: "ClosureCodeCache | None" = None) -> None:
+        self.options = options
+        self.code_cache = code_cache or (INTERNED_CLOSURES if options.intern_closures else None)
+        self._cache: Dict[ClosureSpan, CompiledClosure] = {}
+
+    def compile(self, span: ClosureSpan) -> CompiledClosure:
+        """
+        Returns the code of the function of the closure in *span*, whether the function ignores extra
+        arguments (see :meth:`ClosureState.ignore_extra_arguments`) and whether it does not use its
+        `__closure__` argument (see :meth:`ClosureState.stateless`).
+        """
+
+        result = self._cache.get(span)
+        if result is None:
+            result = self._cache.setdefault(span, self._compile(span))
+        return result
+
+    def _compile(self, span: ClosureSpan) -> CompiledClosure:
+        if self.code_cache is not None:
+            return self.code_cache.compile(span, self.options)
+        return _compile_closure_span(span, self.options)
+
+
+class NameStats:
+    """
+    Aggregates how often names are read, assigned and deleted through a :class:`TracingClosureState` hierarchy
+    and at which level they are resolved. The levels are
+
+    * `frame` -- a local variable of the scope in which the closure is defined,
+    * `target` -- the target of the closure itself,
+    * `parent[N]` -- the frame or target of the N-th parent closure, or the target of the :class:`Context`
+      for the outermost level,
+    * `builtins` -- a Python builtin,
+    * `unresolved` -- the name could not be resolved and a :class:`NameError` is raised to the caller.
+
+    In addition, the number of :class:`NameError` raised internally by targets that do not provide a name is
+    counted per name, as these account for most of the cost of resolving names from outer levels.
+
+    A single object may be shared between threads.
+    """
+
+    def __init__(self) -> None:
+        #: Maps `(operation, name, level)` to the number of times it occurred, where the operation is one
+        #: of `get`, `set` or `del`.
+        self.counts: "collections.Counter[Tuple[str, str, str]]" = collections.Counter()
+
+        #: Maps a name to the number of :class:`NameError` that were raised internally while resolving it.
+        self.misses: "collections.Counter[str]" = collections.Counter()
+
+        self._lock = threading.Lock()
+
+    def record(self, operation: str, key: str, level: str, misses: int) -> None:
+        with self._lock:
+            self.counts[(operation, key, level)] += 1
+            if misses:
+                self.misses[key] += misses
+
+    def by_level(self) -> Dict[str, int]:
+        """
+        Returns the number of accesses per resolution level.
+        """
+
+        result: Dict[str, int] = collections.Counter()
+        for (_operation, _key, level), count in self.counts.items():
+            result[level] += count
+        return dict(result)
+
+    def report(self, limit: "int | None" = None) -> str:
+        """
+        Returns a table of the accessed names, ordered by the number of accesses, with the number of accesses per
+        resolution level and the number of internally raised :class:`NameError`.
+
+        :param limit: The maximum number of rows to include.
+        """
+
+        rows: Dict[Tuple[str, str], Dict[str, int]] = {}
+        for (operation, key, level), count in self.counts.items():
+            rows.setdefault((operation, key), {})[level] = count
+        ordered = sorted(rows.items(), key=lambda item: (-sum(item[1].values()), item[0]))[:limit]
+
+        lines = [f"{'name':<24} {'op':<4} {'count':>8} {'misses':>8}  levels"]
+        for (operation, key), levels in ordered:
+            misses = self.misses[key] if operation == "get" else 0
+            detail = ", ".join(f"{level}={count}" for level, count in sorted(levels.items(), key=lambda x: -x[1]))
+            lines.append(f"{key:<24} {operation:<4} {sum(levels.values()):>8} {misses:>8}  {detail}")
+        return "\n".join(lines)
+
+
+class TracingClosureState(ClosureState):
+    """
+    A :class:`ClosureState` that records every name access in a :class:`NameStats` object. Closures defined
+    in its scope create :class:`TracingClosureState` objects for their invocation as well, thus the statistics
+    cover the entire hierarchy. Name resolution is otherwise identical to :class:`ClosureState`, which does not
+    pay for the bookkeeping, so tracing costs nothing unless the tracing state is used as the root of the
+    hierarchy (see the *name_stats* parameter of :meth:`builddsl.Context.exec`).
+    """
+
+    def __init__(
+        self,
+        target: "Target | None" = None,
+        frame: "types.FrameType | None" = None,
+        parent: "Target | None" = None,
+        target_factory: Callable[[Any], Target] = ObjectTarget,
+        name_stats: "NameStats | None" = None,
+        lazy_closures: "LazyClosures | None" = None,
+        value: Any = undefined,
+    ) -> None:
+        super().__init__(target, frame, parent, target_factory, lazy_closures, value)
+        self.name_stats = NameStats() if name_stats is None else name_stats
+
+    def definition(self, func: Callable[..., Any], frame: "types.FrameType | None" = None) -> "ClosureFunction":
+        if frame is None:
+            frame = sys._getframe(1)
+        function_type = StatelessClosureFunction if getattr(func, "__stateless__", False) else TracingClosureFunction
+        closure = function_type(self, frame, func, getattr(func, "__ignore_extra_arguments__", False))
+        del frame
+        return closure
+
+    def lazy_definition(
+        self,
+        span: ClosureSpan,
+        frame: "types.FrameType | None" = None,
+        enclosing: "Callable[[], Any] | None" = None,
+    ) -> "ClosureFunction":
+        if frame is None:
+            frame = sys._getframe(1)
+        lazy_closures = self._find_lazy_closures()
+        closure = LazyTracingClosureFunction(self, frame, _uncompiled, span=span, lazy_closures=lazy_closures)
+        del frame
+        return closure
+
+    def __getitem__(self, key: str) -> Any:
+        misses = 0
+        state: "Target | None" = self
+        depth = 0
+        while isinstance(state, ClosureState):
+            level = f"parent[{depth}]" if depth else None
+            frame = state._frame
+            if frame and key in frame.f_locals:
+                self.name_stats.record("get", key, level or "frame", misses)
+                return frame.f_locals[key]
+            if state._target is not None:
+                try:
+                    value = state._target[key]
+                except NameError:
+                    misses += 1
+                else:
+                    self.name_stats.record("get", key, level or "target", misses)
+                    return value
+            state = state._parent
+            depth += 1
+        if state is not None:
+            try:
+                value = state[key]
+            except NameError:
+                misses += 1
+            else:
+                self.name_stats.record("get", key, f"parent[{depth}]", misses)
+                return value
+        if hasattr(builtins, key):
+            self.name_stats.record("get", key, "builtins", misses)
+            return getattr(builtins, key)
+        self.name_stats.record("get", key, "unresolved", misses)
+        raise NameError(f"{key!r} in {self!r}")
+
+    def lookup_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        # Resolve one by one to record every name.
+        return Target.lookup_many(self, keys)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._modify("set", key, lambda target: target.__setitem__(key, value))
+
+    def __delitem__(self, key: str) -> None:
+        self._modify("del", key, lambda target: target.__delitem__(key))
+
+    def _modify(self, operation: str, key: str, func: Callable[[Target], None]) -> None:
+        verb = "set" if operation == "set" else "delete"
+        misses = 0
+        state: "Target | None" = self
+        depth = 0
+        while isinstance(state, ClosureState):
+            frame = state._frame
+            if frame and key in frame.f_locals:
+                raise RuntimeError(
+                    f"cannot {verb} local variable through context, this should be handled by the transpiler"
+                )
+            if state._target is not None:
+                try:
+                    func(state._target)
+                except NameError:
+                    misses += 1
+                else:
+                    self.name_stats.record(operation, key, f"parent[{depth}]" if depth else "target", misses)
+                    return
+            state = state._parent
+            depth += 1
+        if state is not None:
+            try:
+                func(state)
+            except NameError:
+                misses += 1
+            else:
+                self.name_stats.record(operation, key, f"parent[{depth}]", misses)
+                return
+        self.name_stats.record(operation, key, "unresolved", misses)
+        raise NameError(f"unclear where to {verb} {key!r}")
+
+
+@dataclass
+class TracingClosureFunction(ClosureFunction):
+    """
+    A :class:`ClosureFunction` that invokes the wrapped function with a :class:`TracingClosureState`.
+    """
+
+    parent: TracingClosureState
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        parent = self.parent
+        __closure__ = TracingClosureState(
+            None, self.frame, parent, parent._target_factory, parent.name_stats, value=args[0] if args else undefined
+        )
+        return self._call_with(__closure__, args, kwargs)
+
+    def _apply(self, objects: List[Any]) -> List[Any]:
+        # Every call is traced like a single call.
+        return [self(obj) for obj in objects]
+
+
+@dataclass
+class LazyTracingClosureFunction(LazyClosureFunction, TracingClosureFunction):
+    """
+    A :class:`LazyClosureFunction` that invokes the compiled function with a :class:`TracingClosureState`.
+    """
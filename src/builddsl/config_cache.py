@@ -0,0 +1,447 @@
+"""
+A configuration cache that restores the effect of a script on its target instead of executing it again, for
+scripts that are run repeatedly with the same inputs.
+
+While a script executes with a :class:`ConfigurationCache`, the global target of the :class:`~builddsl.Context`
+is wrapped in a :class:`RecordingTarget`. It records
+
+* every name that the script reads from the target, with a fingerprint of its value, or the fact that the
+  target does not provide the name (the script then resolves it as a builtin),
+* every name that the script assigns or deletes, with the final value,
+* the content hash of every file that is read with :func:`read_file`, the opt-in hook for files that are
+  inputs of the script.
+
+If the script completes, the assigned values are pickled and stored together with the inputs under a key
+derived from the code, the filename and the transpile options. The next execution of the same code checks the
+inputs against the current target and files and, if all of them are unchanged, applies the stored assignments
+and deletions to the target without executing the script.
+
+The cache only stores a run if it can prove that the recorded assignments are the complete effect of the script
+on its target. A run is not stored if the script
+
+* reads a callable or module from the target, except for functions decorated with :func:`pure`, as calling a
+  method of the target may modify it in ways that are not recorded,
+* reads a value from the target that cannot be pickled, thus cannot be fingerprinted,
+* uses a builtin that is callable and not in :data:`PURE_BUILTINS`, e.g. `print()` or `open()`, as its
+  effect is not recorded and it may read inputs that are not tracked,
+* imports a module, with the `import` statement or `__import__()`, as modules give access to inputs like
+  environment variables,
+* modifies a value that it read from the target in place,
+* assigns a value that cannot be pickled, or
+* accesses the underlying object of the target with :meth:`Target.get`.
+
+Inputs that the :func:`pure` functions of the target read other than with :func:`read_file` are not tracked.
+"""
+
+import builtins
+import copy
+import functools
+import hashlib
+import marshal
+import os
+import pickle
+import tempfile
+import threading
+import types
+import typing as t
+from dataclasses import dataclass
+from pathlib import Path
+
+from builddsl.stats import Stats, phase
+from builddsl.targets import Target, lookup_many, undefined
+from builddsl.util import T_Callable
+
+if t.TYPE_CHECKING:
+    from builddsl.api import Context
+    from builddsl.closure import NameStats
+    from builddsl.transpiler import TranspileOptions
+
+#: Bumped when the format of the stored entries changes.
+FORMAT_VERSION = 1
+
+#: The callable builtins that a script may use without making its run uncacheable, because they neither have
+#: side effects nor read inputs other than their arguments. Exception types are always allowed.
+PURE_BUILTINS = frozenset(
+    [
+        "__build_class__",
+        "abs",
+        "all",
+        "any",
+        "ascii",
+        "bin",
+        "bool",
+        "bytearray",
+        "bytes",
+        "callable",
+        "chr",
+        "classmethod",
+        "complex",
+        "dict",
+        "divmod",
+        "enumerate",
+        "filter",
+        "float",
+        "format",
+        "frozenset",
+        "getattr",
+        "hasattr",
+        "hash",
+        "hex",
+        "id",
+        "int",
+        "isinstance",
+        "issubclass",
+        "iter",
+        "len",
+        "list",
+        "map",
+        "max",
+        "memoryview",
+        "min",
+        "next",
+        "object",
+        "oct",
+        "ord",
+        "pow",
+        "property",
+        "range",
+        "repr",
+        "reversed",
+        "round",
+        "set",
+        "slice",
+        "sorted",
+        "staticmethod",
+        "str",
+        "sum",
+        "super",
+        "tuple",
+        "type",
+        "zip",
+    ]
+)
+
+_local = threading.local()
+
+
+def pure(func: T_Callable) -> T_Callable:
+    """
+    A decorator for a function or method of a target that does not modify the target or anything else, and
+    whose return value only depends on its arguments and the files it reads with :func:`read_file`. Scripts that
+    read such a function from the target remain cacheable.
+    """
+
+    func.__builddsl_pure__ = True  # type: ignore[attr-defined]
+    return func
+
+
+def read_file(path: "str | Path", encoding: str = "utf8") -> str:
+    """
+    Read a text file and, if called while a :class:`ConfigurationCache` records a script, add the content hash
+    of the file to the inputs of the script. Use this in scripts and in the :func:`pure` functions of targets
+    to read files that the configuration depends on.
+    """
+
+    path = os.path.abspath(path)
+    recording: "RecordingTarget | None" = getattr(_local, "recording", None)
+    try:
+        with open(path, "rb") as fp:
+            data = fp.read()
+    except FileNotFoundError:
+        if recording is not None:
+            recording.files[path] = None
+        raise
+    if recording is not None:
+        recording.files[path] = hashlib.sha256(data).hexdigest()
+    return data.decode(encoding)
+
+
+def fingerprint(value: t.Any) -> "str | None":
+    """
+    Returns a string that identifies the *value*, or `None` if the value cannot be fingerprinted. Functions
+    decorated with :func:`pure` are identified by their qualified name, other values by the hash of their
+    pickled representation.
+    """
+
+    if getattr(value, "__builddsl_pure__", False):
+        return f"pure:{value.__module__}.{value.__qualname__}"
+    if callable(value) or isinstance(value, types.ModuleType):
+        return None
+    try:
+        data = pickle.dumps(value, protocol=4)
+    except Exception:
+        return None
+    return hashlib.sha256(data).hexdigest()
+
+
+def _is_impure_builtin(name: str, value: t.Any) -> bool:
+    if not callable(value) or name in PURE_BUILTINS:
+        return False
+    return not (isinstance(value, type) and issubclass(value, BaseException))
+
+
+def _impure_builtin_reason(name: str) -> str:
+    if name == "__import__":
+        return "imported a module"
+    return f"used the builtin {name!r}, which may have side effects"
+
+
+def _file_hash(path: str) -> "str | None":
+    try:
+        with open(path, "rb") as fp:
+            return hashlib.sha256(fp.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+class RecordingTarget(Target):
+    """
+    Wraps the global target of a script and records the names that are read, assigned and deleted. Also collects
+    the files read with :func:`read_file` while it is the active recording of the current thread.
+    """
+
+    def __init__(self, target: Target) -> None:
+        self.target = target
+
+        #: Maps the names read from the target before the script assigned them to the fingerprint of their value,
+        #: or to `None` if the target did not provide the name.
+        self.inputs: t.Dict[str, t.Optional[str]] = {}
+
+        #: Maps the absolute path of every file read with :func:`read_file` to the hash of its content, or to
+        #: `None` if the file did not exist.
+        self.files: t.Dict[str, t.Optional[str]] = {}
+
+        #: The final value of every name that the script assigned.
+        self.assigned: t.Dict[str, t.Any] = {}
+
+        #: The names that the script deleted and did not assign again.
+        self.deleted: t.Set[str] = set()
+
+        #: The reason why the run cannot be cached, if any.
+        self.uncacheable: t.Optional[str] = None
+
+        self._input_values: t.Dict[str, t.Any] = {}
+
+    def _record_read(self, key: str, value: t.Any) -> None:
+        if key in self.inputs or key in self.assigned or key in self.deleted:
+            return
+        if value is undefined:
+            self.inputs[key] = None
+            if _is_impure_builtin(key, getattr(builtins, key, None)):
+                self._set_uncacheable(_impure_builtin_reason(key))
+            return
+        value_fingerprint = fingerprint(value)
+        if value_fingerprint is None:
+            self._set_uncacheable(f"read {key!r} of type {type(value).__name__}, which cannot be fingerprinted")
+            return
+        self.inputs[key] = value_fingerprint
+        self._input_values[key] = value
+
+    def _set_uncacheable(self, reason: str) -> None:
+        if self.uncacheable is None:
+            self.uncacheable = reason
+
+    def builtins(self) -> t.Dict[str, t.Any]:
+        """
+        Returns the builtins for the globals of the script, in which the functions that are not in
+        :data:`PURE_BUILTINS` make the run uncacheable when they are called. This covers the `import` statement
+        and builtins that the optimizer binds without a lookup through the target.
+        """
+
+        result = dict(vars(builtins))
+        for name, value in result.items():
+            if _is_impure_builtin(name, value) and not isinstance(value, type):
+                result[name] = self._guard(name, value)
+        return result
+
+    def _guard(self, name: str, func: t.Callable[..., t.Any]) -> t.Callable[..., t.Any]:
+        @functools.wraps(func)
+        def wrapper(*args: t.Any, **kwargs: t.Any) -> t.Any:
+            self._set_uncacheable(_impure_builtin_reason(name))
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    def finish(self) -> None:
+        """
+        Check that the script did not modify the values it read from the target in place. Called after the
+        script completed.
+        """
+
+        for key, value in self._input_values.items():
+            if fingerprint(value) != self.inputs[key]:
+                self._set_uncacheable(f"the value of {key!r} was modified in place")
+
+    def get(self) -> t.Any:
+        self._set_uncacheable("accessed the underlying object of the target")
+        return self.target.get()
+
+    def __getitem__(self, key: str) -> t.Any:
+        try:
+            value = self.target[key]
+        except NameError:
+            self._record_read(key, undefined)
+            raise
+        self._record_read(key, value)
+        return value
+
+    def lookup_many(self, keys: t.Iterable[str]) -> t.Dict[str, t.Any]:
+        keys = list(keys)
+        result = lookup_many(self.target, keys)
+        for key in keys:
+            self._record_read(key, result.get(key, undefined))
+        return result
+
+    def __setitem__(self, key: str, value: t.Any) -> None:
+        self.target[key] = value
+        self.assigned[key] = value
+        self.deleted.discard(key)
+
+    def __delitem__(self, key: str) -> None:
+        del self.target[key]
+        self.assigned.pop(key, None)
+        self.deleted.add(key)
+
+
+@dataclass
+class _Entry:
+    inputs: t.Dict[str, t.Optional[str]]
+    files: t.Dict[str, t.Optional[str]]
+    assigned: bytes
+    deleted: t.List[str]
+
+
+@dataclass
+class CacheResult:
+    """
+    The outcome of :meth:`ConfigurationCache.exec`.
+    """
+
+    #: Whether the stored effect of the script was applied instead of executing it.
+    hit: bool
+
+    #: Whether the run was stored in the cache.
+    stored: bool = False
+
+    #: The reason why the run was not stored, if it was executed and not stored.
+    reason: t.Optional[str] = None
+
+
+class ConfigurationCache:
+    """
+    Stores the effect of scripts on their targets, see the module documentation. Entries are pickled to files in
+    *directory*, or kept in memory if no directory is given. Only the most recent run of every script is kept.
+
+    A single object may be shared between threads.
+    """
+
+    def __init__(self, directory: "str | Path | None" = None) -> None:
+        self.directory = Path(directory) if directory is not None else None
+        self.hits = 0
+        self.misses = 0
+        self._memory: t.Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def exec(
+        self,
+        context: "Context",
+        code: "str | types.CodeType",
+        filename: "str | Path" = "<string>",
+        stats: "Stats | None" = None,
+        name_stats: "NameStats | None" = None,
+    ) -> CacheResult:
+        """
+        Apply the stored effect of *code* to the target of the *context* if its inputs did not change, or execute
+        the code with :meth:`Context.exec` and store its effect if possible.
+        """
+
+        filename = str(filename)
+        key = self._key(code, filename, context.OPTIONS)
+        with phase(stats, "config_cache", filename):
+            entry = self._load(key)
+            if entry is not None and self._is_valid(entry, context.target):
+                assigned: t.Dict[str, t.Any] = pickle.loads(entry.assigned)
+                for name, value in assigned.items():
+                    context.target[name] = value
+                for name in entry.deleted:
+                    del context.target[name]
+                with self._lock:
+                    self.hits += 1
+                return CacheResult(True)
+
+        with self._lock:
+            self.misses += 1
+        recording = RecordingTarget(context.target)
+        recording_context = copy.copy(context)
+        recording_context.target = recording
+        compiled_code = code if isinstance(code, types.CodeType) else context.compile(code, filename, stats)
+        scope = recording_context._create_scope(name_stats)
+        scope["__builtins__"] = recording.builtins()
+        previous, _local.recording = getattr(_local, "recording", None), recording
+        try:
+            with phase(stats, "exec", filename):
+                exec(compiled_code, scope)
+        finally:
+            _local.recording = previous
+
+        recording.finish()
+        if recording.uncacheable is None:
+            try:
+                assigned_data = pickle.dumps(recording.assigned, protocol=4)
+            except Exception as exc:
+                recording.uncacheable = f"an assigned value cannot be pickled: {exc}"
+        if recording.uncacheable is not None:
+            return CacheResult(False, reason=recording.uncacheable)
+
+        entry = _Entry(recording.inputs, recording.files, assigned_data, sorted(recording.deleted))
+        self._store(key, entry)
+        return CacheResult(False, stored=True)
+
+    @staticmethod
+    def _key(code: "str | types.CodeType", filename: str, options: "TranspileOptions") -> str:
+        from builddsl import __version__
+
+        hasher = hashlib.sha256(f"{FORMAT_VERSION}:{__version__}:{filename}\0".encode("utf8"))
+        hasher.update(code.encode("utf8") if isinstance(code, str) else marshal.dumps(code))
+        hasher.update(options.fingerprint().encode("utf8"))
+        return hasher.hexdigest()
+
+    @staticmethod
+    def _is_valid(entry: _Entry, target: Target) -> bool:
+        current = lookup_many(target, entry.inputs)
+        for name, value_fingerprint in entry.inputs.items():
+            value = current.get(name, undefined)
+            if (None if value is undefined else fingerprint(value)) != value_fingerprint:
+                return False
+        return all(_file_hash(path) == file_hash for path, file_hash in entry.files.items())
+
+    def _load(self, key: str) -> "_Entry | None":
+        if self.directory is None:
+            data = self._memory.get(key)
+        else:
+            try:
+                data = (self.directory / f"{key}.pickle").read_bytes()
+            except FileNotFoundError:
+                data = None
+        if data is None:
+            return None
+        try:
+            return t.cast(_Entry, pickle.loads(data))
+        except Exception:
+            return None  # A corrupt entry or one that was written by an incompatible version.
+
+    def _store(self, key: str, entry: _Entry) -> None:
+        data = pickle.dumps(entry, protocol=4)
+        if self.directory is None:
+            with self._lock:
+                self._memory[key] = data
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+            os.replace(tmp, self.directory / f"{key}.pickle")
+        except BaseException:
+            os.unlink(tmp)
+            raise
@@ -0,0 +1,307 @@
+"""
+A resident process that executes BuildDSL scripts on behalf of clients, like the Gradle daemon does for Gradle
+builds. The :class:`Daemon` listens on a Unix socket and keeps the compiled code of every script it executed,
+the closures compiled with :attr:`TranspileOptions.lazy_closures` and the imported target entrypoints in memory
+between requests. A script is only transpiled again when its modification time or size changed *and* the
+SHA-256 hash of its content differs from the cached one.
+
+The daemon runs one request at a time, as the standard streams and the working directory of the process are
+replaced while a script executes. Modules that are imported by scripts or target entrypoints are not reloaded
+when they change; restart the daemon with `--daemon-stop` in that case.
+
+    $ python -m builddsl --client -t mybuild.targets:Project build.dsl
+
+Starts the daemon in the background if it is not already running and executes `build.dsl` in it.
+"""
+
+import contextlib
+import dataclasses
+import hashlib
+import importlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import types
+import typing as t
+from dataclasses import dataclass
+
+from builddsl.api import Context
+from builddsl.closure import LazyClosures
+from builddsl.targets import ChainedTarget, ObjectTarget, Target
+
+
+def default_socket_path() -> str:
+    """
+    Returns the path of the socket that the daemon listens on by default. The path is specific to the current
+    user and located in `$XDG_RUNTIME_DIR` if set, or in the temporary directory otherwise.
+    """
+
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(directory, f"builddsl-{os.getuid()}.sock")
+
+
+@dataclass
+class Request:
+    """
+    A request that a client sends to the :class:`Daemon`.
+    """
+
+    #: The filename of the script. Relative paths are relative to #cwd.
+    filename: str
+
+    #: The code of the script. The code is read from #filename by the daemon if not set.
+    code: t.Optional[str] = None
+
+    #: An entrypoint in the form `module:member` that is called without arguments to create the object that is
+    #: used as the target of the script. If not set, the script has no global target.
+    target: t.Optional[str] = None
+
+    #: Fields of :attr:`Context.OPTIONS` to replace for the script, e.g. `{"optimize": 1}`.
+    options: t.Dict[str, t.Any] = dataclasses.field(default_factory=dict)
+
+    #: The working directory in which the script is executed.
+    cwd: str = "."
+
+    #: If set, the daemon stops after sending the response and all other fields are ignored.
+    stop: bool = False
+
+
+@dataclass
+class Response:
+    """
+    The outcome of a :class:`Request`.
+    """
+
+    #: What the script wrote to `sys.stdout`.
+    stdout: str = ""
+
+    #: What the script wrote to `sys.stderr`, including the traceback if the script failed.
+    stderr: str = ""
+
+    #: The exit status, i.e. `0` on success, `1` if the script raised an exception or the request was invalid,
+    #: or the code passed to :func:`sys.exit`.
+    status: int = 0
+
+
+@dataclass
+class _CachedScript:
+    mtime_ns: int
+    size: int
+    digest: str
+    code: types.CodeType
+    lazy_closures: t.Optional[LazyClosures]
+
+
+class Daemon:
+    """
+    Executes the :class:`Request` objects that are sent to the socket at *socket_path*.
+    """
+
+    def __init__(self, socket_path: t.Optional[str] = None) -> None:
+        self.socket_path = socket_path or default_socket_path()
+        # Keyed by the JSON of #Request.options, as #TranspileOptions is not hashable.
+        self._contexts: t.Dict[str, t.Type[Context]] = {}
+        self._scripts: t.Dict[t.Tuple[str, str], _CachedScript] = {}
+        self._entrypoints: t.Dict[str, t.Callable[[], t.Any]] = {}
+
+    def serve_forever(self) -> None:
+        """
+        Listen on the socket and handle requests until a client sends a request with #Request.stop set. Raises
+        a :class:`RuntimeError` if another daemon is already listening on the socket.
+        """
+
+        if is_running(self.socket_path):
+            raise RuntimeError(f"a daemon is already listening on {self.socket_path!r}")
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.socket_path)
+
+        umask = os.umask(0o077)
+        try:
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(self.socket_path)
+        finally:
+            os.umask(umask)
+
+        try:
+            server.listen()
+            while True:
+                conn, _ = server.accept()
+                with conn:
+                    try:
+                        stop = self._handle(conn)
+                    except OSError:
+                        continue  # The client went away.
+                    except Exception as exc:  # The client sent an invalid request.
+                        response = Response(stderr=f"invalid request: {exc}\n", status=1)
+                        with contextlib.suppress(OSError):
+                            _send_message(conn, dataclasses.asdict(response))
+                        continue
+                if stop:
+                    break
+        finally:
+            server.close()
+            os.unlink(self.socket_path)
+
+    def _handle(self, conn: socket.socket) -> bool:
+        """
+        Receive a request from *conn*, execute it and send the response. Returns whether the daemon should stop.
+        """
+
+        message = _recv_message(conn)
+        if message is None:
+            return False  # A client checking if the daemon is running (see #is_running()).
+        if not isinstance(message, dict):
+            raise TypeError(f"expected a JSON object, got {type(message).__name__}")
+        request = Request(**message)
+        response = Response() if request.stop else self.run(request)
+        _send_message(conn, dataclasses.asdict(response))
+        return request.stop
+
+    def run(self, request: Request) -> Response:
+        """
+        Execute a request in the current process.
+        """
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        status = 0
+        cwd = os.getcwd()
+        try:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                os.chdir(request.cwd)
+                try:
+                    self._exec(request)
+                except SystemExit as exc:
+                    if exc.code is None or isinstance(exc.code, int):
+                        status = exc.code or 0
+                    else:
+                        print(exc.code, file=sys.stderr)
+                        status = 1
+                except BaseException:
+                    traceback.print_exc()
+                    status = 1
+        finally:
+            os.chdir(cwd)
+        return Response(stdout.getvalue(), stderr.getvalue(), status)
+
+    def _exec(self, request: Request) -> None:
+        options_key = json.dumps(request.options, sort_keys=True)
+        context_type = self._contexts.get(options_key)
+        if context_type is None:
+
+            class DaemonContext(Context):
+                OPTIONS = dataclasses.replace(Context.OPTIONS, **request.options)
+
+            context_type = self._contexts[options_key] = DaemonContext
+
+        filename = os.path.abspath(request.filename) if request.code is None else request.filename
+        script = self._load(context_type, (filename, options_key), request.code)
+
+        if request.target:
+            target: Target = ObjectTarget(self._load_entrypoint(request.target)())
+        else:
+            target = ChainedTarget()  # Intentionally empty
+
+        context_type(target, lazy_closures=script.lazy_closures).exec(script.code, filename)
+
+    def _load(self, context_type: t.Type[Context], key: t.Tuple[str, str], code: t.Optional[str]) -> _CachedScript:
+        filename = key[0]
+        script = self._scripts.get(key)
+
+        if code is None:
+            stat = os.stat(filename)
+            if script and (script.mtime_ns, script.size) == (stat.st_mtime_ns, stat.st_size):
+                return script
+            with open(filename, "rb") as fp:
+                data = fp.read()
+            mtime_ns, size = stat.st_mtime_ns, stat.st_size
+        else:
+            data = code.encode("utf8")
+            mtime_ns, size = 0, len(data)
+
+        digest = hashlib.sha256(data).hexdigest()
+        if script and script.digest == digest:
+            script.mtime_ns, script.size = mtime_ns, size
+            return script
+
+        compiled_code = context_type.compile(data.decode("utf8"), filename)
+        lazy_closures = LazyClosures(context_type.OPTIONS) if context_type.OPTIONS.lazy_closures else None
+        script = self._scripts[key] = _CachedScript(mtime_ns, size, digest, compiled_code, lazy_closures)
+        return script
+
+    def _load_entrypoint(self, entrypoint: str) -> t.Callable[[], t.Any]:
+        factory = self._entrypoints.get(entrypoint)
+        if factory is None:
+            module_name, _, member = entrypoint.partition(":")
+            factory = importlib.import_module(module_name)
+            for name in member.split("."):
+                factory = getattr(factory, name)
+            self._entrypoints[entrypoint] = factory
+        return factory
+
+
+def _send_message(conn: socket.socket, message: t.Dict[str, t.Any]) -> None:
+    conn.sendall(json.dumps(message).encode("utf8") + b"\n")
+
+
+def _recv_message(conn: socket.socket) -> t.Optional[t.Dict[str, t.Any]]:
+    with conn.makefile("rb") as fp:
+        line = fp.readline()
+    if not line:
+        return None
+    return t.cast(t.Dict[str, t.Any], json.loads(line))
+
+
+def is_running(socket_path: t.Optional[str] = None) -> bool:
+    """
+    Returns `True` if a daemon is listening on *socket_path*.
+    """
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        try:
+            conn.connect(socket_path or default_socket_path())
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+    return True
+
+
+def start(socket_path: t.Optional[str] = None, timeout: float = 10.0) -> None:
+    """
+    Start a daemon in a background process that listens on *socket_path* and wait until it accepts connections.
+    Raises a :class:`TimeoutError` if the daemon is not ready within *timeout* seconds.
+    """
+
+    socket_path = socket_path or default_socket_path()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "builddsl", "--daemon", "--daemon-socket", socket_path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + timeout
+    while not is_running(socket_path):
+        if process.poll() is not None:
+            raise RuntimeError(f"the daemon exited with status {process.returncode}")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"the daemon did not start listening on {socket_path!r} within {timeout}s")
+        time.sleep(0.02)
+
+
+def submit(request: Request, socket_path: t.Optional[str] = None) -> Response:
+    """
+    Send a request to the daemon listening on *socket_path* and wait for the response.
+    """
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path or default_socket_path())
+        _send_message(conn, dataclasses.asdict(request))
+        message = _recv_message(conn)
+    if message is None:
+        raise ConnectionError("the daemon closed the connection without a response")
+    return Response(**message)
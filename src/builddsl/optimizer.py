@@ -0,0 +1,854 @@
+"""
+Optimization passes for the Python code that is generated by the transpiler.
+
+If #TranspileOptions.closure_target is set, every name that is not a local variable is translated to a dynamic
+lookup like `__closure__['name']`. Every evaluation of a lookup walks the :class:`~builddsl.closure.ClosureState`
+hierarchy. The passes in this module reduce the number of lookups and their cost. They are run by
+:func:`optimize` after closures were injected, depending on #TranspileOptions.optimize:
+
+* `1` -- passes that do not change the results of the code: :class:`IgnoreUnusedArguments`,
+  :class:`HoistClosures`, :class:`BindGetitem` and :class:`SkipClosureState`. The only observable difference
+  is the identity of closures: a closure that is defined in a loop or function is the same object every time
+  its definition is reached (see :class:`HoistClosures`).
+* `2` -- additionally :class:`BindBuiltins`, which assumes that targets do not provide names that shadow the
+  Python builtins.
+
+Without #TranspileOptions.optimize_snapshot, every lookup is evaluated, as a lookup may itself run user code
+(e.g. a property of an :class:`~builddsl.targets.ObjectTarget` or the provider of a
+:class:`~builddsl.targets.LazyTarget`). With the option enabled, lookups are assumed to have no side effects
+and names that are never assigned or deleted in the code are assumed to keep their value for the duration of
+one invocation of the function they are looked up in (or the execution of the module). This enables
+:class:`CommonLookups` and :class:`LoopInvariantLookups`.
+
+Independent of the optimization level, #TranspileOptions.prefetch_free_names enables
+:class:`PrefetchFreeNames`.
+
+Values of lookups are stored in local variables named `__lookup_<name>__`. Except for
+:class:`PrefetchFreeNames`, the passes require Python 3.8 or newer and are skipped on older versions.
+"""
+
+import ast
+import builtins
+import sys
+import typing as t
+
+if t.TYPE_CHECKING:
+    from builddsl.transpiler import TranspileOptions
+
+#: Nodes that open a new scope. Their bodies are not optimized as part of the enclosing scope.
+_SCOPE_TYPES = (
+    ast.FunctionDef,
+    ast.AsyncFunctionDef,
+    ast.ClassDef,
+    ast.Lambda,
+    ast.ListComp,
+    ast.SetComp,
+    ast.DictComp,
+    ast.GeneratorExp,
+)
+
+#: Nodes whose evaluation may run user code after their children have been evaluated.
+_BARRIER_TYPES = (
+    ast.Call,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.Attribute,
+    ast.Subscript,
+    ast.Await,
+    ast.Yield,
+    ast.YieldFrom,
+    ast.FormattedValue,
+    ast.Starred,
+    ast.Set,
+    ast.Dict,
+    ast.ListComp,
+    ast.SetComp,
+    ast.DictComp,
+    ast.GeneratorExp,
+)
+
+_LOOP_TYPES = (ast.For, ast.AsyncFor, ast.While)
+
+#: Nodes that make it impractical to determine the free variables of a scope.
+_OPAQUE_TYPES: t.Tuple[t.Type[ast.AST], ...] = (ast.Global, ast.Nonlocal, ast.ClassDef)
+if sys.version_info >= (3, 10):
+    _OPAQUE_TYPES += (ast.Match,)
+
+#: Names that give access to the local variables of a function.
+_INTROSPECTION_NAMES = frozenset(["dir", "eval", "exec", "locals", "vars"])
+
+
+class OptimizationPass:
+    """
+    Base class for optimization passes. A pass is instantiated for every module that is optimized.
+    """
+
+    #: The lowest value of #TranspileOptions.optimize at which the pass runs.
+    level: t.ClassVar[int] = 1
+
+    #: Whether the pass only runs if #TranspileOptions.optimize_snapshot is enabled.
+    requires_snapshot: t.ClassVar[bool] = False
+
+    def __init__(self, options: "TranspileOptions") -> None:
+        assert options.closure_target is not None
+        self.options = options
+        self.target = options.closure_target
+
+    @classmethod
+    def enabled(cls, options: "TranspileOptions") -> bool:
+        """
+        Returns whether the pass runs with the given *options*.
+        """
+
+        if options.optimize < cls.level or sys.version_info < (3, 8):
+            return False
+        return options.optimize_snapshot or not cls.requires_snapshot
+
+    def run(self, module: ast.Module) -> ast.Module:
+        raise NotImplementedError(f"{type(self).__name__}.run() is not implemented")
+
+    def lookup_key(self, node: ast.AST) -> t.Optional[str]:
+        """
+        Returns the name if *node* is a dynamic lookup through the closure target, in any context.
+        """
+
+        if not isinstance(node, ast.Subscript) or not isinstance(node.value, ast.Name):
+            return None
+        if node.value.id != self.target:
+            return None
+        key = node.slice
+        if sys.version_info[:2] <= (3, 8) and isinstance(key, ast.Index):
+            key = key.value  # type: ignore[attr-defined]
+        if isinstance(key, ast.Constant) and isinstance(key.value, str):
+            return key.value
+        return None
+
+    def is_closure(self, node: ast.AST) -> bool:
+        """
+        Returns whether *node* is the function definition of a closure, which receives the closure target as its
+        first argument.
+        """
+
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            return False
+        args = node.args.args
+        return bool(args) and args[0].arg == self.target
+
+    def is_definition(self, func: t.Union[ast.FunctionDef, ast.AsyncFunctionDef]) -> bool:
+        """
+        Returns whether the closure *func* is decorated with :meth:`~builddsl.closure.ClosureState.definition`.
+        """
+
+        return any(
+            isinstance(decorator, ast.Attribute)
+            and decorator.attr == "definition"
+            and isinstance(decorator.value, ast.Name)
+            and decorator.value.id == self.target
+            for decorator in func.decorator_list
+        )
+
+    def assigned_keys(self, module: ast.Module) -> t.Set[str]:
+        """
+        Returns the names that are assigned or deleted through the closure target anywhere in *module*.
+        """
+
+        keys = set()
+        for node in ast.walk(module):
+            if isinstance(node, ast.Subscript) and not isinstance(node.ctx, ast.Load):
+                key = self.lookup_key(node)
+                if key is not None:
+                    keys.add(key)
+        return keys
+
+    def lookups(self, nodes: t.Iterable[ast.AST], cached: bool = True) -> t.Iterator[ast.Subscript]:
+        """
+        Yields the dynamic lookups that load a name in *nodes* and their children in source order, but not in
+        nested scopes.
+
+        :param cached: Whether to include lookups whose value is already stored by an optimization pass.
+        """
+
+        stack = list(nodes)[::-1]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Load) and self.lookup_key(node):
+                yield node
+            elif not cached and isinstance(node, ast.NamedExpr) and _is_cache(node.target):
+                continue
+            elif not isinstance(node, _SCOPE_TYPES):
+                stack.extend(list(ast.iter_child_nodes(node))[::-1])
+
+
+def _scopes(module: ast.Module) -> t.Iterator[t.List[ast.stmt]]:
+    """
+    Yields the body of the module and of every function in it. Class bodies are skipped, as names assigned
+    there become class attributes.
+    """
+
+    yield module.body
+    for node in ast.walk(module):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            yield node.body
+
+
+def _nested_bodies(stmt: ast.stmt) -> t.Iterator[t.List[ast.stmt]]:
+    """
+    Yields the statement lists nested in *stmt* that belong to the same scope.
+    """
+
+    if isinstance(stmt, _SCOPE_TYPES):
+        return
+    for field in ("body", "orelse", "finalbody"):
+        nested = getattr(stmt, field, None)
+        if nested:
+            yield nested
+    for handler in [*getattr(stmt, "handlers", ()), *getattr(stmt, "cases", ())]:
+        yield handler.body
+
+
+def _body_start(body: t.List[ast.stmt]) -> int:
+    """
+    Returns the index in *body* after the docstring and `from __future__` imports.
+    """
+
+    index = 0
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant):
+        index = 1
+    while index < len(body):
+        stmt = body[index]
+        if not isinstance(stmt, ast.ImportFrom) or stmt.module != "__future__":
+            break
+        index += 1
+    return index
+
+
+def _located(node: "ast.AST", location: ast.AST) -> t.Any:
+    """
+    Copies the location of *location* to *node* and its children that have no location yet.
+    """
+
+    for child in ast.walk(node):
+        if "lineno" in child._attributes and not hasattr(child, "lineno"):
+            ast.copy_location(child, location)
+    return node
+
+
+def _cache_name(key: str) -> str:
+    return f"__lookup_{key}__"
+
+
+def _is_cache(node: ast.AST) -> bool:
+    return isinstance(node, ast.Name) and node.id.startswith("__lookup_") and node.id.endswith("__")
+
+
+def _init_cache(key: str, location: ast.AST) -> ast.stmt:
+    """
+    Returns the statement `__lookup_<key>__ = ...` that marks the cache for *key* as empty.
+    """
+
+    return t.cast(
+        ast.stmt,
+        _located(
+            ast.Assign(targets=[ast.Name(id=_cache_name(key), ctx=ast.Store())], value=ast.Constant(...)), location
+        ),
+    )
+
+
+def _cached_lookup(key: str, lookup: ast.Subscript) -> ast.expr:
+    """
+    Returns the expression `__lookup_<key>__ if __lookup_<key>__ is not ... else (__lookup_<key>__ := lookup)`,
+    which evaluates the *lookup* only if the cache is empty.
+    """
+
+    name = _cache_name(key)
+    return t.cast(
+        ast.expr,
+        _located(
+            ast.IfExp(
+                test=ast.Compare(
+                    left=ast.Name(id=name, ctx=ast.Load()), ops=[ast.IsNot()], comparators=[ast.Constant(...)]
+                ),
+                body=ast.Name(id=name, ctx=ast.Load()),
+                orelse=ast.NamedExpr(target=ast.Name(id=name, ctx=ast.Store()), value=lookup),
+            ),
+            lookup,
+        ),
+    )
+
+
+class _Replace(ast.NodeTransformer):
+    """
+    Replaces nodes by identity.
+    """
+
+    def __init__(self, replacements: t.Dict[ast.AST, ast.AST]) -> None:
+        self.replacements = replacements
+
+    def visit(self, node: ast.AST) -> t.Any:
+        replacement = self.replacements.get(node)
+        if replacement is not None:
+            # The replacement may contain the replaced node, e.g. in the value of an assignment expression.
+            return replacement
+        return self.generic_visit(node)
+
+
+class LoopInvariantLookups(OptimizationPass):
+    """
+    Evaluates lookups of names that are never assigned in the code at most once per entry into a loop. Only
+    runs with #TranspileOptions.optimize_snapshot, as every iteration of a loop may run user code.
+    """
+
+    requires_snapshot = True
+
+    def run(self, module: ast.Module) -> ast.Module:
+        assigned = self.assigned_keys(module)
+        for body in _scopes(module):
+            self._optimize_body(body, assigned)
+        return module
+
+    def _optimize_body(self, body: t.List[ast.stmt], assigned: t.Set[str]) -> None:
+        index = 0
+        while index < len(body):
+            stmt = body[index]
+            if isinstance(stmt, _LOOP_TYPES):
+                num_inits = self._optimize_loop(body, index, assigned)
+                index += num_inits
+            else:
+                for nested in _nested_bodies(stmt):
+                    self._optimize_body(nested, assigned)
+            index += 1
+
+    def _optimize_loop(self, body: t.List[ast.stmt], index: int, assigned: t.Set[str]) -> int:
+        loop = t.cast(t.Union[ast.For, ast.AsyncFor, ast.While], body[index])
+        # The iterable of a for loop is evaluated only once, before the loop.
+        parts: t.List[ast.AST] = [loop.test] if isinstance(loop, ast.While) else []
+        parts += loop.body
+        replacements: t.Dict[ast.AST, ast.AST] = {}
+        keys: t.Dict[str, None] = {}
+        for lookup in self.lookups(parts, cached=False):
+            key = self.lookup_key(lookup)
+            assert key is not None
+            if key not in assigned:
+                replacements[lookup] = _cached_lookup(key, lookup)
+                keys[key] = None
+        if not replacements:
+            return 0
+        _Replace(replacements).visit(loop)
+        body[index:index] = [_init_cache(key, loop) for key in keys]
+        return len(keys)
+
+
+class CommonLookups(OptimizationPass):
+    """
+    Looks up names that are never assigned in the code and that are looked up more than once in a function at
+    most once per invocation of the function. The value of a lookup of any other name is reused for later
+    lookups of the same name in the same statement if nothing that could run user code is evaluated in between.
+
+    Only runs with #TranspileOptions.optimize_snapshot, as a lookup may itself run user code that changes the
+    value of the next lookup, e.g. a property that returns a new value every time it is read.
+    """
+
+    requires_snapshot = True
+
+    def run(self, module: ast.Module) -> ast.Module:
+        assigned = self.assigned_keys(module)
+        for body in _scopes(module):
+            self._optimize_scope(body, assigned)
+            for stmt in self._statements(body):
+                self._optimize_statement(stmt, assigned)
+        return module
+
+    def _optimize_scope(self, body: t.List[ast.stmt], assigned: t.Set[str]) -> None:
+        occurrences: t.Dict[str, t.List[ast.Subscript]] = {}
+        for lookup in self.lookups(body, cached=False):
+            key = self.lookup_key(lookup)
+            assert key is not None
+            if key not in assigned:
+                occurrences.setdefault(key, []).append(lookup)
+
+        replacements: t.Dict[ast.AST, ast.AST] = {}
+        keys = []
+        for key, lookups in occurrences.items():
+            if len(lookups) > 1:
+                keys.append(key)
+                replacements.update((lookup, _cached_lookup(key, lookup)) for lookup in lookups)
+        if not replacements:
+            return
+
+        _Replace(replacements).visit(ast.Module(body=body, type_ignores=[]))
+        index = _body_start(body)
+        body[index:index] = [_init_cache(key, body[min(index, len(body) - 1)]) for key in keys]
+
+    def _statements(self, body: t.List[ast.stmt]) -> t.Iterator[ast.stmt]:
+        for stmt in body:
+            yield stmt
+            for nested in _nested_bodies(stmt):
+                yield from self._statements(nested)
+
+    def _optimize_statement(self, stmt: ast.stmt, keys: t.Set[str]) -> None:
+        # The expressions of the statement that are evaluated in this order, not including nested statements.
+        roots: t.List[ast.expr]
+        if isinstance(stmt, (ast.Expr, ast.Return, ast.Assign, ast.AugAssign)) and stmt.value is not None:
+            roots = [stmt.value]
+        elif isinstance(stmt, (ast.If, ast.While)):
+            roots = [stmt.test]
+        elif isinstance(stmt, (ast.For, ast.AsyncFor)):
+            roots = [stmt.iter]
+        else:
+            return
+
+        scanner = _ReuseScanner(self, keys)
+        for root in roots:
+            scanner.scan(root, False)
+        if not scanner.reuses:
+            return
+
+        replacements: t.Dict[ast.AST, ast.AST] = {}
+        for first, later in scanner.reuses.items():
+            key = self.lookup_key(first)
+            assert key is not None
+            name = _cache_name(key)
+            replacements[first] = _located(ast.NamedExpr(target=ast.Name(id=name, ctx=ast.Store()), value=first), first)
+            for lookup in later:
+                replacements[lookup] = _located(ast.Name(id=name, ctx=ast.Load()), lookup)
+        _Replace(replacements).visit(stmt)
+
+
+class _ReuseScanner:
+    """
+    Visits an expression in evaluation order to find lookups of the *keys* whose value can be reused for later
+    lookups of the same name because nothing that could run user code is evaluated in between.
+    """
+
+    def __init__(self, optimizer: OptimizationPass, keys: t.Set[str]) -> None:
+        self.optimizer = optimizer
+        self.keys = keys
+
+        #: Lookups that were evaluated unconditionally since the last barrier, by name.
+        self.available: t.Dict[str, ast.Subscript] = {}
+
+        #: Maps the first lookup to the later lookups that can reuse its value.
+        self.reuses: t.Dict[ast.Subscript, t.List[ast.Subscript]] = {}
+
+    def scan(self, node: ast.AST, conditional: bool) -> None:
+        """
+        :param conditional: Whether the *node* is not always evaluated, in which case its lookups may reuse
+            values but their values are not available to later lookups.
+        """
+
+        key = self.optimizer.lookup_key(node)
+        if key is not None and isinstance(node.ctx, ast.Load):  # type: ignore[attr-defined]
+            if key not in self.keys:
+                return
+            first = self.available.get(key)
+            if first is not None:
+                self.reuses.setdefault(first, []).append(t.cast(ast.Subscript, node))
+            elif not conditional:
+                self.available[key] = t.cast(ast.Subscript, node)
+            return
+
+        if isinstance(node, _SCOPE_TYPES):
+            if isinstance(node, _BARRIER_TYPES):
+                self.available.clear()
+        elif isinstance(node, ast.BoolOp):
+            self.scan(node.values[0], conditional)
+            for value in node.values[1:]:
+                self.available.clear()
+                self.scan(value, True)
+        elif isinstance(node, ast.IfExp):
+            self.scan(node.test, conditional)
+            self.available.clear()
+            self.scan(node.body, True)
+            self.scan(node.orelse, True)
+        elif isinstance(node, ast.Compare):
+            self.scan(node.left, conditional)
+            for index, comparator in enumerate(node.comparators):
+                self.scan(comparator, conditional or index > 0)
+                self.available.clear()
+        elif isinstance(node, ast.Dict):
+            for key_node, value in zip(node.keys, node.values):
+                if key_node is not None:
+                    self.scan(key_node, conditional)
+                self.scan(value, conditional)
+            self.available.clear()
+        else:
+            for child in ast.iter_child_nodes(node):
+                self.scan(child, conditional)
+            if isinstance(node, _BARRIER_TYPES):
+                self.available.clear()
+
+
+class BindGetitem(OptimizationPass):
+    """
+    Binds the `__getitem__()` method of the closure target to a local variable at the start of every function
+    that contains more than one lookup, and calls it instead of subscripting the closure target.
+
+    This only runs on Python 3.10 and older. Since Python 3.11, the interpreter specializes subscripting objects
+    with a Python `__getitem__()` method, which is faster than calling the bound method.
+    """
+
+    def run(self, module: ast.Module) -> ast.Module:
+        if sys.version_info >= (3, 11):
+            return module
+        name = f"__{self.target.strip('_')}_getitem__"
+        for body in _scopes(module):
+            lookups = list(self.lookups(body))
+            if len(lookups) < 2:
+                continue
+            replacements: t.Dict[ast.AST, ast.AST] = {}
+            for lookup in lookups:
+                key = self.lookup_key(lookup)
+                call = ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=[ast.Constant(key)], keywords=[])
+                replacements[lookup] = _located(call, lookup)
+            _Replace(replacements).visit(ast.Module(body=body, type_ignores=[]))
+            index = _body_start(body)
+            bind = ast.Assign(
+                targets=[ast.Name(id=name, ctx=ast.Store())],
+                value=ast.Attribute(value=ast.Name(id=self.target, ctx=ast.Load()), attr="__getitem__", ctx=ast.Load()),
+            )
+            body.insert(index, _located(bind, body[min(index, len(body) - 1)]))
+        return module
+
+
+class IgnoreUnusedArguments(OptimizationPass):
+    """
+    Removes the variable arguments of the #TranspileOptions.closure_default_arglist (`*arguments, **kwarguments`)
+    from closures without an explicit argument list if the closure does not use them, which saves packing them
+    on every call. The closure is decorated with :meth:`~builddsl.closure.ClosureState.ignore_extra_arguments`
+    so that arguments which are passed in their place are still accepted. Only closures that are defined with
+    :meth:`~builddsl.closure.ClosureState.definition` are changed.
+    """
+
+    def run(self, module: ast.Module) -> ast.Module:
+        arglist = self.options.closure_arglist_prefix + self.options.closure_default_arglist
+        default = t.cast(ast.FunctionDef, ast.parse(f"def _({arglist}): pass").body[0]).args
+        if not (default.vararg or default.kwarg) or default.kwonlyargs:
+            return module
+        expected = ast.dump(default)
+        for node in ast.walk(module):
+            if self.is_closure(node) and ast.dump(t.cast(ast.FunctionDef, node).args) == expected:
+                self._ignore_unused_arguments(t.cast(ast.FunctionDef, node))
+        return module
+
+    def _ignore_unused_arguments(self, func: t.Union[ast.FunctionDef, ast.AsyncFunctionDef]) -> None:
+        if not self.is_definition(func):
+            return
+        names = {arg.arg for arg in (func.args.vararg, func.args.kwarg) if arg} | _INTROSPECTION_NAMES
+        for stmt in func.body:
+            for node in ast.walk(stmt):
+                if isinstance(node, ast.Name) and node.id in names or self.lookup_key(node) in names:
+                    return
+        func.args.vararg = None
+        func.args.kwarg = None
+        decorator = ast.Attribute(
+            value=ast.Name(id=self.target, ctx=ast.Load()), attr="ignore_extra_arguments", ctx=ast.Load()
+        )
+        func.decorator_list.append(_located(decorator, func))
+
+
+class HoistClosures(OptimizationPass):
+    """
+    Moves closure definitions out of loops and functions, so that the function is defined and decorated once
+    instead of every time the loop body or function runs. Closures defined in a loop are thus the same object
+    in every iteration.
+
+    A closure is moved in front of the outermost loop that contains it in the same function if evaluating its
+    definition only depends on the closure target, i.e. if its decorators are attributes of the closure target
+    (as with the #TranspileOptions.closure_def_prefix of :class:`builddsl.Context`) and its default arguments
+    are constants. As the names used in the closure are resolved when it is called, it does not matter whether
+    it reads variables that are assigned in the loop.
+
+    A closure is moved to the module level if in addition it does not use the closure target, thus it does not
+    resolve any names through the closure hierarchy, and does not use local variables of the functions that
+    contain it.
+    """
+
+    def run(self, module: ast.Module) -> ast.Module:
+        hoisted: t.List[t.Tuple[ast.stmt, ast.stmt]] = []
+        for stmt in module.body:
+            for _body, func in self._function_defs([stmt]):
+                self._hoist_from_function(func, [], stmt, hoisted)
+        for anchor, definition in hoisted:
+            index = next(i for i, stmt in enumerate(module.body) if stmt is anchor)
+            module.body.insert(index, definition)
+        for body in list(_scopes(module)):
+            self._hoist_from_loops(body)
+        return module
+
+    def _function_defs(
+        self, body: t.List[ast.stmt]
+    ) -> t.Iterator[t.Tuple[t.List[ast.stmt], t.Union[ast.FunctionDef, ast.AsyncFunctionDef]]]:
+        """
+        Yields the function definitions in *body* and the statement lists that contain them, not including
+        functions nested in functions or classes.
+        """
+
+        for stmt in list(body):
+            if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                yield body, stmt
+            for nested in _nested_bodies(stmt):
+                yield from self._function_defs(nested)
+
+    def _hoist_from_function(
+        self,
+        func: t.Union[ast.FunctionDef, ast.AsyncFunctionDef],
+        enclosing: t.List[t.Union[ast.FunctionDef, ast.AsyncFunctionDef]],
+        anchor: ast.stmt,
+        hoisted: t.List[t.Tuple[ast.stmt, ast.stmt]],
+    ) -> None:
+        """
+        Moves the closures defined in *func* that do not depend on *func* or the *enclosing* functions into the
+        *hoisted* list, to be inserted in front of the *anchor* statement of the module. Nested functions are
+        processed first, as moving a closure out of a function may make the function independent.
+        """
+
+        functions = [*enclosing, func]
+        for body, nested in self._function_defs(func.body):
+            self._hoist_from_function(nested, functions, anchor, hoisted)
+            if self.is_closure(nested) and self._is_independent(nested, functions):
+                body.remove(nested)
+                hoisted.append((anchor, nested))
+
+    def _hoist_from_loops(self, body: t.List[ast.stmt]) -> None:
+        index = 0
+        while index < len(body):
+            stmt = body[index]
+            if isinstance(stmt, _LOOP_TYPES):
+                definitions = [
+                    (nested_body, func)
+                    for loop_body in _nested_bodies(stmt)
+                    for nested_body, func in self._function_defs(loop_body)
+                    if self.is_closure(func) and self._is_pure_definition(func)
+                ]
+                for nested_body, func in definitions:
+                    nested_body.remove(func)
+                body[index:index] = [func for _, func in definitions]
+                index += len(definitions)
+            else:
+                for nested in _nested_bodies(stmt):
+                    self._hoist_from_loops(nested)
+            index += 1
+
+    def _is_pure_definition(self, func: t.Union[ast.FunctionDef, ast.AsyncFunctionDef]) -> bool:
+        """
+        Returns whether evaluating the definition of *func* only depends on the closure target.
+        """
+
+        for decorator in func.decorator_list:
+            while isinstance(decorator, ast.Attribute):
+                decorator = decorator.value
+            if not isinstance(decorator, ast.Name) or decorator.id != self.target:
+                return False
+        args = func.args
+        if func.returns is not None or any(arg.annotation is not None for arg in _arguments(args)):
+            return False
+        return all(default is None or isinstance(default, ast.Constant) for default in args.defaults + args.kw_defaults)
+
+    def _is_independent(
+        self,
+        func: t.Union[ast.FunctionDef, ast.AsyncFunctionDef],
+        enclosing: t.List[t.Union[ast.FunctionDef, ast.AsyncFunctionDef]],
+    ) -> bool:
+        """
+        Returns whether *func* can be defined at the module level instead of in the *enclosing* functions.
+        """
+
+        if not self._is_pure_definition(func):
+            return False
+        for stmt in func.body:
+            for node in ast.walk(stmt):
+                if isinstance(node, ast.Name) and node.id == self.target:
+                    return False
+        free = _free_names(func)
+        return free is not None and not any(free & _bound_names(outer) for outer in enclosing)
+
+
+def _arguments(args: ast.arguments) -> t.List[ast.arg]:
+    return [
+        *getattr(args, "posonlyargs", ()),
+        *args.args,
+        *([args.vararg] if args.vararg else []),
+        *args.kwonlyargs,
+        *([args.kwarg] if args.kwarg else []),
+    ]
+
+
+def _bound_names(scope: ast.AST) -> t.Set[str]:
+    """
+    Returns the names that are bound in the scope of a function, lambda or comprehension, not including the
+    names bound in nested scopes.
+    """
+
+    names: t.Set[str] = set()
+    if isinstance(scope, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+        names.update(arg.arg for arg in _arguments(scope.args))
+    stack = list(ast.iter_child_nodes(scope))
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).partition(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif not isinstance(node, _SCOPE_TYPES):
+            stack.extend(ast.iter_child_nodes(node))
+    return names
+
+
+def _free_names(scope: ast.AST) -> t.Optional[t.Set[str]]:
+    """
+    Returns the names that are read from enclosing scopes by a function, lambda or comprehension and the scopes
+    nested in it, or `None` if that cannot be determined (e.g. because of `global` statements, nested classes
+    or pattern matching).
+    """
+
+    loaded: t.Set[str] = set()
+    stack = list(ast.iter_child_nodes(scope))
+    while stack:
+        node = stack.pop()
+        if isinstance(node, _OPAQUE_TYPES):
+            return None
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            loaded.add(node.id)
+        if isinstance(node, _SCOPE_TYPES):
+            nested = _free_names(node)
+            if nested is None:
+                return None
+            loaded.update(nested)
+            # Decorators, default arguments and the first iterable of comprehensions are evaluated in this scope.
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                stack.extend(node.decorator_list)
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+                stack.extend(default for default in node.args.defaults + node.args.kw_defaults if default)
+            elif isinstance(node, (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+                stack.append(node.generators[0].iter)
+        else:
+            stack.extend(ast.iter_child_nodes(node))
+    return loaded - _bound_names(scope)
+
+
+class BindBuiltins(OptimizationPass):
+    """
+    Replaces lookups of Python builtins that are never assigned in the code with the builtin. This assumes that
+    no target provides a name that shadows a builtin (for example an attribute named `type` or `filter`).
+    """
+
+    level = 2
+
+    def run(self, module: ast.Module) -> ast.Module:
+        names = {name for name in dir(builtins) if not name.startswith("_")} - self.assigned_keys(module)
+        replacements: t.Dict[ast.AST, ast.AST] = {}
+        for node in ast.walk(module):
+            if isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Load):
+                key = self.lookup_key(node)
+                if key in names:
+                    replacements[node] = ast.copy_location(ast.Name(id=key, ctx=ast.Load()), node)
+        return t.cast(ast.Module, _Replace(replacements).visit(module))
+
+
+class PrefetchFreeNames(OptimizationPass):
+    """
+    Resolves all names that a closure looks up, but never assigns or deletes, with a single call to
+    :meth:`~builddsl.closure.ClosureState.prefetch` when the closure is entered, and binds them to local
+    variables named `__free_<name>__`. Assignments still go through the closure target.
+
+    This changes when names are resolved: a closure sees the values that its names had when it was entered, and
+    entering a closure raises a :class:`NameError` if one of its names cannot be resolved, even if the code
+    that uses the name is never executed. Thus the pass only runs if #TranspileOptions.prefetch_free_names is
+    enabled.
+    """
+
+    @classmethod
+    def enabled(cls, options: "TranspileOptions") -> bool:
+        return options.prefetch_free_names
+
+    def run(self, module: ast.Module) -> ast.Module:
+        for node in ast.walk(module):
+            if self.is_closure(node):
+                self._prefetch(t.cast(ast.FunctionDef, node))
+        return module
+
+    def _prefetch(self, node: t.Union[ast.FunctionDef, ast.AsyncFunctionDef]) -> None:
+        # Names that are assigned in nested scopes are excluded as well, as nested closures assign them through
+        # the same targets.
+        assigned = self.assigned_keys(ast.Module(body=node.body, type_ignores=[]))
+        replacements: t.Dict[ast.AST, ast.AST] = {}
+        keys: t.Dict[str, None] = {}
+        for lookup in self.lookups(node.body):
+            key = self.lookup_key(lookup)
+            assert key is not None
+            if key not in assigned:
+                replacements[lookup] = ast.copy_location(ast.Name(id=f"__free_{key}__", ctx=ast.Load()), lookup)
+                keys[key] = None
+        if not replacements:
+            return
+
+        _Replace(replacements).visit(ast.Module(body=node.body, type_ignores=[]))
+        prefetch = ast.Assign(
+            targets=[
+                ast.Tuple(elts=[ast.Name(id=f"__free_{key}__", ctx=ast.Store()) for key in keys], ctx=ast.Store())
+            ],
+            value=ast.Call(
+                func=ast.Attribute(value=ast.Name(id=self.target, ctx=ast.Load()), attr="prefetch", ctx=ast.Load()),
+                args=[ast.Tuple(elts=[ast.Constant(key) for key in keys], ctx=ast.Load())],
+                keywords=[],
+            ),
+        )
+        index = _body_start(node.body)
+        node.body.insert(index, _located(prefetch, node.body[min(index, len(node.body) - 1)]))
+
+
+class SkipClosureState(OptimizationPass):
+    """
+    Decorates closures that never use the closure target, e.g. `x -> x % 2`, with
+    :meth:`~builddsl.closure.ClosureState.stateless`, thus calling them does not create a
+    :class:`~builddsl.closure.ClosureState`. Runs after the other passes, which may add uses of the target.
+    """
+
+    def run(self, module: ast.Module) -> ast.Module:
+        names = {self.target} | _INTROSPECTION_NAMES
+        for node in ast.walk(module):
+            if not self.is_closure(node) or not self.is_definition(t.cast(ast.FunctionDef, node)):
+                continue
+            func = t.cast(ast.FunctionDef, node)
+            if any(isinstance(child, ast.Name) and child.id in names for stmt in func.body for child in ast.walk(stmt)):
+                continue
+            decorator = ast.Attribute(value=ast.Name(id=self.target, ctx=ast.Load()), attr="stateless", ctx=ast.Load())
+            func.decorator_list.append(_located(decorator, func))
+        return module
+
+
+#: The passes that are run by default, in order.
+DEFAULT_PASSES: t.Tuple[t.Type[OptimizationPass], ...] = (
+    BindBuiltins,
+    IgnoreUnusedArguments,
+    HoistClosures,
+    PrefetchFreeNames,
+    CommonLookups,
+    LoopInvariantLookups,
+    BindGetitem,
+    SkipClosureState,
+)
+
+
+def enabled_passes(options: "TranspileOptions") -> t.List[t.Type[OptimizationPass]]:
+    """
+    Returns the #TranspileOptions.optimizer_passes that are enabled by the *options*.
+    """
+
+    if options.closure_target is None:
+        return []
+    return [pass_type for pass_type in options.optimizer_passes if pass_type.enabled(options)]
+
+
+def optimize(module: ast.Module, options: "TranspileOptions") -> ast.Module:
+    """
+    Runs the #TranspileOptions.optimizer_passes on the *module* that are enabled by the *options*.
+    """
+
+    for pass_type in enabled_passes(options):
+        module = pass_type(options).run(module)
+    return module
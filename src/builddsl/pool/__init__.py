@@ -0,0 +1,188 @@
+"""
+Execute many BuildDSL scripts in a pool of warm worker processes.
+
+Starting a Python interpreter and importing BuildDSL, the lexer and the modules that provide the targets takes
+longer than executing a typical build script. A :class:`WorkerPool` imports these modules once and then forks
+its workers, which execute :class:`Job` objects with :meth:`builddsl.Context.exec` and send a :class:`JobResult`
+back to the parent through a pipe. On platforms that support it, the workers are forked from a `forkserver`
+process that preloads the modules; elsewhere every worker imports them when it starts.
+
+The pool can also be used from the command line:
+
+    $ python -m builddsl.pool -j 4 -t mybuild.targets:Project build/*.dsl
+"""
+
+import importlib
+import multiprocessing
+import multiprocessing.context
+import multiprocessing.pool
+import os
+import time
+import traceback
+import typing as t
+from dataclasses import dataclass
+
+from builddsl.api import Context
+from builddsl.targets import ChainedTarget, ObjectTarget, Target
+from builddsl.transpiler import TranspileOptions, transpile_to_ast
+
+#: The modules that are always preloaded by a :class:`WorkerPool`.
+PRELOAD_MODULES = ("builddsl", "builddsl.api", "builddsl.closure", "builddsl.optimizer")
+
+
+@dataclass(frozen=True)
+class Job:
+    """
+    A BuildDSL script to execute in a :class:`WorkerPool`.
+    """
+
+    #: The filename of the script. The code is read from this file if #code is not set.
+    filename: str
+
+    #: The code of the script.
+    code: t.Optional[str] = None
+
+    #: An entrypoint in the form `module:member`, where the member may be a dotted path, that is called without
+    #: arguments in the worker to create the object that is used as the target of the script. If not set, the
+    #: script has no global target.
+    target: t.Optional[str] = None
+
+    #: An entrypoint like #target that is called with the target object after the script was executed. Its return
+    #: value is sent back as #JobResult.value and must be picklable.
+    result: t.Optional[str] = None
+
+
+@dataclass
+class JobResult:
+    """
+    The outcome of a :class:`Job`.
+    """
+
+    #: The filename of the job.
+    filename: str
+
+    #: The return value of the #Job.result entrypoint.
+    value: t.Any = None
+
+    #: The formatted traceback if the job failed.
+    error: t.Optional[str] = None
+
+    #: The time it took the worker to run the job, in seconds.
+    duration: float = 0.0
+
+    #: The ID of the worker process that ran the job.
+    pid: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class WorkerPool:
+    """
+    A pool of worker processes that execute :class:`Job` objects. Workers are reused for multiple jobs unless
+    *max_jobs_per_worker* is set, in which case a worker is replaced by a freshly forked one after it ran that
+    many jobs. Setting it to `1` isolates jobs that modify the state of the preloaded modules from each other.
+
+    Note that there is only one `forkserver` process per parent process. The modules to preload are only
+    considered by the pool that starts it.
+    """
+
+    def __init__(
+        self,
+        workers: t.Optional[int] = None,
+        preload: t.Iterable[str] = (),
+        options: t.Optional[TranspileOptions] = None,
+        max_jobs_per_worker: t.Optional[int] = None,
+    ) -> None:
+        """
+        :param workers: The number of worker processes. Defaults to the number of CPUs.
+        :param preload: The names of additional modules to import before the workers are forked, e.g. the
+            modules that provide the targets of the jobs.
+        :param options: The options to transpile the scripts with. Defaults to :attr:`Context.OPTIONS`.
+        :param max_jobs_per_worker: The number of jobs after which a worker is replaced.
+        """
+
+        modules = [*PRELOAD_MODULES, *preload]
+        context: multiprocessing.context.BaseContext
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            forkserver = multiprocessing.get_context("forkserver")
+            forkserver.set_forkserver_preload(modules)
+            context = forkserver
+        else:
+            context = multiprocessing.get_context("spawn")
+        self.options = options or Context.OPTIONS
+        self._pool = context.Pool(workers, _init_worker, (modules,), max_jobs_per_worker)
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        self.close()
+
+    def submit(self, job: Job) -> "multiprocessing.pool.AsyncResult[JobResult]":
+        """
+        Schedule a job and return a handle to wait for its result.
+        """
+
+        return self._pool.apply_async(run_job, (job, self.options))
+
+    def map(self, jobs: t.Iterable[Job]) -> t.List[JobResult]:
+        """
+        Run all *jobs* and return their results in the same order.
+        """
+
+        return self._pool.map(_run_job_with_options, [(job, self.options) for job in jobs], chunksize=1)
+
+    def close(self) -> None:
+        """
+        Wait for the scheduled jobs to finish and stop the workers.
+        """
+
+        self._pool.close()
+        self._pool.join()
+
+
+def _init_worker(modules: t.List[str]) -> None:
+    for module_name in modules:
+        importlib.import_module(module_name)
+    # Run the transpiler once so that nothing is initialized lazily on the first job.
+    transpile_to_ast("def _ = () -> None\n", "<warmup>", Context.OPTIONS)
+
+
+def _load_entrypoint(entrypoint: str) -> t.Any:
+    module_name, _, member = entrypoint.partition(":")
+    obj = importlib.import_module(module_name)
+    for name in member.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+def _run_job_with_options(args: t.Tuple[Job, TranspileOptions]) -> JobResult:
+    return run_job(*args)
+
+
+def run_job(job: Job, options: t.Optional[TranspileOptions] = None) -> JobResult:
+    """
+    Execute a single job in the current process. This is what the workers of a :class:`WorkerPool` do.
+    """
+
+    class JobContext(Context):
+        OPTIONS = options or Context.OPTIONS
+
+    tstart = time.perf_counter()
+    result = JobResult(job.filename, pid=os.getpid())
+    try:
+        code = job.code
+        if code is None:
+            with open(job.filename) as fp:
+                code = fp.read()
+        obj = _load_entrypoint(job.target)() if job.target else None
+        target: Target = ObjectTarget(obj) if job.target else ChainedTarget()
+        JobContext(target).exec(code, job.filename)
+        if job.result:
+            result.value = _load_entrypoint(job.result)(obj)
+    except Exception:
+        result.error = traceback.format_exc()
+    result.duration = time.perf_counter() - tstart
+    return result
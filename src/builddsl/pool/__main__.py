@@ -0,0 +1,62 @@
+import argparse
+import dataclasses
+import os
+import sys
+
+from builddsl.api import Context
+from builddsl.pool import Job, WorkerPool
+
+parser = argparse.ArgumentParser(prog=os.path.basename(sys.executable) + " -m builddsl.pool")
+parser.add_argument("files", nargs="+", help="The files that contain BuildDSL code.")
+parser.add_argument(
+    "-t",
+    "--target",
+    metavar="ENTRYPOINT",
+    help="A Python entrypoint pointing to the object to use as the Closure context of every script. Its module is "
+    "preloaded.",
+)
+parser.add_argument(
+    "-j", "--jobs", metavar="N", type=int, help="The number of worker processes. Defaults to the number of CPUs."
+)
+parser.add_argument(
+    "--preload",
+    metavar="MODULE",
+    action="append",
+    default=[],
+    help="A module to import before the workers are forked. Can be specified multiple times.",
+)
+parser.add_argument(
+    "--max-jobs-per-worker",
+    metavar="N",
+    type=int,
+    help="Replace a worker with a freshly forked one after it executed N scripts.",
+)
+parser.add_argument(
+    "-O",
+    "--optimize",
+    metavar="LEVEL",
+    type=int,
+    default=0,
+    help="The optimization level for the generated Python code (0, 1 or 2).",
+)
+
+
+def main() -> None:
+    args = parser.parse_args()
+
+    preload = list(args.preload)
+    if args.target:
+        preload.append(args.target.partition(":")[0])
+    options = dataclasses.replace(Context.OPTIONS, optimize=args.optimize)
+
+    with WorkerPool(args.jobs, preload, options, args.max_jobs_per_worker) as pool:
+        results = pool.map(Job(filename, target=args.target) for filename in args.files)
+
+    failed = [result for result in results if not result.ok]
+    for result in failed:
+        print(f"error: {result.filename}\n{result.error}", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
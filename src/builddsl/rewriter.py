@@ -4,14 +4,26 @@ Rewrite BuildDSL code to pure Python code.
 
 import contextlib
 import enum
+import io
+import keyword
 import logging
 import re
 import string
 import sys
+import tokenize
 import typing as t
-from dataclasses import dataclass
-
-from nr.io.lexer import Cursor, ProxyToken as _ProxyToken, RuleSet, Tokenizer, rules
+from dataclasses import dataclass, field
+
+from nr.io.lexer import (
+    Cursor,
+    ProxyToken as _ProxyToken,
+    RuleSet,
+    Scanner,
+    Token as _Token,
+    TokenExtractor,
+    Tokenizer,
+    rules,
+)
 
 try:
     from termcolor import colored
@@ -24,6 +36,12 @@ except ImportError:
 from builddsl.util import debug_trace
 
 logger = logging.getLogger(__name__)
+T = t.TypeVar("T")
+
+#: The return type of the parse methods of the :class:`Rewriter`. Instead of calling each other recursively,
+#: the parse methods yield the generator of the parse method they want to call and receive its result (see
+#: :meth:`Rewriter._run`). This keeps the Python stack flat no matter how deeply the code is nested.
+_Parse = t.Generator[t.Any, t.Any, T]
 
 
 @dataclass
@@ -63,7 +81,7 @@ class Token(enum.Enum):
     Control = enum.auto()
 
 
-PYTHON_BLOCK_KEYWORDS = frozenset(["class", "def", "if", "elif", "else", "for", "while", "with"])
+PYTHON_BLOCK_KEYWORDS = frozenset(["async", "class", "def", "if", "elif", "else", "for", "while", "with"])
 ASSIGNMENT_OPERATORS = ["=", "+=", "-=", "*=", "/=", "%=", "//=", "**=", "&=", "|=", "^=", ">>=", "<<=", "@="]
 BINARY_OPERATORS = [x[:-1] for x in ASSIGNMENT_OPERATORS[1:]] + [
     ".",
@@ -78,7 +96,7 @@ BINARY_OPERATORS = [x[:-1] for x in ASSIGNMENT_OPERATORS[1:]] + [
     "and",
     "or",
 ]
-UNARY_OPERATORS = ["not", "~"]
+UNARY_OPERATORS = ["not", "~", "await"]
 OTHER_CONTROL_CHARACTERS = list("()[]{},:;") + ["->"]
 _ALL_CONTROL_CHARACTERS = sorted(
     ASSIGNMENT_OPERATORS + BINARY_OPERATORS + UNARY_OPERATORS + OTHER_CONTROL_CHARACTERS,
@@ -87,18 +105,184 @@ _ALL_CONTROL_CHARACTERS = sorted(
 )
 _WORD_CONTROL_CHARACTERS = [op for op in _ALL_CONTROL_CHARACTERS if op.isalpha()]
 
+#: The control tokens that can start an expression (see :meth:`Rewriter._can_start_expr`).
+_EXPR_START_CONTROL_CHARACTERS = frozenset(["(", "[", "{", *UNARY_OPERATORS])
+_CALL_ARGS_START_CONTROL_CHARACTERS = _EXPR_START_CONTROL_CHARACTERS | {"*", "**"}
+
+#: Matches the prefix and the opening quote of a Python string literal.
+_STRING_START = re.compile(r"([rRuUbBfF]|[bBfF][rR]|[rR][bBfF])?('''|\"\"\"|'|\")")
+
+#: Match the remainder of a string literal without replacement fields, up to and including the closing quote.
+_STRING_BODY = {
+    "'": re.compile(r"[^'\\\n]*(?:\\.[^'\\\n]*)*'", re.S),
+    '"': re.compile(r'[^"\\\n]*(?:\\.[^"\\\n]*)*"', re.S),
+    "'''": re.compile(r"[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*'''", re.S),
+    '"""': re.compile(r'[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*"""', re.S),
+}
+
+#: Find the next character of interest in the literal text of an f-string or in a replacement field.
+_FSTRING_TEXT_STOP = {"'": re.compile(r"[\\{}\n']"), '"': re.compile(r'[\\{}\n"]')}
+_FSTRING_EXPR_STOP = re.compile(r"[\"'#{}()\[\]:\n]")
+
+
+def _scan_string_literal(text: str, offset: int) -> t.Optional[int]:
+    """
+    Finds the end of the Python string literal that starts at *offset* in *text* in a single pass over the
+    literal. Returns the offset after the closing quote, or `None` if there is no string literal at *offset* or
+    if it is not terminated.
+    """
+
+    match = _STRING_START.match(text, offset)
+    if not match:
+        return None
+    prefix, quote = (match.group(1) or "").lower(), match.group(2)
+    if "f" in prefix:
+        return _scan_fstring(text, match.end(), quote, "r" in prefix)
+    body = _STRING_BODY[quote].match(text, match.end())
+    return body.end() if body else None
+
+
+def _scan_fstring(text: str, pos: int, quote: str, raw: bool) -> t.Optional[int]:
+    """
+    Finds the end of an f-string, where *pos* points to the character after the opening quote. Replacement
+    fields may contain brackets, format specs with nested replacement fields and string literals, including
+    f-strings that reuse the quotes of the outer f-string (:pep:`701`).
+    """
+
+    # An entry is either the `(quote, raw, is_format_spec)` of an f-string or a format spec, or the bracket
+    # depth of a replacement field.
+    stack: t.List[t.Union[t.Tuple[str, bool, bool], int]] = [(quote, raw, False)]
+    while stack:
+        frame = stack[-1]
+        if isinstance(frame, tuple):
+            quote, raw, is_format_spec = frame
+            match = _FSTRING_TEXT_STOP[quote[0]].search(text, pos)
+            if not match:
+                return None
+            pos = match.start()
+            char = text[pos]
+            if char == "\\":
+                if not raw and text.startswith("N{", pos + 1):
+                    pos = text.find("}", pos)
+                    if pos < 0:
+                        return None
+                    pos += 1
+                else:
+                    # A backslash does not escape the braces of a replacement field.
+                    pos += 1 if text.startswith(("{", "}"), pos + 1) else 2
+            elif char == "\n":
+                if len(quote) == 1:
+                    return None
+                pos += 1
+            elif char == "{":
+                if text.startswith("{{", pos) and not is_format_spec:
+                    pos += 2
+                else:
+                    stack.append(0)
+                    pos += 1
+            elif char == "}":
+                if is_format_spec:
+                    del stack[-2:]  # The format spec and the replacement field that it belongs to.
+                    pos += 1
+                else:
+                    pos += 2 if text.startswith("}}", pos) else 1
+            elif text.startswith(quote, pos):
+                while stack.pop() != (quote, raw, False):
+                    pass
+                pos += len(quote)
+            else:
+                pos += 1
+        else:
+            match = _FSTRING_EXPR_STOP.search(text, pos)
+            if not match:
+                return None
+            pos = match.start()
+            char = text[pos]
+            if char in "'\"":
+                start = pos
+                while start > pos - 2 and (text[start - 1].isalnum() or text[start - 1] == "_"):
+                    start -= 1
+                nested = _STRING_START.match(text, start)
+                if not nested or nested.start(2) != pos:
+                    nested = _STRING_START.match(text, pos)
+                    assert nested is not None
+                prefix = (nested.group(1) or "").lower()
+                if "f" in prefix:
+                    stack.append((nested.group(2), "r" in prefix, False))
+                    pos = nested.end()
+                else:
+                    body = _STRING_BODY[nested.group(2)].match(text, nested.end())
+                    if not body:
+                        return None
+                    pos = body.end()
+            elif char in "([{":
+                stack[-1] = frame + 1
+                pos += 1
+            elif char in ")]" or (char == "}" and frame):
+                stack[-1] = frame - 1
+                pos += 1
+            elif char == "}":
+                stack.pop()
+                pos += 1
+            elif char == ":" and not frame:
+                quote, raw, _ = t.cast(t.Tuple[str, bool, bool], stack[-2])
+                stack.append((quote, raw, True))
+                pos += 1
+            elif char == "#":
+                pos = text.find("\n", pos)
+                if pos < 0:
+                    return None
+            else:
+                pos += 1
+    return pos
+
+
+def _string_literal() -> TokenExtractor[str]:
+    """
+    Extracts a string literal with :func:`_scan_string_literal`. Contrary to :func:`rules.string_literal`, this
+    does not copy the literal character by character and also accepts prefixes that contain uppercase letters.
+    """
+
+    def _impl(scanner: Scanner) -> t.Optional[str]:
+        text, cursor = scanner.text, scanner.pos
+        end = _scan_string_literal(text, cursor.offset)
+        if end is None:
+            return None
+        lines = text.count("\n", cursor.offset, end)
+        column = end - text.rfind("\n", cursor.offset, end) if lines else cursor.column + end - cursor.offset
+        scanner.pos = Cursor(end, cursor.line + lines, column)
+        return text[cursor.offset : end]
+
+    return TokenExtractor.of(_impl)
+
+
+#: The token rules shared by all :class:`Rewriter` instances. Must not be modified after import as rewriters
+#: may run concurrently in multiple threads.
 rule_set = RuleSet((Token.Eof, ""))
 rule_set.rule(Token.Indent, rules.regex_extract(r"[\t ]*", at_line_start_only=True))
 rule_set.rule(Token.Newline, rules.regex_extract(r"\n"))
 rule_set.rule(Token.Whitespace, rules.regex_extract(r"\s+"))
 rule_set.rule(Token.Comment, rules.regex_extract(r"#.*"))
 rule_set.rule(Token.Control, rules.regex_extract("(" + "|".join(map(re.escape, _WORD_CONTROL_CHARACTERS)) + r")\b"))
+# NOTE: String literals are extracted before names, otherwise the prefix of a string literal would be a name.
+rule_set.rule(Token.Literal, _string_literal())
 rule_set.rule(Token.Name, rules.regex_extract(r"[A-Za-z\_][A-Za-z0-9\_]*"))
 rule_set.rule(Token.Literal, rules.regex_extract(r"[+\-]?(\d+)(\.\d*)?"))
-rule_set.rule(Token.Literal, rules.string_literal())
 rule_set.rule(Token.Control, rules.regex_extract("|".join(map(re.escape, _ALL_CONTROL_CHARACTERS))))
 
 
+class _Tokenizer(Tokenizer[Token, str]):
+    """
+    Counts the tokens that are extracted, including tokens that are extracted again after backtracking.
+    """
+
+    token_count = 0
+
+    def next(self, *args: t.Any, **kwargs: t.Any) -> "_Token[Token, str]":
+        self.token_count += 1
+        return super().next(*args, **kwargs)
+
+
 class ProxyToken(_ProxyToken[Token, str]):
     """
     Extension class that adds some useful utility methods to test the contents of the token.
@@ -155,14 +339,15 @@ class SyntaxError(Exception):
         return "\n".join(lines)
 
 
-@dataclass
-class Closure:
+class Closure(t.NamedTuple):
     """
-    Contains the definition of a closure in text format.
+    Contains the definition of a closure in text format. The text of the closure is not stored as a string of its
+    own but as a span of #source, which the :meth:`Rewriter.rewrite` shares between all closures of a file, and
+    is only copied when it is accessed through #text, #body or #expr.
     """
 
-    #: A unique ID for the closure, usually derived from the number of closures that have already
-    #: been parsed in the same file or it's parent closures.
+    #: A unique ID for the closure, derived from the number of closures that end before it in the
+    #: same file.
     id: str
 
     #: The line number where the closure begins.
@@ -173,14 +358,75 @@ class Closure:
     indent: int
 
     #: The parameter names of the closure. May be `None` to indicate that closure had no header.
-    parameters: t.Optional[t.List[str]]
+    parameters: t.Optional[t.Tuple[str, ...]]
+
+    #: Whether the closure body is just an expression instead of statements in curly braces.
+    is_expr: bool
+
+    #: The IDs of the closures that are nested directly in this closure, in the order in which they begin.
+    nested: t.Tuple[str, ...]
+
+    #: The string that contains the rewritten code of the closure's body or expression.
+    source: str
+
+    #: The offset of the closure's code in #source.
+    start: int
+
+    #: The offset in #source after the closure's code.
+    end: int
+
+    @classmethod
+    def from_text(
+        cls,
+        id: str,
+        line: int,
+        indent: int,
+        parameters: t.Optional[t.Sequence[str]],
+        is_expr: bool,
+        nested: t.Sequence[str],
+        text: str,
+    ) -> "Closure":
+        """
+        Create a closure that owns its *text*.
+        """
+
+        parameters = None if parameters is None else tuple(parameters)
+        return cls(id, line, indent, parameters, is_expr, tuple(nested), text, 0, len(text))
+
+    def __repr__(self) -> str:
+        # The #source contains the code of all closures in the file.
+        return (
+            f"Closure(id={self.id!r}, line={self.line!r}, indent={self.indent!r}, parameters={self.parameters!r}, "
+            f"is_expr={self.is_expr!r}, nested={self.nested!r}, text={self.text!r})"
+        )
+
+    @property
+    def text(self) -> str:
+        """The rewritten code of the closure's body or expression."""
 
-    #: The body of the closure. May be `None` if the closure body is not constructed using curly
-    #: braces to encapsulate multiple statements. In that case, the #expr field is set instead.
-    body: t.Optional[str]
+        return self.source[self.start : self.end]
 
-    #: Only set if the body of the closure is just an expression.
-    expr: t.Optional[str]
+    @property
+    def body(self) -> t.Optional[str]:
+        """The body of the closure, or `None` if the closure is an expression (see #expr)."""
+
+        return None if self.is_expr else self.text
+
+    @property
+    def expr(self) -> t.Optional[str]:
+        """The expression of the closure, or `None` if the closure has a body (see #body)."""
+
+        return self.text if self.is_expr else None
+
+
+class _ClosureNode(t.NamedTuple):
+    """
+    A closure and the closures nested in it. While rewriting, closures are collected in a tree of nodes such that
+    discarding or replaying the result of a parse only affects the closures on the current level.
+    """
+
+    closure: Closure
+    children: "t.List[_ClosureNode]"
 
 
 @dataclass
@@ -203,19 +449,45 @@ class Rewriter:
     tact as much as possible (not always fully accurate).
     """
 
-    def __init__(self, text: str, filename: str, grammar: t.Optional[Grammar] = None) -> None:
+    def __init__(
+        self,
+        text: str,
+        filename: str,
+        grammar: t.Optional[Grammar] = None,
+        closure_counter: int = 0,
+        first_line: int = 1,
+    ) -> None:
         """
         # Arguments
         text: The BuildDSL code to parse and turn into an AST-like structure.
         filename: The filename where the DSL code is from.
+        closure_counter: The number of closures in the same file that were extracted before *text*, if the
+          file is rewritten in multiple parts (see #scan_statements()).
+        first_line: The line number of the first line of *text* in the file, used for the lines of the closures
+          and in errors.
         """
 
-        self.tokenizer = Tokenizer(rule_set, text)
+        self.tokenizer = _Tokenizer(rule_set, text)
+        if first_line != 1:
+            self.tokenizer.scanner.pos = Cursor(0, first_line, 1)
         self.filename = filename
         self.grammar = grammar or Grammar()
-        self._closure_stack: t.List[str] = []  #: Used to construct nested closure names.
-        self._closure_counter = 0  #: Used to assign a unique number to every closure.
-        self._closures: t.Dict[str, Closure] = {}
+        self._closure_counter = closure_counter  #: Used to assign a unique number to every closure.
+        self._closure_nodes: t.List[_ClosureNode] = []  #: The closures of the closure that is currently parsed.
+
+        #: The results of :meth:`_rewrite_atom` for curly braces, keyed by the offset of the brace and the closure
+        #: counter. When the contents of the braces are parsed speculatively by the enclosing :meth:`_test_dict`,
+        #: this avoids parsing them again, which keeps the cost of nested braces linear.
+        self._brace_memo: t.Dict[t.Tuple[int, int], t.Tuple[str, t.Any, int, t.List[_ClosureNode]]] = {}
+
+        #: The number of times that the rewriter had to go back to an earlier position in the code
+        #: after speculatively parsing ahead.
+        self.backtrack_count = 0
+
+        #: The number of nested :meth:`_speculate` contexts. Syntax errors raised while speculating are
+        #: discarded, thus we can raise :attr:`_speculative_error` instead of constructing a new error.
+        self._speculation_depth = 0
+        self._speculative_error = SyntaxError("speculative parse failed", filename, 0, 0, "")
 
     @contextlib.contextmanager
     def _lookahead(self) -> t.Iterator[t.Callable[[], None]]:
@@ -226,7 +498,8 @@ class Rewriter:
         """
 
         state = self.tokenizer.state
-        closure_state = self._closure_counter, self._closures.copy(), self._closure_stack[:]
+        closure_counter, closure_nodes = self._closure_counter, self._closure_nodes
+        num_closure_nodes = len(closure_nodes)
         do_restore = True
 
         def commit() -> None:
@@ -238,15 +511,81 @@ class Rewriter:
         finally:
             if do_restore:
                 self.tokenizer.state = state
-                self._closure_counter, self._closures, self._closure_stack = closure_state
+                self._closure_counter = closure_counter
+                self._closure_nodes = closure_nodes
+                del closure_nodes[num_closure_nodes:]
+
+    @contextlib.contextmanager
+    def _speculate(self) -> t.Iterator[t.Callable[[], None]]:
+        """
+        Like :meth:`_lookahead`, but for speculative parses where the caller handles a :class:`SyntaxError`
+        by discarding it. Errors raised inside this context do not carry a message or the source code.
+        """
+
+        self._speculation_depth += 1
+        try:
+            with self._lookahead() as commit:
+                yield commit
+        finally:
+            self._speculation_depth -= 1
+
+    def _run(self, parse: "_Parse[T]") -> T:
+        """
+        Runs a parse method to completion. A parse method calls another parse method by yielding its generator,
+        which is then run by this method with an explicit stack instead of the Python stack. The result of the
+        callee is sent back into the caller, or the exception it raised is thrown into the caller.
+        """
+
+        stack: t.List[_Parse[t.Any]] = [parse]
+        value: t.Any = None
+        error: t.Optional[BaseException] = None
+        while True:
+            try:
+                callee = stack[-1].send(value) if error is None else stack[-1].throw(error)
+            except StopIteration as exc:
+                stack.pop()
+                if not stack:
+                    return t.cast(T, exc.value)
+                value, error = exc.value, None
+            except BaseException as exc:
+                stack.pop()
+                if not stack:
+                    raise
+                value, error = None, exc
+            else:
+                stack.append(callee)
+                value, error = None, None
 
     def _syntax_error(self, msg: str, pos: t.Optional[Cursor] = None) -> SyntaxError:
         """Raise a syntax error on the current position of the tokenizer, or the specified *pos*."""
 
+        if self._speculation_depth:
+            # Reset the state that Python attaches to the exception when it is raised, otherwise it would
+            # keep growing with every raise and keep the frames alive.
+            error = self._speculative_error
+            error.__traceback__ = error.__context__ = error.__cause__ = None
+            return error
+
         pos = pos or self.tokenizer.current.pos
         text = self.tokenizer.scanner.getline(pos)
         return SyntaxError(msg, self.filename, pos.line, pos.column, text)
 
+    def _can_start_expr(self, mode: ParseMode) -> bool:
+        """
+        Returns `True` if the current token can be the first token of an expression parsed by
+        :meth:`_rewrite_atom` in the given *mode*. This allows deciding where a list of expressions ends
+        without parsing ahead and backtracking on a :class:`SyntaxError`.
+        """
+
+        token = self.tokenizer.current
+        if token.type in (Token.Name, Token.Literal):
+            return True
+        if token.type != Token.Control:
+            return False
+        if mode & ParseMode.CALL_ARGS:
+            return token.value in _CALL_ARGS_START_CONTROL_CHARACTERS
+        return token.value in _EXPR_START_CONTROL_CHARACTERS
+
     @debug_trace
     def _consume_whitespace(self, newlines: t.Union[bool, ParseMode] = False, reset_to_indent: bool = True) -> str:
         """
@@ -271,7 +610,7 @@ class Rewriter:
         return "".join(parts)
 
     @debug_trace
-    def _parse_closure(self) -> t.Optional[Closure]:
+    def _parse_closure(self) -> "_Parse[t.Optional[_ClosureNode]]":
         """
         Attempts to parse a closure at the current position of the tokenizer. Closures can have the
         following syntactical variants:
@@ -299,31 +638,43 @@ class Rewriter:
         pos = token.pos
         state = token.save()
         arglist = self._parse_closure_header()
+        if arglist is None and token.tv != (Token.Control, "{"):
+            return None
+
         body: t.Optional[str] = None
         expr: t.Optional[str] = None
-        closure_id = "".join(self._closure_stack) + f"_closure_{self._closure_counter + 1}"
-        self._closure_stack.append(closure_id)
-
-        if token.tv == (Token.Control, "{"):
-            body = self._parse_closure_body()
-        if body is None and arglist is not None:
-            # We only parse an expression for the Closure body if an arglist was specified.
-            expr = self._rewrite_expr(mode=ParseMode.DEFAULT)
+        parent_nodes = self._closure_nodes
+        children: t.List[_ClosureNode] = []
+        self._closure_nodes = children
 
-        assert self._closure_stack.pop() == closure_id
+        try:
+            if token.tv == (Token.Control, "{"):
+                body = yield self._parse_closure_body()
+            if body is None and arglist is not None:
+                # We only parse an expression for the Closure body if an arglist was specified.
+                expr = yield self._rewrite_expr(mode=ParseMode.DEFAULT)
+        finally:
+            self._closure_nodes = parent_nodes
 
         if not (body or expr):
             # NOTE(NiklasRosenstein): We could raise our own SyntaxError here if an arglist was provided
             #     as that is a strong indicator that a Closure expression or body should be provided,
             #     but we can also just leave the complaining to the Python parser.
             token.load(state)
+            self.backtrack_count += 1
             return None
 
+        # NOTE: Closures are numbered in the order in which they end, thus the closures nested in a closure have
+        #   lower numbers. This way, the number of closures that end before a brace is the same whether the code
+        #   in the brace is parsed speculatively by :meth:`_test_dict` or as the body of the closure.
         self._closure_counter += 1
-        return Closure(closure_id, pos.line, pos.column, arglist, body, expr)
+        closure_id = f"_closure_{self._closure_counter}"
+        nested = [child.closure.id for child in children]
+        closure = Closure.from_text(closure_id, pos.line, pos.column, arglist, not body, nested, body or expr or "")
+        return _ClosureNode(closure, children)
 
     @debug_trace
-    def _parse_closure_body(self) -> t.Optional[str]:
+    def _parse_closure_body(self) -> "_Parse[t.Optional[str]]":
         """
         Parses the body of a closure and returns it's code. Expects the tokenizer to point to the
         opening curly brace of the closure.
@@ -333,12 +684,12 @@ class Rewriter:
         assert token.tv == (Token.Control, "{"), token
         token.next()
 
-        code = self._consume_whitespace(True)
+        code: str = self._consume_whitespace(True)
         if "\n" in code:  # Multiline closure
-            code += self._rewrite_stmt_block() + self._consume_whitespace(True, False)
+            code += (yield self._rewrite_stmt_block()) + self._consume_whitespace(True, False)
         else:  # Singleline closure
             while token.type != Token.Newline and token.tv != (Token.Control, "}"):
-                code += self._rewrite_stmt_singleline() + self._consume_whitespace(True, False)
+                code += (yield self._rewrite_stmt_singleline()) + self._consume_whitespace(True, False)
 
         if token.tv != (Token.Control, "}"):
             raise self._syntax_error("expected closure closing brace")
@@ -359,7 +710,8 @@ class Rewriter:
 
         with token.set_skipped(Token.Whitespace):
             arglist: t.Optional[t.List[str]] = None
-            if token.tv == (Token.Control, "("):
+            is_parenthesized = token.tv == (Token.Control, "(")
+            if is_parenthesized:
                 arglist = self._parse_closure_arglist()
             elif token.type == Token.Name:
                 arglist = [token.value]
@@ -369,6 +721,8 @@ class Rewriter:
                 # We may have found something that looks like an arglist, but isn't, or we found an
                 # arglist but no following arrow, so we go back to where we started and let someone
                 # else handle these tokens.
+                if arglist is not None and is_parenthesized:
+                    self.backtrack_count += 1
                 token.load(state)
                 return None
 
@@ -398,6 +752,7 @@ class Rewriter:
                     or token.type != Token.Name
                 ):  # We can only accept a name at this position.
                     token.load(state)
+                    self.backtrack_count += 1
                     return None
 
                 arglist.append(token.value)
@@ -412,7 +767,7 @@ class Rewriter:
             return arglist
 
     @debug_trace
-    def _rewrite_expr(self, mode: ParseMode) -> str:
+    def _rewrite_expr(self, mode: ParseMode) -> "_Parse[str]":
         """
         Consumes a Python expression and returns it's code. Does not parse over a comma.
 
@@ -420,8 +775,8 @@ class Rewriter:
           being parsed.
         """
 
-        code = self._consume_whitespace(mode, False)
-        code += self._rewrite_atom(mode)
+        code: str = self._consume_whitespace(mode, False)
+        code += yield self._rewrite_atom(mode)
 
         token = ProxyToken(self.tokenizer)
         while token:
@@ -430,11 +785,11 @@ class Rewriter:
             if token.type == Token.Control and token.value in BINARY_OPERATORS:
                 code += token.value
                 token.next()
-                code += self._rewrite_expr(mode)
+                code += yield self._rewrite_expr(mode)
 
             elif token.is_control("(["):
                 code += self._consume_whitespace(True, False)
-                code += self._rewrite_atom(
+                code += yield self._rewrite_atom(
                     ParseMode.FUNCTION_CALL | ParseMode.GROUPED if token.value == "(" else ParseMode.DEFAULT
                 )
 
@@ -463,7 +818,7 @@ class Rewriter:
             return indent
 
     @debug_trace
-    def _rewrite_items(self, mode: ParseMode) -> str:
+    def _rewrite_items(self, mode: ParseMode) -> "_Parse[str]":
         """
         Rewrites expressions separated by commas.
         """
@@ -472,7 +827,7 @@ class Rewriter:
         continuation_indent: t.Union[int, None] = None
 
         token = ProxyToken(self.tokenizer)
-        code = ""
+        code: str = ""
         upsert_comma = False
         upgraded_to_call_args = False
         do_break = False
@@ -483,11 +838,25 @@ class Rewriter:
             if token.type == Token.Newline and not (mode & ParseMode.GROUPED):
                 break
 
-            with self._lookahead() as commit:
+            if token.type == Token.Indent:
+                state = token.save()
+                self._consume_whitespace(mode, False)
+                can_start_expr = self._can_start_expr(mode)
+                token.load(state)
+            else:
+                can_start_expr = self._can_start_expr(mode)
+            if not can_start_expr:
+                break
+
+            with self._speculate() as commit:
                 try:
-                    code += self._rewrite_expr(mode=mode)
+                    code += yield self._rewrite_expr(mode=mode)
                 except SyntaxError:
-                    logger.debug("syntax error consumed while trying to parse expression", exc_info=sys.exc_info())
+                    # The expression started like a valid one but turned out not to be, we leave it to the
+                    # caller to handle the tokens from here on.
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("syntax error consumed while trying to parse expression", exc_info=sys.exc_info())
+                    self.backtrack_count += 1
                     break
                 commit()
 
@@ -499,7 +868,7 @@ class Rewriter:
                 code += "="
                 token.next()
                 # TODO(NiklasRosenstein): This may be problematic in unparenthesised calls?
-                code += self._rewrite_expr(mode=mode)
+                code += yield self._rewrite_expr(mode=mode)
 
             if token.is_control(","):
                 code += ","
@@ -541,23 +910,41 @@ class Rewriter:
         return code
 
     @debug_trace
-    def _rewrite_atom(self, mode: ParseMode = ParseMode.DEFAULT) -> str:
+    def _rewrite_atom(self, mode: ParseMode = ParseMode.DEFAULT) -> "_Parse[str]":
         """
         Consumes a Python or BuildDSL language atom and returns it rewritten as pure Python code. If
         a closure is encountered, it will be replaced with a name reference and the closure itself will
-        be stored in the #_closures mapping.
+        be added to the closures of the current closure.
         """
 
         token = ProxyToken(self.tokenizer)
-
-        if token.is_control("{") and self._test_dict():
-            return self._rewrite_dict()
+        code: str
+
+        memo_key: t.Optional[t.Tuple[int, int]] = None
+        if token.is_control("{"):
+            # NOTE: A dictionary or closure is rewritten the same independent of the *mode*, thus the result
+            #   can be reused whenever we encounter the same brace again with the same closure counter.
+            memo_key = (token.pos.offset, self._closure_counter)
+            memo = self._brace_memo.get(memo_key)
+            if memo is not None:
+                code, state, self._closure_counter, closure_nodes = memo
+                self.tokenizer.state = state
+                self._closure_nodes.extend(closure_nodes)
+                return code
+            num_closure_nodes = len(self._closure_nodes)
+            if (yield self._test_dict()):
+                code = yield self._rewrite_dict()
+                closure_nodes = self._closure_nodes[num_closure_nodes:]
+                self._brace_memo[memo_key] = (code, self.tokenizer.state, self._closure_counter, closure_nodes)
+                return code
 
         code = ""
-        closure = self._parse_closure()
+        closure = yield self._parse_closure()
         if closure:
-            code += closure.id
-            self._closures[closure.id] = closure
+            code += closure.closure.id
+            self._closure_nodes.append(closure)
+            if memo_key is not None:
+                self._brace_memo[memo_key] = (code, self.tokenizer.state, self._closure_counter, [closure])
 
         elif token.is_control("([{"):
             assert not (mode & ParseMode.FUNCTION_CALL) or token.is_control(
@@ -570,7 +957,9 @@ class Rewriter:
             code += self._consume_whitespace(True)
             if not token.is_control(expected_close_token):
                 new_mode = ParseMode.CALL_ARGS if mode & ParseMode.FUNCTION_CALL else ParseMode.DEFAULT
-                code += self._rewrite_items(new_mode | ParseMode.GROUPED) + self._consume_whitespace(mode, False)
+                code += (yield self._rewrite_items(new_mode | ParseMode.GROUPED)) + self._consume_whitespace(
+                    mode, False
+                )
             if not token.is_control(expected_close_token):
                 raise self._syntax_error(f"expected {expected_close_token} but got {token}")
 
@@ -580,7 +969,7 @@ class Rewriter:
         elif mode & ParseMode.CALL_ARGS and (token.is_control(["*", "**"])):
             code += token.value
             token.next()
-            code += self._rewrite_expr(mode=ParseMode.DEFAULT)
+            code += yield self._rewrite_expr(mode=ParseMode.DEFAULT)
 
         elif token.type in (Token.Name, Token.Literal):
             code += token.value
@@ -589,7 +978,7 @@ class Rewriter:
         elif token.type == Token.Control and token.value in UNARY_OPERATORS:
             code += token.value
             token.next()
-            code += self._rewrite_expr(mode=mode)
+            code += yield self._rewrite_expr(mode=mode)
             return code
 
         else:
@@ -598,7 +987,7 @@ class Rewriter:
         return code
 
     @debug_trace
-    def _test_dict(self) -> bool:
+    def _test_dict(self) -> "_Parse[bool]":
         """
         Tests if the code from the current opening curly brace looks like a dictionary definition.
         This does not match an empty dictionary, but only one with at least one key.
@@ -607,33 +996,36 @@ class Rewriter:
         token = ProxyToken(self.tokenizer)
         assert token.is_control("{"), False
 
-        with self._lookahead():
+        with self._speculate():
             token.next()
             self._consume_whitespace(True, False)
+            if not self._can_start_expr(ParseMode.GROUPED):
+                return False
+            self.backtrack_count += 1
             try:
-                self._rewrite_expr(mode=ParseMode.GROUPED)
+                (yield self._rewrite_expr(mode=ParseMode.GROUPED))
                 self._consume_whitespace(True, False)
                 return token.is_control(":")
             except SyntaxError:
                 return False
 
     @debug_trace
-    def _rewrite_dict(self) -> str:
+    def _rewrite_dict(self) -> "_Parse[str]":
         token = ProxyToken(self.tokenizer)
         assert token.is_control("{"), token
         token.next()
-        code = "{"
+        code: str = "{"
 
         while not token.is_control("}"):
             code += self._consume_whitespace(True, False)
-            code += self._rewrite_expr(mode=ParseMode.GROUPED)
+            code += yield self._rewrite_expr(mode=ParseMode.GROUPED)
             code += self._consume_whitespace(True, False)
             if not token.is_control(":"):
                 raise self._syntax_error("expected :")
             code += ":"
             token.next()
             code += self._consume_whitespace(True, False)
-            code += self._rewrite_expr(mode=ParseMode.GROUPED)
+            code += yield self._rewrite_expr(mode=ParseMode.GROUPED)
             code += self._consume_whitespace(True, False)
             if not token.is_control(","):
                 break
@@ -648,9 +1040,9 @@ class Rewriter:
         return code + "}"
 
     @debug_trace
-    def _rewrite_stmt_singleline(self) -> str:
+    def _rewrite_stmt_singleline(self) -> "_Parse[str]":
         token = ProxyToken(self.tokenizer)
-        code = self._consume_whitespace(False)
+        code: str = self._consume_whitespace(False)
 
         if token.type == Token.Name and token.value == "pass":
             token.next()
@@ -664,7 +1056,7 @@ class Rewriter:
             if is_yield and token.tv == (Token.Name, "from"):
                 code += token.value
                 token.next()
-            code += self._rewrite_items(ParseMode.DEFAULT) + self._consume_whitespace(True)
+            code += (yield self._rewrite_items(ParseMode.DEFAULT)) + self._consume_whitespace(True)
             return code
 
         elif token.type == Token.Name and token.value in ("import", "from"):
@@ -676,12 +1068,13 @@ class Rewriter:
             return code
 
         else:
-            return code + self._rewrite_stmt_line_expr_or_assign()
+            code += yield self._rewrite_stmt_line_expr_or_assign()
+            return code
 
     @debug_trace
-    def _rewrite_stmt_line_expr_or_assign(self) -> str:
+    def _rewrite_stmt_line_expr_or_assign(self) -> "_Parse[str]":
         token = ProxyToken(self.tokenizer)
-        code = self._rewrite_items(ParseMode.DEFAULT)
+        code: str = yield self._rewrite_items(ParseMode.DEFAULT)
 
         if not code:
             # TODO (@nrosenstein): Better error message. How to reproduce reaching this line:
@@ -696,14 +1089,14 @@ class Rewriter:
         if token.type == Token.Control and token.value in ASSIGNMENT_OPERATORS:
             op = token.value
             token.next()
-            code += op + self._consume_whitespace(newlines=False) + self._rewrite_items(ParseMode.DEFAULT)
+            code += op + self._consume_whitespace(newlines=False) + (yield self._rewrite_items(ParseMode.DEFAULT))
 
         elif token and not token.is_ignorable(True) and not token.is_control(")]}:") and self.grammar.unparen_calls:
             if code[-1].isspace():
                 code = code[:-1]
             # TODO(NiklasRosenstein): We may want to indicate here that we're parsing call arguments,
             #   but that the call is not parenthesised.
-            code += "(" + self._rewrite_items(ParseMode.CALL_ARGS) + ")"
+            code += "(" + (yield self._rewrite_items(ParseMode.CALL_ARGS)) + ")"
 
         # TODO (@nrosenstein): This is a nasty hack to figure out if the current line contains _just_ a name or
         #   a dotted name which, with unparenthesized calls enabled, should act as a call without arguments. Since
@@ -718,7 +1111,7 @@ class Rewriter:
         return code + self._consume_whitespace(True)
 
     @debug_trace
-    def _test_local_def(self) -> t.Optional[str]:
+    def _test_local_def(self) -> "_Parse[t.Optional[str]]":
         """
         Tests if the current `def` keyword introduces a local variable assignment, and if so,
         returns the code for the rewritten code for the entire assignment.
@@ -732,26 +1125,27 @@ class Rewriter:
             self._consume_whitespace(False)
             if token.type != Token.Name:
                 return None
-            code = self.grammar.local_prefix + token.value
+            code: str = self.grammar.local_prefix + token.value
             token.next()
             code += self._consume_whitespace(False)
             if not token.is_control("="):
+                self.backtrack_count += 1
                 return None
             code += token.value
             token.next()
-            code += self._rewrite_expr(ParseMode.DEFAULT)
+            code += yield self._rewrite_expr(ParseMode.DEFAULT)
             commit()
             return code
 
     @debug_trace
-    def _rewrite_stmt(self, indentation: int) -> str:
+    def _rewrite_stmt(self, indentation: int) -> "_Parse[str]":
         """
         Parses a line statement of Python code. Returns an empty string if the actual indendation of
         the code is lower than *indentation*. Handles parsing of Python block statements (such as if,
         try, etc.) recursively.
         """
 
-        code = self._consume_whitespace(True)
+        code: str = self._consume_whitespace(True)
 
         token = ProxyToken(self.tokenizer)
         assert token.type == Token.Indent, token
@@ -764,7 +1158,7 @@ class Rewriter:
         token.next()
 
         if self.grammar.local_def and token.tv == (Token.Name, self.grammar.local_keyword):
-            defcode = self._test_local_def()
+            defcode: t.Optional[str] = yield self._test_local_def()
             if defcode:
                 return code + defcode
 
@@ -780,22 +1174,23 @@ class Rewriter:
             code += ":"
             token.next()
 
-            return code + self._rewrite_stmt_block(indentation)
+            return code + (yield self._rewrite_stmt_block(indentation))
 
         if token.is_control("}"):
             return code
 
         else:
-            return code + self._rewrite_stmt_singleline()
+            code += yield self._rewrite_stmt_singleline()
+            return code
 
     @debug_trace
-    def _rewrite_stmt_block(self, parent_indentation: t.Optional[int] = None) -> str:
+    def _rewrite_stmt_block(self, parent_indentation: t.Optional[int] = None) -> "_Parse[str]":
         """
         Rewrites an entire statement block and returns it's rewritten code.
         """
 
         token = ProxyToken(self.tokenizer)
-        code = self._consume_whitespace(True)
+        code: str = self._consume_whitespace(True)
         if not token:
             return code
         assert token.type == Token.Indent, token
@@ -803,7 +1198,7 @@ class Rewriter:
             raise self._syntax_error(f"expected indent > {parent_indentation}, found {token}")
         indentation = len(token.value)
         while token:
-            stmt = self._rewrite_stmt(indentation)
+            stmt = yield self._rewrite_stmt(indentation)
             if not stmt:
                 break
             code += stmt + self._consume_whitespace(True)
@@ -813,7 +1208,170 @@ class Rewriter:
     def rewrite(self) -> RewriteResult:
         """
         Rewrite the code and return the #RewriteResult. This can be interpreted by the
-        #builddsl.transpiler.ClosureRewriter to re-inject the code for closures.
+        #builddsl.transpiler.ClosureLookupRewriter to re-inject the code for closures.
         """
 
-        return RewriteResult(self._rewrite_stmt_block(), self._closures)
+        code = self._run(self._rewrite_stmt_block())
+        ordered: t.List[Closure] = []
+        nodes = self._closure_nodes[::-1]
+        while nodes:
+            node = nodes.pop()
+            ordered.append(node.closure)
+            nodes.extend(reversed(node.children))
+
+        # Move the code of all closures into one string, so that the closures do not keep a string each alive.
+        source = "".join(closure.text for closure in ordered)
+        closures: t.Dict[str, Closure] = {}
+        offset = 0
+        for closure in ordered:
+            end = offset + closure.end - closure.start
+            closures[closure.id] = closure._replace(source=source, start=offset, end=end)
+            offset = end
+        return RewriteResult(code, closures)
+
+
+#: Tokens after which a sign that is directly followed by a number is the start of an argument of an
+#: unparenthesized call in BuildDSL (`foo -1`), but a binary operator in Python.
+_ATOM_END_TOKENS = frozenset([tokenize.NAME, tokenize.NUMBER, tokenize.STRING])
+_FSTRING_START = getattr(tokenize, "FSTRING_START", None)
+_FSTRING_END = getattr(tokenize, "FSTRING_END", None)
+if _FSTRING_END is not None:
+    _ATOM_END_TOKENS |= {_FSTRING_END}
+
+#: Keywords that continue a compound statement on the same indentation level.
+_CONTINUATION_KEYWORDS = frozenset(["elif", "else", "except", "finally"])
+
+
+def scan_statements(text: str) -> t.Optional[t.List[t.Tuple[int, int, bool]]]:
+    """
+    Splits *text* into its top-level statements with the Python tokenizer and tests for every statement whether it
+    can contain BuildDSL-only syntax. Returns a list of `(start_line, end_line, is_python)` tuples with 1-based,
+    end-exclusive line numbers that cover the whole *text*, where consecutive statements with the same
+    `is_python` value are merged. Returns `None` if *text* cannot be tokenized as Python.
+
+    A statement is treated as plain Python unless it contains a `->`, curly braces that do not start a dictionary
+    (`{}` or `{key: ...}`), a `def name =` local variable definition, a line that consists of just a (dotted)
+    name, or a sign directly attached to a number after an operand (`foo -1`), which BuildDSL parses as an
+    unparenthesized call. Statements that are plain Python can be parsed with :func:`ast.parse` directly, with the
+    same result as after rewriting them with the :class:`Rewriter` if the latter succeeds. Other BuildDSL-only
+    constructs (unparenthesized calls, colon keyword arguments, arguments without commas) are not valid Python,
+    thus the caller must fall back to the :class:`Rewriter` if parsing a plain statement fails.
+    """
+
+    statements: t.List[t.Tuple[int, t.List[tokenize.TokenInfo]]] = []
+    indent = 0
+    at_line_start = True
+    continues = False
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(text).readline):
+            if token.type == tokenize.INDENT:
+                indent += 1
+            elif token.type == tokenize.DEDENT:
+                indent -= 1
+            elif token.type == tokenize.ENDMARKER:
+                break
+            elif token.type not in (tokenize.NL, tokenize.COMMENT):
+                if at_line_start and not indent and not continues and token.string not in _CONTINUATION_KEYWORDS:
+                    statements.append((token.start[0], []))
+                elif not statements:
+                    return None  # The code starts with an indented line.
+                if at_line_start and not indent:
+                    # A decorator belongs to the statement on the next line.
+                    continues = token.string == "@"
+                at_line_start = token.type == tokenize.NEWLINE
+                statements[-1][1].append(token)
+    except (tokenize.TokenError, SyntaxError):
+        return None
+
+    num_lines = text.count("\n") + (0 if text.endswith("\n") else 1) + 1
+    result: t.List[t.Tuple[int, int, bool]] = []
+    for index, (start_line, tokens) in enumerate(statements):
+        start_line = 1 if not index else start_line
+        end_line = statements[index + 1][0] if index + 1 < len(statements) else num_lines
+        is_python = _is_python_statement(tokens)
+        if result and result[-1][2] == is_python:
+            result[-1] = (result[-1][0], end_line, is_python)
+        else:
+            result.append((start_line, end_line, is_python))
+    return result
+
+
+def _is_python_statement(tokens: t.List[tokenize.TokenInfo]) -> bool:
+    """
+    Tests the tokens of a statement for BuildDSL-only syntax, see :func:`scan_statements`.
+    """
+
+    line_start = 0
+    fstring_depth = 0
+    for index, token in enumerate(tokens):
+        # The code in the replacement fields of f-strings is not rewritten.
+        if token.type == _FSTRING_START:
+            fstring_depth += 1
+        elif token.type == _FSTRING_END:
+            fstring_depth -= 1
+        if fstring_depth:
+            continue
+
+        if token.type == tokenize.NEWLINE or token.string == ";":
+            if not _is_python_line(tokens[line_start:index]):
+                return False
+            line_start = index + 1
+        elif token.type != tokenize.OP:
+            pass
+        elif token.string == "->":
+            return False
+        elif token.string == "{" and not _is_dict_start(tokens, index):
+            return False
+        elif token.string in "+-" and index and index + 1 < len(tokens):
+            previous, following = tokens[index - 1], tokens[index + 1]
+            if (
+                following.type == tokenize.NUMBER
+                and following.start == token.end
+                and (previous.string in ")]}" or _is_operand(previous))
+            ):
+                return False
+    return _is_python_line(tokens[line_start:])
+
+
+def _is_operand(token: tokenize.TokenInfo) -> bool:
+    if token.type == tokenize.NAME:
+        return not keyword.iskeyword(token.string) or token.string in ("None", "True", "False")
+    return token.type in _ATOM_END_TOKENS
+
+
+def _is_python_line(tokens: t.List[tokenize.TokenInfo]) -> bool:
+    if len(tokens) >= 3 and tokens[0].string == "def" and tokens[1].type == tokenize.NAME and tokens[2].string == "=":
+        return False
+    # A (dotted) name on its own is a call without arguments in BuildDSL.
+    if tokens and len(tokens) % 2 == 1 and _is_operand(tokens[0]) and tokens[0].type == tokenize.NAME:
+        if all(
+            token.type == tokenize.NAME if index % 2 == 0 else token.string == "."
+            for index, token in enumerate(tokens)
+        ):
+            return False
+    return True
+
+
+def _is_dict_start(tokens: t.List[tokenize.TokenInfo], index: int) -> bool:
+    """
+    Tests if the curly brace at *index* opens an empty dictionary or a dictionary with a key, which the
+    :class:`Rewriter` does not treat as a closure.
+    """
+
+    depth = 0
+    for token in tokens[index + 1 :]:
+        if token.type != tokenize.OP and token.string not in ("lambda", "for"):
+            continue
+        if token.string in ("(", "[", "{"):
+            depth += 1
+        elif token.string in (")", "]", "}"):
+            if not depth:
+                return token is tokens[index + 1]
+            depth -= 1
+        elif depth:
+            continue
+        elif token.string == ":":
+            return token is not tokens[index + 1]
+        elif token.string in (",", "lambda", "for", "**"):
+            return False
+    return False
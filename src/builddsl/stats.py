@@ -0,0 +1,147 @@
+"""
+Instrumentation for the transpile pipeline and the execution of BuildDSL code. Pass a :class:`Stats` object
+to :func:`builddsl.transpiler.transpile_to_ast` or :meth:`builddsl.Context.exec` to record the wall time and a
+few counters (tokens, backtracks, closures and AST nodes) of every phase.
+"""
+
+import ast
+import contextlib
+import json
+import os
+import threading
+import time
+import typing as t
+from dataclasses import dataclass, field
+
+#: The counters that are recorded for the phases of the transpile pipeline, in the order they are reported.
+COUNTERS = ("tokens", "backtracks", "closures", "ast_nodes")
+
+
+@dataclass
+class Phase:
+    """
+    The record of a single phase.
+    """
+
+    #: The name of the phase, e.g. `rewrite` or `compile`.
+    name: str
+
+    #: The filename of the code that was processed.
+    filename: str
+
+    #: The value of :func:`time.perf_counter` when the phase started.
+    start: float
+
+    #: The wall time of the phase in seconds.
+    duration: float
+
+    #: The ID of the thread that ran the phase.
+    thread_id: int
+
+    #: Counters recorded for the phase, see :data:`COUNTERS`.
+    counters: t.Dict[str, int] = field(default_factory=dict)
+
+
+class Stats:
+    """
+    Collects :class:`Phase` records. A single object may be shared between multiple threads, e.g. to profile
+    all scripts executed with :func:`builddsl.exec_concurrently`.
+    """
+
+    def __init__(self) -> None:
+        self.phases: t.List[Phase] = []
+        self._lock = threading.Lock()
+        self._epoch = time.time() - time.perf_counter()
+
+    @contextlib.contextmanager
+    def phase(self, name: str, filename: str) -> t.Iterator[t.Dict[str, int]]:
+        """
+        Record the wall time of the code executed in the context. The context manager returns a dictionary
+        in which counters for the phase may be stored.
+        """
+
+        counters: t.Dict[str, int] = {}
+        start = time.perf_counter()
+        try:
+            yield counters
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.phases.append(Phase(name, filename, start, duration, threading.get_ident(), counters))
+
+    def report(self) -> str:
+        """
+        Returns a table with the total wall time and counters per phase name, in the order in which the phases
+        were first recorded.
+        """
+
+        totals: t.Dict[str, t.Tuple[int, float, t.Dict[str, int]]] = {}
+        for phase in self.phases:
+            calls, duration, counters = totals.get(phase.name, (0, 0.0, {}))
+            for key, value in phase.counters.items():
+                counters[key] = counters.get(key, 0) + value
+            totals[phase.name] = (calls + 1, duration + phase.duration, counters)
+
+        lines = [f"{'phase':<16} {'calls':>6} {'time':>11} " + " ".join(f"{c:>10}" for c in COUNTERS)]
+        for name, (calls, duration, counters) in totals.items():
+            values = " ".join(f"{counters[c]:>10}" if c in counters else f"{'-':>10}" for c in COUNTERS)
+            lines.append(f"{name:<16} {calls:>6} {duration * 1000:>9.2f}ms {values}")
+        lines.append(f"{'total':<16} {'':>6} {sum(p.duration for p in self.phases) * 1000:>9.2f}ms")
+        return "\n".join(lines)
+
+    def to_chrome_trace(self) -> t.List[t.Dict[str, t.Any]]:
+        """
+        Returns the phases as a list of events in the Chrome trace event format (complete events, `"ph": "X"`),
+        which can be loaded into `chrome://tracing` or Perfetto.
+        """
+
+        pid = os.getpid()
+        return [
+            {
+                "name": phase.name,
+                "cat": "builddsl",
+                "ph": "X",
+                "ts": (self._epoch + phase.start) * 1e6,
+                "dur": phase.duration * 1e6,
+                "pid": pid,
+                "tid": phase.thread_id,
+                "args": {"filename": phase.filename, **phase.counters},
+            }
+            for phase in self.phases
+        ]
+
+    def write_chrome_trace(self, filename: str, append: bool = True) -> None:
+        """
+        Write the phases to a file in the Chrome trace event JSON format. If *append* is enabled and the file
+        already exists, its events are preserved. This allows combining the traces of multiple invocations,
+        e.g. when executing every build script in a repository.
+        """
+
+        events: t.List[t.Dict[str, t.Any]] = []
+        if append and os.path.isfile(filename):
+            with open(filename) as fp:
+                events = json.load(fp)["traceEvents"]
+        events += self.to_chrome_trace()
+        with open(filename, "w") as fp:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fp)
+
+
+@contextlib.contextmanager
+def _null_phase() -> t.Iterator[t.Dict[str, int]]:
+    yield {}
+
+
+def phase(stats: "Stats | None", name: str, filename: str) -> t.ContextManager[t.Dict[str, int]]:
+    """
+    Shorthand for :meth:`Stats.phase` that does nothing if *stats* is `None`.
+    """
+
+    return _null_phase() if stats is None else stats.phase(name, filename)
+
+
+def count_nodes(node: ast.AST) -> int:
+    """
+    Returns the number of nodes in an AST.
+    """
+
+    return sum(1 for _ in ast.walk(node))
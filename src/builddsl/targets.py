@@ -4,8 +4,10 @@ types as targets such as mappings and objects, and chaining them together.
 """
 
 import enum
+import functools
+import threading
 import types
-from typing import Any, MutableMapping
+from typing import Any, Callable, Dict, Generic, Iterable, MutableMapping, TypeVar
 
 from typing_extensions import Protocol
 
@@ -16,6 +18,15 @@ class _NotSet(enum.Enum):
 
 undefined = _NotSet.Value
 
+T = TypeVar("T")
+U = TypeVar("U")
+
+_PROPERTY_TYPES = (property, getattr(functools, "cached_property", property))
+
+#: The attribute `active` is set while :meth:`builddsl.closure.ClosureState.prefetch` resolves names in the
+#: current thread, see :class:`LazyTarget`.
+_prefetching = threading.local()
+
 
 class Target(Protocol):
     """
@@ -40,6 +51,33 @@ class Target(Protocol):
     def __delitem__(self, key: str) -> None:
         raise NotImplementedError(self)
 
+    def lookup_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Return the values for all *keys* that can be resolved in this target. Keys that cannot be resolved are
+        omitted from the result. Implementations should override this if they can resolve multiple keys cheaper
+        than one by one.
+        """
+
+        result = {}
+        for key in keys:
+            try:
+                result[key] = self[key]
+            except NameError:
+                pass
+        return result
+
+
+def lookup_many(target: Target, keys: Iterable[str]) -> Dict[str, Any]:
+    """
+    Calls :meth:`Target.lookup_many` of *target*, or the default implementation if the target implements the
+    protocol without subclassing :class:`Target` and does not have the method.
+    """
+
+    method = getattr(target, "lookup_many", None)
+    if method is None:
+        return Target.lookup_many(target, keys)
+    return method(keys)  # type: ignore[no-any-return]
+
 
 class ObjectTarget(Target):
     """
@@ -64,7 +102,21 @@ class ObjectTarget(Target):
             return value
         raise self._error(key)
 
+    def lookup_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        result = {}
+        target = self._target
+        for key in keys:
+            value = getattr(target, key, undefined)
+            if value is not undefined:
+                result[key] = value
+        return result
+
     def __setitem__(self, key: str, value: Any) -> None:
+        # Instance variables and properties are not methods, thus can be set without computing the current value.
+        attribute = getattr(type(self._target), key, None)
+        if key in getattr(self._target, "__dict__", ()) or isinstance(attribute, _PROPERTY_TYPES):
+            setattr(self._target, key, value)
+            return
         current = getattr(self._target, key, undefined)
         if current is undefined:
             raise self._error(key)
@@ -73,6 +125,9 @@ class ObjectTarget(Target):
         setattr(self._target, key, value)
 
     def __delitem__(self, key: str) -> None:
+        if key in getattr(self._target, "__dict__", ()):
+            delattr(self._target, key)
+            return
         current = getattr(self._target, key, undefined)
         if current is undefined:
             raise self._error(key)
@@ -104,6 +159,10 @@ class MutableMappingTarget(Target):
             return self._target[key]
         raise self._error(key)
 
+    def lookup_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        target = self._target
+        return {key: target[key] for key in keys if key in target}
+
     def __setitem__(self, key: str, value: Any) -> None:
         if key in self._target:
             self._target[key] = value
@@ -136,6 +195,16 @@ class ChainedTarget(Target):
                 pass
         raise NameError(key)
 
+    def lookup_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        remaining = list(keys)
+        for ctx in self._targets:
+            if not remaining:
+                break
+            result.update(lookup_many(ctx, remaining))
+            remaining = [key for key in remaining if key not in result]
+        return result
+
     def __setitem__(self, key: str, value: Any) -> None:
         for ctx in self._targets:
             try:
@@ -158,6 +227,123 @@ class ChainedTarget(Target):
         return ChainedTarget(*self._targets, other)
 
 
+class Provider(Generic[T]):
+    """
+    A value that is computed by calling *compute* when it is first accessed with :meth:`get`. The value is
+    memoized; if *compute* raises an exception, the next access calls it again. A provider may be shared between
+    threads, the value is computed only once.
+
+    Use providers for values of a target that are expensive to compute and that scripts reference but may not
+    use, and wrap the target in a :class:`LazyTarget` to resolve names to the values of the providers. Derived
+    values are providers as well, e.g. `archive = version.map(lambda v: f"dist/app-{v}.tar.gz")` computes
+    neither the version nor the archive name until the archive name is accessed.
+    """
+
+    def __init__(self, compute: Callable[[], T]) -> None:
+        self._compute: "Callable[[], T] | None" = compute
+        self._value: "T | _NotSet" = undefined
+        self._lock = threading.RLock()
+
+    def __repr__(self) -> str:
+        return f"Provider({'<not computed>' if self._value is undefined else repr(self._value)})"
+
+    @property
+    def computed(self) -> bool:
+        """
+        Whether the value was computed.
+        """
+
+        return self._value is not undefined
+
+    def get(self) -> T:
+        """
+        Return the value, computing it on the first access.
+
+        :raise RuntimeError: If the value depends on itself.
+        """
+
+        value = self._value
+        if value is not undefined:
+            return value  # type: ignore[return-value]
+        with self._lock:
+            if self._value is undefined:
+                compute = self._compute
+                if compute is None:
+                    raise RuntimeError(f"{self!r} depends on itself")
+                self._compute = None
+                try:
+                    self._value = compute()
+                except BaseException:
+                    self._compute = compute
+                    raise
+            return self._value  # type: ignore[return-value]
+
+    def map(self, func: Callable[[T], U]) -> "Provider[U]":
+        """
+        Return a provider for the value of this provider transformed with *func*. Neither value is computed until
+        the returned provider is accessed.
+        """
+
+        return Provider(lambda: func(self.get()))
+
+    def flat_map(self, func: "Callable[[T], Provider[U]]") -> "Provider[U]":
+        """
+        Like :meth:`map`, but *func* returns another provider whose value is the value of the returned provider.
+        """
+
+        return Provider(lambda: func(self.get()).get())
+
+
+class LazyTarget(Target):
+    """
+    Wraps another target and resolves names whose value is a :class:`Provider` to the value of the provider.
+    Thus, the value is only computed if the code that references the name is executed, e.g. in the action of a
+    task, which is not executed if the task is not needed. Assignments and deletions are passed through to the
+    wrapped target, so assigning a name replaces its provider.
+
+    Scripts define lazy values by assigning a provider, e.g. `archive = provider(() -> "app-" + version)` if
+    :func:`provider` is available to the script, in which `version` is not resolved until `archive` is accessed.
+    The providers themselves remain accessible as attributes of the underlying object, e.g. `self.version` in a
+    closure that is called with the object, to derive other providers with :meth:`Provider.map`. To resolve the
+    names of objects passed to closures lazily as well, pass `lambda obj: LazyTarget(ObjectTarget(obj))` as the
+    *target_factory* of the :class:`~builddsl.Context`.
+
+    Lazy targets cannot be used with #TranspileOptions.prefetch_free_names, which resolves all names of a
+    closure when it is entered, including those that the closure does not use. Entering a closure that would
+    compute a provider this way raises a :class:`RuntimeError`.
+    """
+
+    def __init__(self, target: Target) -> None:
+        self._target = target
+
+    def get(self) -> Any:
+        return self._target.get()
+
+    def __getitem__(self, key: str) -> Any:
+        value = self._target[key]
+        if isinstance(value, Provider):
+            return value.get()
+        return value
+
+    def lookup_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        result = lookup_many(self._target, keys)
+        for key, value in result.items():
+            if isinstance(value, Provider):
+                if getattr(_prefetching, "active", False):
+                    raise RuntimeError(
+                        f"cannot prefetch {key!r}, which is provided lazily; disable "
+                        "TranspileOptions.prefetch_free_names to use a LazyTarget"
+                    )
+                result[key] = value.get()
+        return result
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._target[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self._target[key]
+
+
 def object(obj: Any) -> ObjectTarget:
     """
     Return a wrapper for the object *obj* to be usable as a Closure target.
@@ -183,3 +369,19 @@ def chain(*targets: Target) -> ChainedTarget:
     """
 
     return ChainedTarget(*targets)
+
+
+def lazy(target: Target) -> LazyTarget:
+    """
+    Wrap a target to resolve names whose value is a :class:`Provider` to the value of the provider.
+    """
+
+    return LazyTarget(target)
+
+
+def provider(compute: Callable[[], T]) -> Provider[T]:
+    """
+    Return a :class:`Provider` for the value that is computed by calling *compute* on its first access.
+    """
+
+    return Provider(compute)
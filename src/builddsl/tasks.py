@@ -0,0 +1,341 @@
+"""
+A ready-made target for build scripts that register tasks and the dependencies between them, and a scheduler
+that executes the tasks concurrently.
+
+```py
+task "compile" do: {
+    print("compiling")
+}
+
+task "test" {
+    depends_on "compile"
+    weight = 5
+    do {
+        print("testing")
+    }
+}
+```
+
+```py
+from builddsl import Context
+from builddsl.tasks import TaskGraph
+from builddsl.targets import ObjectTarget
+
+graph = TaskGraph()
+Context(ObjectTarget(graph)).exec(code)
+results = graph.execute(max_workers=4)
+print(results.report())
+```
+
+Tasks whose dependencies are complete are executed on a :class:`concurrent.futures.Executor`, by default a
+:class:`~concurrent.futures.ThreadPoolExecutor`. If more tasks are ready than there are free workers, the tasks
+with the longest remaining path to the end of the graph are started first (critical path first), where every
+task contributes its #Task.weight to the length of the path.
+
+Tasks defined in BuildDSL are closures, which cannot be pickled. A
+:class:`~concurrent.futures.ProcessPoolExecutor` can only be used if all actions are picklable functions.
+"""
+
+import concurrent.futures
+import heapq
+import threading
+import time
+import typing as t
+from dataclasses import dataclass, field
+
+
+class Task:
+    """
+    A named unit of work in a :class:`TaskGraph`. In a BuildDSL closure that configures a task, the members of
+    the task are available as names, e.g. `depends_on`, `do` and `weight`.
+    """
+
+    def __init__(self, graph: "TaskGraph", name: str) -> None:
+        self.graph = graph
+        self.name = name
+
+        #: The function that is called with the task as its argument when the task is executed.
+        self.action: t.Optional[t.Callable[["Task"], t.Any]] = None
+
+        #: The tasks that must complete before this task is started.
+        self.dependencies: t.List[Task] = []
+
+        #: The estimated cost of the task relative to other tasks, used to find the critical path.
+        self.weight: float = 1.0
+
+    def __repr__(self) -> str:
+        return f"Task({self.name!r})"
+
+    def __getstate__(self) -> t.Dict[str, t.Any]:
+        # The graph is not needed to run the action in a worker process, and it contains a lock.
+        state = self.__dict__.copy()
+        del state["graph"]
+        return state
+
+    def depends_on(self, *tasks: "Task | str") -> None:
+        """
+        Add dependencies to the task. Tasks may be referenced by name before they are defined.
+        """
+
+        for task in tasks:
+            if isinstance(task, str):
+                task = self.graph.task(task)
+            if task not in self.dependencies:
+                self.dependencies.append(task)
+
+    def do(self, action: t.Callable[["Task"], t.Any]) -> None:
+        """
+        Set the action of the task.
+        """
+
+        self.action = action
+
+
+@dataclass
+class TaskResult:
+    """
+    The outcome of executing a :class:`Task`.
+    """
+
+    #: The name of the task.
+    name: str
+
+    #: One of `success`, `failed` or `skipped`. A task is skipped if one of its dependencies did not succeed.
+    status: str
+
+    #: The value of :func:`time.time` when the task was started.
+    start: float = 0.0
+
+    #: The wall time of the task in seconds.
+    duration: float = 0.0
+
+    #: The exception raised by the action if the task failed.
+    error: t.Optional[BaseException] = None
+
+    #: The return value of the action.
+    value: t.Any = None
+
+
+@dataclass
+class ExecutionResult:
+    """
+    The results of :meth:`TaskGraph.execute`, in the order in which the tasks completed.
+    """
+
+    results: t.List[TaskResult] = field(default_factory=list)
+
+    #: The wall time of the execution in seconds.
+    duration: float = 0.0
+
+    def __getitem__(self, name: str) -> TaskResult:
+        for result in self.results:
+            if result.name == name:
+                return result
+        raise KeyError(name)
+
+    @property
+    def ok(self) -> bool:
+        return all(result.status == "success" for result in self.results)
+
+    def report(self) -> str:
+        """
+        Returns a table with the status, start time relative to the first task and wall time of every task.
+        """
+
+        epoch = min((r.start for r in self.results if r.status != "skipped"), default=0.0)
+        lines = [f"{'task':<24} {'status':<8} {'start':>11} {'time':>11}"]
+        for result in sorted(self.results, key=lambda r: (r.status == "skipped", r.start)):
+            if result.status == "skipped":
+                lines.append(f"{result.name:<24} {result.status:<8} {'-':>11} {'-':>11}")
+            else:
+                start = (result.start - epoch) * 1000
+                lines.append(f"{result.name:<24} {result.status:<8} {start:>9.2f}ms {result.duration * 1000:>9.2f}ms")
+        lines.append(f"{'total':<24} {'':<8} {'':>11} {self.duration * 1000:>9.2f}ms")
+        return "\n".join(lines)
+
+
+def _run_action(action: t.Callable[[Task], t.Any], task: Task) -> TaskResult:
+    result = TaskResult(task.name, "success", time.time())
+    tstart = time.perf_counter()
+    try:
+        result.value = action(task)
+    except Exception as exc:
+        result.status, result.error = "failed", exc
+    result.duration = time.perf_counter() - tstart
+    return result
+
+
+def _dependents(tasks: t.List[Task]) -> t.Dict[str, t.List[Task]]:
+    dependents: t.Dict[str, t.List[Task]] = {task.name: [] for task in tasks}
+    for task in tasks:
+        for dependency in task.dependencies:
+            dependents[dependency.name].append(task)
+    return dependents
+
+
+class TaskGraph:
+    """
+    A target that records tasks and their dependencies as a directed acyclic graph. Use it as the target of a
+    build script and call :meth:`execute` afterwards.
+    """
+
+    def __init__(self) -> None:
+        self.tasks: t.Dict[str, Task] = {}
+        self._lock = threading.Lock()
+
+    def task(
+        self,
+        name: str,
+        closure: t.Optional[t.Callable[[Task], t.Any]] = None,
+        *,
+        do: t.Optional[t.Callable[[Task], t.Any]] = None,
+    ) -> Task:
+        """
+        Returns the task with the given *name*, creating it if it does not exist.
+
+        :param closure: A closure that is called with the task to configure it.
+        :param do: The action of the task.
+        """
+
+        with self._lock:
+            task = self.tasks.get(name)
+            if task is None:
+                task = self.tasks[name] = Task(self, name)
+        if do is not None:
+            task.do(do)
+        if closure is not None:
+            closure(task)
+        return task
+
+    def _select(self, names: t.Optional[t.Iterable[str]]) -> t.List[Task]:
+        if names is None:
+            return list(self.tasks.values())
+        selected: t.Dict[str, Task] = {}
+        stack = [self.tasks[name] for name in names]
+        while stack:
+            task = stack.pop()
+            if task.name not in selected:
+                selected[task.name] = task
+                stack.extend(task.dependencies)
+        return list(selected.values())
+
+    def critical_path_lengths(self, tasks: t.Optional[t.Iterable[Task]] = None) -> t.Dict[str, float]:
+        """
+        Returns the length of the longest path from every task to a task that no other task depends on, including
+        the task itself, with every task weighted by its #Task.weight.
+
+        :raise ValueError: If the tasks contain a dependency cycle.
+        """
+
+        tasks = list(self.tasks.values()) if tasks is None else list(tasks)
+        dependents = _dependents(tasks)
+
+        # Visit the tasks in reverse topological order (Kahn's algorithm on the reversed edges).
+        remaining = {task.name: len(dependents[task.name]) for task in tasks}
+        queue = [task for task in tasks if not remaining[task.name]]
+        lengths: t.Dict[str, float] = {}
+        while queue:
+            task = queue.pop()
+            lengths[task.name] = task.weight + max((lengths[d.name] for d in dependents[task.name]), default=0.0)
+            for dependency in task.dependencies:
+                remaining[dependency.name] -= 1
+                if not remaining[dependency.name]:
+                    queue.append(dependency)
+        if len(lengths) != len(tasks):
+            cycle = sorted(name for name in remaining if name not in lengths)
+            raise ValueError(f"dependency cycle between tasks {', '.join(cycle)}")
+        return lengths
+
+    def execute(
+        self,
+        names: t.Optional[t.Iterable[str]] = None,
+        max_workers: t.Optional[int] = None,
+        executor: t.Optional[concurrent.futures.Executor] = None,
+    ) -> ExecutionResult:
+        """
+        Execute the tasks with the given *names* and their dependencies, or all tasks. A task is started as soon
+        as all of its dependencies succeeded; tasks that depend on a failed task are skipped. Exceptions raised
+        by the actions are stored in the results and not re-raised.
+
+        :param names: The names of the tasks to execute.
+        :param max_workers: The number of threads to use if no *executor* is given, otherwise the number of tasks
+            that are submitted to the *executor* at the same time. Defaults to the number of workers of the
+            *executor*.
+        :param executor: The executor to run the actions on. It is not shut down. Actions that run in another
+            process receive a copy of the task without its #Task.graph.
+        :raise ValueError: If the tasks contain a dependency cycle.
+        """
+
+        tasks = self._select(names)
+        priorities = self.critical_path_lengths(tasks)
+        waiting = {task.name: len(task.dependencies) for task in tasks}
+        dependents = _dependents(tasks)
+
+        # Ready tasks, ordered by the longest remaining path first and then by the order of definition.
+        order = {name: index for index, name in enumerate(self.tasks)}
+        ready: t.List[t.Tuple[float, int, str]] = []
+        for task in tasks:
+            if not task.dependencies:
+                heapq.heappush(ready, (-priorities[task.name], order[task.name], task.name))
+
+        owns_executor = executor is None
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        capacity = max_workers or getattr(executor, "_max_workers", None) or len(tasks) or 1
+
+        result = ExecutionResult()
+        skipped: t.Set[str] = set()
+        running: t.Dict["concurrent.futures.Future[TaskResult]", Task] = {}
+        tstart = time.perf_counter()
+        try:
+            while ready or running:
+                while ready and len(running) < capacity:
+                    task = self.tasks[heapq.heappop(ready)[2]]
+                    if task.action is None:
+                        result.results.append(TaskResult(task.name, "success", time.time()))
+                        self._complete(task, dependents, waiting, ready, priorities, order)
+                        continue
+                    running[executor.submit(_run_action, task.action, task)] = task
+                if not running:
+                    continue
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    try:
+                        task_result = future.result()
+                    except Exception as exc:  # E.g. the action could not be sent to a worker process.
+                        task_result = TaskResult(task.name, "failed", time.time(), error=exc)
+                    result.results.append(task_result)
+                    if task_result.status == "success":
+                        self._complete(task, dependents, waiting, ready, priorities, order)
+                    else:
+                        self._skip(task, dependents, result, skipped)
+        finally:
+            if owns_executor:
+                executor.shutdown()
+        result.duration = time.perf_counter() - tstart
+        return result
+
+    @staticmethod
+    def _complete(
+        task: Task,
+        dependents: t.Dict[str, t.List[Task]],
+        waiting: t.Dict[str, int],
+        ready: t.List[t.Tuple[float, int, str]],
+        priorities: t.Dict[str, float],
+        order: t.Dict[str, int],
+    ) -> None:
+        for dependent in dependents[task.name]:
+            waiting[dependent.name] -= 1
+            if not waiting[dependent.name]:
+                heapq.heappush(ready, (-priorities[dependent.name], order[dependent.name], dependent.name))
+
+    @staticmethod
+    def _skip(task: Task, dependents: t.Dict[str, t.List[Task]], result: ExecutionResult, skipped: t.Set[str]) -> None:
+        stack = list(dependents[task.name])
+        while stack:
+            dependent = stack.pop()
+            if dependent.name not in skipped:
+                skipped.add(dependent.name)
+                result.results.append(TaskResult(dependent.name, "skipped"))
+                stack.extend(dependents[dependent.name])
@@ -1,15 +1,23 @@
 """
 Transpile BuildDSL code to full fledged Python code.
+
+The transpiler is safe to use from multiple threads concurrently. All state lives in the :class:`Rewriter` and
+:class:`ClosureLookupRewriter` instances that are created per call to :func:`transpile_to_ast`; module-level state
+must remain immutable after import, and caches must guard their state with a lock.
 """
 
 import ast
+import dataclasses
 import logging
+import re
 import sys
 import typing as t
 from dataclasses import dataclass, field
 
 from builddsl.ast_utils import DynamicLookupRewriter
-from builddsl.rewriter import Closure, Grammar, Rewriter
+from builddsl.optimizer import DEFAULT_PASSES, OptimizationPass, enabled_passes, optimize
+from builddsl.rewriter import Closure, Grammar, Rewriter, scan_statements
+from builddsl.stats import Stats, count_nodes, phase
 
 
 @dataclass
@@ -48,8 +56,64 @@ class TranspileOptions:
     #: #closure_default_arglist).
     closure_arglist_prefix: str = ""  # '__closure__,'
 
+    #: The optimization level for the generated code, see :mod:`builddsl.optimizer`. `0` disables the
+    #: optimizer. This is only used if #closure_target is set.
+    optimize: int = 0
+
+    #: Assume that lookups have no side effects and that names which are never assigned or deleted in the code
+    #: keep their value while a function runs, allowing the optimizer to reuse lookups and to hoist them out
+    #: of loops.
+    optimize_snapshot: bool = False
+
+    #: Resolve all names that a closure looks up but never assigns with a single call when the closure is
+    #: entered, see :class:`builddsl.optimizer.PrefetchFreeNames`. This is only used if #closure_target is set.
+    #: Cannot be used with a :class:`~builddsl.targets.LazyTarget`, whose values are computed on first access.
+    prefetch_free_names: bool = False
+
+    #: Compile the body of a closure only when the closure is first called. The definition of a closure is
+    #: replaced with a call to :meth:`~builddsl.closure.ClosureState.lazy_definition` that receives the source
+    #: of the closure as a #ClosureSpan. Names of the enclosing scopes are resolved with
+    #: :meth:`~builddsl.closure.ClosureState.lookup_enclosing` instead of Python closure variables, and
+    #: optimization passes only see the closures that are compiled together. This is only used if
+    #: #closure_target is set.
+    lazy_closures: bool = False
+
+    #: Pass top-level statements that contain no BuildDSL-only syntax directly to :func:`ast.parse` instead of
+    #: the :class:`Rewriter`, see :func:`~builddsl.rewriter.scan_statements`. Statements that fail to parse as
+    #: Python are rewritten as usual. Code that consists mostly of plain Python is transpiled faster, but the
+    #: rewriter is more strict than Python: code that it rejects (e.g. a list comprehension) is accepted if it
+    #: occurs in a plain statement. Plain statements that the rewriter misreads, e.g. adjacent string literals
+    #: on separate lines of a call, keep their meaning in Python.
+    pure_python_fast_path: bool = False
+
+    #: Share the compiled code of closures that are compiled lazily (see #lazy_closures) with all other lazy
+    #: closures in the process that have the same code and options, regardless of the file and line where they
+    #: are defined, see :class:`~builddsl.closure.ClosureCodeCache`.
+    intern_closures: bool = False
+
+    #: The optimization passes that are run, in order. Only passes enabled by the #optimize level,
+    #: #optimize_snapshot and #prefetch_free_names options run.
+    optimizer_passes: t.Sequence[t.Type[OptimizationPass]] = DEFAULT_PASSES
+
     grammar: Grammar = field(default_factory=Grammar)
 
+    def fingerprint(self) -> str:
+        """
+        Returns a string that identifies the options that affect the transpiled code, except for the #grammar.
+        """
+
+        parts = []
+        for option in dataclasses.fields(self):
+            value = getattr(self, option.name)
+            if option.name == "grammar":
+                continue
+            elif option.name == "pure_builtins":
+                value = sorted(value)
+            elif option.name == "optimizer_passes":
+                value = [f"{p.__module__}.{p.__qualname__}" for p in value]
+            parts.append(f"\0{option.name}={value!r}")
+        return "".join(parts)
+
     def sync(self) -> None:
         """Synchronize the options to the #Grammar settings, i.e. the #Grammar.local_def setting
         will be enabled or disabled depending on whether #closure_target is set and the
@@ -59,34 +123,244 @@ class TranspileOptions:
         self.grammar.local_prefix = self.local_vardef_prefix
 
 
-def transpile_to_ast(code: str, filename: str, options: t.Optional[TranspileOptions] = None) -> ast.Module:
+#: The source of a closure that is compiled on first call, see #TranspileOptions.lazy_closures. Contains the
+#: filename, the names of the scopes that enclose the closure definition, and the arguments of
+#: :meth:`Closure.from_text` for the closure followed by those of the closures nested in it (see
+#: :func:`transpile_closure_span`). A span only consists of constants, thus it can be embedded in the transpiled
+#: code.
+ClosureSpan = t.Tuple[str, t.Tuple[str, ...], t.Tuple[t.Tuple[t.Any, ...], ...]]
+
+_IDENTIFIER = re.compile(r"[A-Za-z_]\w*")
+
+
+def transpile_to_ast(
+    code: str,
+    filename: str,
+    options: t.Optional[TranspileOptions] = None,
+    stats: t.Optional[Stats] = None,
+) -> ast.Module:
     """
     Transpile the BuildDSL *code* to a Python `ast.Module` that can be executed.
+
+    :param stats: If specified, the wall time and counters of every phase are recorded in this object.
     """
 
     options = options or TranspileOptions()
-    rewrite = Rewriter(code, filename, options.grammar).rewrite()
-    if sys.version_info[:2] <= (3, 7):
-        module = ast.parse(rewrite.code, filename, mode="exec")
+    segments = None
+    if options.pure_python_fast_path:
+        with phase(stats, "prescan", filename):
+            segments = scan_statements(code)
+
+    closures: t.Dict[str, Closure] = {}
+    if segments is None:
+        module = _rewrite_and_parse(code, filename, options, stats, closures)
     else:
-        module = ast.parse(rewrite.code, filename, mode="exec", type_comments=False)
-    module = ClosureRewriter(filename, options, rewrite.closures).visit(module)
-    if options.closure_target:
-        dynamic_lookup = DynamicLookupRewriter(
-            options.closure_target, options.pure_builtins, options.local_vardef_prefix
-        )
-        module = t.cast(ast.Module, dynamic_lookup.visit(module))
-    return ast.fix_missing_locations(module)
-
+        module = ast.Module(body=[], type_ignores=[])
+        lines = code.splitlines(keepends=True)
+        for start_line, end_line, is_python in segments:
+            segment = "".join(lines[start_line - 1 : end_line - 1])
+            segment_module = None
+            if is_python:
+                with phase(stats, "parse", filename) as counters:
+                    try:
+                        segment_module = _parse(segment, filename)
+                    except SyntaxError:
+                        pass  # E.g. an unparenthesized call, let the rewriter handle it.
+                    else:
+                        ast.increment_lineno(segment_module, start_line - 1)
+                if stats is not None and segment_module is not None:
+                    counters["ast_nodes"] = count_nodes(segment_module)
+            if segment_module is None:
+                segment_module = _rewrite_and_parse(segment, filename, options, stats, closures, start_line - 1)
+            module.body += segment_module.body
+
+    with phase(stats, "transform", filename) as counters:
+        module = t.cast(ast.Module, ClosureLookupRewriter(filename, options, closures).visit(module))
+    if stats is not None:
+        counters["ast_nodes"] = count_nodes(module)
+    if enabled_passes(options):
+        with phase(stats, "optimize", filename) as counters:
+            module = optimize(module, options)
+        if stats is not None:
+            counters["ast_nodes"] = count_nodes(module)
+    return module
+
+
+def _parse(code: str, filename: str) -> ast.Module:
+    if sys.version_info[:2] <= (3, 7):
+        return ast.parse(code, filename, mode="exec")
+    return ast.parse(code, filename, mode="exec", type_comments=False)
+
+
+def _rewrite_and_parse(
+    code: str,
+    filename: str,
+    options: TranspileOptions,
+    stats: t.Optional[Stats],
+    closures: t.Dict[str, Closure],
+    line_offset: int = 0,
+) -> ast.Module:
+    """
+    Rewrite and parse *code* that starts after *line_offset* lines of the file, and add the closures that it
+    contains to *closures*. The closure IDs continue after the closures that are already in *closures*.
+    """
 
-def transpile_to_source(code: str, filename: str, options: t.Optional[TranspileOptions] = None) -> str:
+    with phase(stats, "rewrite", filename) as counters:
+        rewriter = Rewriter(code, filename, options.grammar, len(closures), first_line=line_offset + 1)
+        rewrite = rewriter.rewrite()
+        counters["tokens"] = rewriter.tokenizer.token_count
+        counters["closures"] = len(rewrite.closures)
+        counters["backtracks"] = rewriter.backtrack_count
+    with phase(stats, "parse", filename) as counters:
+        try:
+            module = _parse(rewrite.code, filename)
+        except SyntaxError as exc:
+            if line_offset and exc.lineno is not None:
+                exc.lineno += line_offset
+                if getattr(exc, "end_lineno", None) is not None:
+                    exc.end_lineno += line_offset
+            raise
+    if stats is not None:
+        counters["ast_nodes"] = count_nodes(module)
+    if line_offset:
+        ast.increment_lineno(module, line_offset)
+    closures.update(rewrite.closures)
+    return module
+
+
+def transpile_to_source(
+    code: str,
+    filename: str,
+    options: t.Optional[TranspileOptions] = None,
+    stats: t.Optional[Stats] = None,
+) -> str:
     """
     Transpile the BuildDSL *code* to Python code. Requires the `astor` module to be installed.
     """
 
     from astor import to_source  # type: ignore
 
-    return to_source(transpile_to_ast(code, filename, options))  # type: ignore[no-any-return]
+    module = transpile_to_ast(code, filename, options, stats)
+    with phase(stats, "to_source", filename):
+        return to_source(module)  # type: ignore[no-any-return]
+
+
+def transpile_closure_span(span: ClosureSpan, options: TranspileOptions) -> ast.Module:
+    """
+    Transpile a closure that was deferred with #TranspileOptions.lazy_closures to a module that contains only the
+    function definition of the closure. The closures nested in it are deferred again.
+    """
+
+    filename, enclosing_names, records = span
+    closures = {record[0]: Closure.from_text(*record) for record in records}
+    closure = closures.pop(records[0][0])
+    func = _get_closure_def(filename, options, closure.id, closure)
+    rewriter = ClosureLookupRewriter(filename, options, closures, frozenset(enclosing_names))
+    # Names of the enclosing scopes that the closure assigns are its own local variables, like in a Python closure.
+    rewriter._locals[0].update(_assigned_names(func.body) & rewriter.enclosing_names)
+    module = ast.Module(body=[rewriter.visit(func)], type_ignores=[])
+    return optimize(module, options)
+
+
+def _closure_span(
+    filename: str, closures: t.Dict[str, Closure], closure_id: str, enclosing_names: t.Set[str]
+) -> ClosureSpan:
+    records = []
+    ids = [closure_id]
+    while ids:
+        closure = closures[ids.pop()]
+        fields = (closure.id, closure.line, closure.indent, closure.parameters, closure.is_expr, closure.nested)
+        records.append((*fields, closure.text))
+        ids.extend(reversed(closure.nested))
+    return (filename, tuple(sorted(enclosing_names)), tuple(records))
+
+
+def _literal(value: t.Any) -> ast.expr:
+    """
+    Returns an expression for a constant *value* that may be a nested tuple.
+    """
+
+    if isinstance(value, tuple):
+        return ast.Tuple(elts=[_literal(item) for item in value], ctx=ast.Load())
+    return ast.Constant(value=value)
+
+
+def _assigned_names(body: t.List[ast.stmt]) -> t.Set[str]:
+    """
+    Returns the names that are assigned or deleted in *body*, excluding nested functions, lambdas and classes.
+    """
+
+    names: t.Set[str] = set()
+    nodes: t.List[ast.AST] = list(body)
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.add(node.id)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+            continue
+        nodes.extend(ast.iter_child_nodes(node))
+    return names
+
+
+def _is_async_body(body: t.List[ast.stmt]) -> bool:
+    """
+    Returns `True` if the statements in *body* contain an `await` expression, `async for` or `async with`
+    statement or an asynchronous comprehension that is not nested in another function, lambda or class.
+    """
+
+    nodes: t.List[ast.AST] = list(body)
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, (ast.Await, ast.AsyncFor, ast.AsyncWith)):
+            return True
+        if isinstance(node, ast.comprehension) and node.is_async:
+            return True
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+            continue
+        nodes.extend(ast.iter_child_nodes(node))
+    return False
+
+
+def _to_async_function_def(func: ast.FunctionDef) -> ast.AsyncFunctionDef:
+    """
+    Converts a function definition to an `async def` with the same name, arguments, body and location.
+    """
+
+    fields: t.Dict[str, t.Any] = {field: getattr(func, field, None) for field in func._fields}
+    return ast.copy_location(ast.AsyncFunctionDef(**fields), func)
+
+
+def _get_closure_def(
+    filename: str, options: TranspileOptions, closure_id: str, closure: Closure
+) -> "ast.FunctionDef | ast.AsyncFunctionDef":
+    """
+    Generate the function definition for a closure. The nodes of the definition are located at the position of
+    the closure in the BuildDSL code.
+    """
+
+    if closure.parameters is None:
+        arglist = options.closure_default_arglist
+    else:
+        arglist = ", ".join(closure.parameters)
+    arglist = options.closure_arglist_prefix + arglist
+
+    function_code = f"{options.closure_def_prefix}def {closure_id}({arglist}):\n"
+    function_code = "\n" * (function_code.count("\n") + closure.line) + function_code
+    if closure.is_expr:
+        function_code += " " * closure.indent + "return " + closure.text
+    else:
+        function_code += closure.text.rstrip() or (" " * closure.indent + "pass")
+
+    if sys.version_info[:2] <= (3, 7):
+        module = ast.parse(function_code, filename, mode="exec")
+    else:
+        module = ast.parse(function_code, filename, mode="exec", type_comments=False)
+
+    func = module.body[0]
+    assert isinstance(func, ast.FunctionDef)
+    if _is_async_body(func.body):
+        return _to_async_function_def(func)
+    return func
 
 
 class ClosureRewriter(ast.NodeTransformer):
@@ -107,36 +381,12 @@ class ClosureRewriter(ast.NodeTransformer):
         # Marks the statement nodes in the hierarchy with the closure name(s) to insert.
         self._closure_inserts: t.Dict[ast.stmt, t.List[str]] = {}
 
-    def _get_closure_def(self, closure_id: str) -> ast.FunctionDef:
+    def _get_closure_def(self, closure_id: str) -> "ast.FunctionDef | ast.AsyncFunctionDef":
         """
         Generate a function definition for a closure id.
         """
 
-        closure = self.closures[closure_id]
-        if closure.parameters is None:
-            arglist = self.options.closure_default_arglist
-        else:
-            arglist = ", ".join(closure.parameters)
-        arglist = self.options.closure_arglist_prefix + arglist
-
-        function_code = f"{self.options.closure_def_prefix}def {closure_id}({arglist}):\n"
-        function_code = "\n" * (function_code.count("\n") + closure.line) + function_code
-        if closure.expr:
-            function_code += " " * closure.indent + "return " + closure.expr
-        else:
-            function_code += (closure.body or "").rstrip() or (" " * closure.indent + "pass")
-
-        # self.log.debug('_get_closure_def(%r): parse function body\n\n%s\n', closure_id,
-        #                '  ' + '\n  '.join(function_code.lstrip().splitlines()))
-
-        if sys.version_info[:2] <= (3, 7):
-            module = ast.parse(function_code, self.filename, mode="exec")
-        else:
-            module = ast.parse(function_code, self.filename, mode="exec", type_comments=False)
-
-        func = module.body[0]
-        assert isinstance(func, ast.FunctionDef)
-        return func
+        return _get_closure_def(self.filename, self.options, closure_id, self.closures[closure_id])
 
     def visit_Name(self, name: ast.Name) -> ast.AST:
         if name.id in self.closures:
@@ -167,3 +417,155 @@ class ClosureRewriter(ast.NodeTransformer):
             return result
         finally:
             assert self._hierarchy.pop() == node
+
+
+class ClosureLookupRewriter(DynamicLookupRewriter):
+    """
+    Injects closure definitions like the :class:`ClosureRewriter` and, if #TranspileOptions.closure_target is
+    set, rewrites names like the :class:`DynamicLookupRewriter` in a single traversal of the module. The nodes
+    that replace a name are located at the name, thus the module does not need to be passed through
+    :func:`ast.fix_missing_locations`.
+
+    The result is the same as running the two rewriters one after the other. There, the definition of a closure
+    is visited before the statement that it is injected in front of, whereas here the closures of a statement
+    are only known after the statement was visited. Names that the statement added to the enclosing scopes are
+    hidden while its closure definitions are visited.
+
+    With #TranspileOptions.lazy_closures, closure definitions are replaced by calls to `lazy_definition()` on
+    the closure target. *enclosing_names* are the names of the scopes that enclose a closure that is compiled
+    by :func:`transpile_closure_span`; they are read with `lookup_enclosing()` on the closure target.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        options: TranspileOptions,
+        closures: t.Dict[str, Closure],
+        enclosing_names: t.AbstractSet[str] = frozenset(),
+    ) -> None:
+        super().__init__(
+            options.closure_target or "",
+            options.pure_builtins,
+            options.local_vardef_prefix if options.closure_target else None,
+        )
+        self.filename = filename
+        self.options = options
+        self.closures = closures
+        self.enclosing_names = enclosing_names
+        self._lazy = options.lazy_closures and bool(self.lookup_target)
+
+        # The closures referenced by the innermost statement that is currently visited.
+        self._closure_inserts: t.List[str] = []
+
+        # The names added to a scope while visiting the outermost statement that is currently visited, in order.
+        self._added_locals: t.List[t.Tuple[t.Set[str], t.Set[str]]] = []
+
+        self._statement_depth = 0
+
+    def _add_to_locals(self, varnames: t.Set[str]) -> None:
+        scope = self._locals[-1]
+        added = varnames - scope
+        if added:
+            scope.update(added)
+            self._added_locals.append((scope, added))
+
+    def _visit_closure_defs(self, stmt: ast.stmt, closure_ids: t.List[str], num_added_locals: int) -> t.List[ast.AST]:
+        added_locals = self._added_locals[num_added_locals:]
+        for scope, names in reversed(added_locals):
+            scope.difference_update(names)
+        try:
+            if self._lazy:
+                enclosing_names = set(self.enclosing_names).union(*self._locals)
+                outer_names = set().union(*self._locals[:-1])
+                return [
+                    self._lazy_closure_def(stmt, closure_id, enclosing_names, outer_names) for closure_id in closure_ids
+                ]
+            return [
+                self.visit(_get_closure_def(self.filename, self.options, closure_id, self.closures[closure_id]))
+                for closure_id in closure_ids
+            ]
+        finally:
+            for scope, names in added_locals:
+                scope.update(names)
+
+    def _lazy_closure_def(
+        self, stmt: ast.stmt, closure_id: str, enclosing_names: t.Set[str], outer_names: t.Set[str]
+    ) -> ast.stmt:
+        """
+        Returns the assignment of a closure deferred with #TranspileOptions.lazy_closures, located at *stmt*.
+        The variables of the scopes that enclose the current function (*outer_names*) are not in the locals of
+        the current frame unless the function references them, thus the names that the closure may use are
+        referenced by a lambda that is passed as the `enclosing` argument of `lazy_definition()`.
+        """
+
+        span = _closure_span(self.filename, self.closures, closure_id, enclosing_names)
+        func = ast.Attribute(
+            value=ast.Name(id=self.lookup_target, ctx=ast.Load()), attr="lazy_definition", ctx=ast.Load()
+        )
+        keywords = []
+        used_names = outer_names & {name for record in span[2] for name in _IDENTIFIER.findall(record[6])}
+        if used_names:
+            enclosing = ast.parse(f"lambda: ({', '.join(sorted(used_names))},)", mode="eval").body
+            keywords.append(ast.keyword(arg="enclosing", value=enclosing))
+        assign = ast.Assign(
+            targets=[ast.Name(id=closure_id, ctx=ast.Store())],
+            value=ast.Call(func=func, args=[_literal(span)], keywords=keywords),
+        )
+        for node in ast.walk(assign):
+            ast.copy_location(node, stmt)
+        return assign
+
+    def visit(self, node: ast.AST) -> t.Any:
+        if not isinstance(node, ast.stmt):
+            return super().visit(node)
+
+        outer_closure_inserts, self._closure_inserts = self._closure_inserts, []
+        num_added_locals = len(self._added_locals)
+        self._statement_depth += 1
+        try:
+            result = super().visit(node)
+            if self._closure_inserts:
+                assert isinstance(result, ast.AST)
+                result = [*self._visit_closure_defs(node, self._closure_inserts, num_added_locals), result]
+            return result
+        finally:
+            self._closure_inserts = outer_closure_inserts
+            self._statement_depth -= 1
+            if not self._statement_depth:
+                self._added_locals.clear()
+
+    def visit_Module(self, node: ast.Module) -> ast.AST:
+        preamble = ast.parse(self.options.preamble, self.filename, mode="exec")
+        node.body[0:0] = preamble.body
+        return self.generic_visit(node)
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        if node.id in self.closures:
+            if not self._statement_depth:
+                raise RuntimeError("did not find inner statement to inject closure")
+            self._closure_inserts.append(node.id)
+            return node
+        if not self.lookup_target or self._has_nonlocal(node.id):
+            return node
+        if node.id in self.enclosing_names and isinstance(node.ctx, ast.Load):
+            func = ast.Attribute(
+                value=ast.copy_location(ast.Name(id=self.lookup_target, ctx=ast.Load()), node),
+                attr="lookup_enclosing",
+                ctx=ast.Load(),
+            )
+            return ast.copy_location(
+                ast.Call(
+                    func=ast.copy_location(func, node),
+                    args=[ast.copy_location(ast.Constant(value=node.id), node)],
+                    keywords=[],
+                ),
+                node,
+            )
+        return ast.copy_location(
+            ast.Subscript(
+                value=ast.copy_location(ast.Name(id=self.lookup_target, ctx=ast.Load()), node),
+                slice=ast.Index(value=ast.copy_location(ast.Constant(value=node.id), node)),
+                ctx=node.ctx,
+            ),
+            node,
+        )
@@ -0,0 +1,192 @@
+import dataclasses
+
+import pytest
+from builddsl.api import Context
+from builddsl.config_cache import ConfigurationCache, pure, read_file
+from builddsl.targets import ObjectTarget
+
+code = """
+version = read_version() + "." + str(build_number)
+tags = list(map(str.upper, tags_in))
+del obsolete
+"""
+
+
+class Project:
+
+  def __init__(self, tmp_path, build_number=1):
+    self.tmp_path = tmp_path
+    self.build_number = build_number
+    self.tags_in = ['a', 'b']
+    self.version = None
+    self.tags = None
+    self.obsolete = True
+
+  @pure
+  def read_version(self):
+    return read_file(self.tmp_path / 'VERSION').strip()
+
+
+@pytest.fixture
+def tmp_project(tmp_path):
+  (tmp_path / 'VERSION').write_text('1.0\n')
+  return lambda **kwargs: Project(tmp_path, **kwargs)
+
+
+def _exec(cache, project, source=code, filename='build.dsl', context_type=Context):
+  return cache.exec(context_type(ObjectTarget(project)), source, filename)
+
+
+@pytest.mark.parametrize('persistent', [False, True])
+def test_hit_restores_assignments_and_deletions(tmp_path, tmp_project, persistent):
+  cache = ConfigurationCache(tmp_path / 'cache' if persistent else None)
+  first = tmp_project()
+  assert _exec(cache, first).stored
+  assert first.version == '1.0.1' and first.tags == ['A', 'B'] and not hasattr(first, 'obsolete')
+
+  if persistent:
+    cache = ConfigurationCache(tmp_path / 'cache')
+  second = tmp_project()
+  result = _exec(cache, second)
+  assert result.hit
+  assert second.version == '1.0.1' and second.tags == ['A', 'B'] and not hasattr(second, 'obsolete')
+  assert second.tags is not first.tags
+
+
+def test_first_run_is_stored(tmp_project):
+  cache = ConfigurationCache()
+  result = _exec(cache, tmp_project())
+  assert (result.hit, result.stored, result.reason) == (False, True, None)
+  assert (cache.hits, cache.misses) == (0, 1)
+  assert _exec(cache, tmp_project()).hit
+  assert (cache.hits, cache.misses) == (1, 1)
+
+
+@pytest.mark.parametrize('change', [
+  'input_value',
+  'input_list',
+  'file_content',
+  'file_deleted',
+  'code',
+  'filename',
+  'options',
+  'shadowed_builtin',
+])
+def test_invalidation(tmp_path, tmp_project, change):
+  cache = ConfigurationCache()
+  assert _exec(cache, tmp_project()).stored
+
+  project = tmp_project()
+  kwargs = {}
+  if change == 'input_value':
+    project.build_number = 2
+  elif change == 'input_list':
+    project.tags_in = ['a', 'c']
+  elif change == 'file_content':
+    (tmp_path / 'VERSION').write_text('2.0\n')
+  elif change == 'file_deleted':
+    (tmp_path / 'VERSION').unlink()
+  elif change == 'code':
+    kwargs['source'] = code + '\n'
+  elif change == 'filename':
+    kwargs['filename'] = 'other.dsl'
+  elif change == 'options':
+    class OptimizedContext(Context):
+      OPTIONS = Context.OPTIONS.__class__(**{**Context.OPTIONS.__dict__, 'optimize': 1})
+    kwargs['context_type'] = OptimizedContext
+  elif change == 'shadowed_builtin':
+    project.list = pure(lambda values: ['Z'])
+
+  if change == 'file_deleted':
+    with pytest.raises(FileNotFoundError):
+      _exec(cache, project, **kwargs)
+    return
+
+  result = _exec(cache, project, **kwargs)
+  assert not result.hit
+  if change == 'input_value':
+    assert project.version == '1.0.2'
+  elif change == 'input_list':
+    assert project.tags == ['A', 'C']
+  elif change == 'file_content':
+    assert project.version == '2.0.1'
+  elif change == 'shadowed_builtin':
+    assert project.tags == ['Z']
+
+
+class Settings:
+
+  def __init__(self):
+    self.values = []
+    self.name = None
+
+  def configure(self):
+    pass
+
+
+@pytest.mark.parametrize('source,reason', [
+  ('configure()\n', "read 'configure' of type method"),
+  ('values.append(1)\n', "the value of 'values' was modified in place"),
+  ('name = memoryview(b"")\n', 'an assigned value cannot be pickled'),
+  ('import threading\n', 'imported a module'),
+  ('name = __import__("os").sep\n', 'imported a module'),
+  ('print(name)\n', "used the builtin 'print'"),
+])
+def test_uncacheable(source, reason):
+  cache = ConfigurationCache()
+  settings = Settings()
+  result = cache.exec(Context(ObjectTarget(settings)), source)
+  assert not result.hit and not result.stored
+  assert result.reason.startswith(reason), result.reason
+  assert not cache.exec(Context(ObjectTarget(Settings())), source).hit
+
+
+@pytest.mark.parametrize('source', [
+  'import os\nname = os.environ.get("FOO")\n',
+  'name = __import__("os").environ.get("FOO")\n',
+])
+def test_environment_variables_are_not_cached(monkeypatch, source):
+  cache = ConfigurationCache()
+  monkeypatch.setenv('FOO', 'a')
+  settings = Settings()
+  assert not cache.exec(Context(ObjectTarget(settings)), source).stored
+  assert settings.name == 'a'
+
+  monkeypatch.setenv('FOO', 'b')
+  settings = Settings()
+  assert not cache.exec(Context(ObjectTarget(settings)), source).hit
+  assert settings.name == 'b'
+
+
+@pytest.mark.parametrize('optimize', [0, 2])
+def test_side_effects_are_not_skipped(tmp_path, capsys, optimize):
+  class OptimizedContext(Context):
+    OPTIONS = dataclasses.replace(Context.OPTIONS, optimize=optimize)
+
+  path = tmp_path / 'out.txt'
+  source = f'print("configured")\nopen({str(path)!r}, "w").write("x")\nname = "a"\n'
+  cache = ConfigurationCache()
+  for _ in range(2):
+    path.unlink(missing_ok=True)
+    settings = Settings()
+    result = cache.exec(OptimizedContext(ObjectTarget(settings)), source)
+    assert not result.hit and not result.stored
+    assert settings.name == 'a'
+    assert capsys.readouterr().out == 'configured\n'
+    assert path.read_text() == 'x'
+
+
+def test_failed_run_is_not_stored():
+  cache = ConfigurationCache()
+  with pytest.raises(ZeroDivisionError):
+    cache.exec(Context(ObjectTarget(Settings())), 'name = "a"\n1 / 0\n')
+  assert cache.exec(Context(ObjectTarget(Settings())), 'name = "a"\n1 / 0\n'.replace('1 / 0', 'pass')).stored
+
+
+def test_context_exec(tmp_project):
+  cache = ConfigurationCache()
+  Context(ObjectTarget(tmp_project())).exec(code, 'build.dsl', config_cache=cache)
+  project = tmp_project()
+  Context(ObjectTarget(project)).exec(code, 'build.dsl', config_cache=cache)
+  assert cache.hits == 1
+  assert project.version == '1.0.1'
@@ -0,0 +1,78 @@
+import os
+import socket
+import threading
+
+from builddsl import daemon
+
+
+class Project:
+
+  version = '0.0.0'
+
+
+def test_daemon_caches_unchanged_scripts(tmp_path):
+  script = tmp_path / 'build.dsl'
+  script.write_text('print("version", version)\n')
+  request = daemon.Request(str(script), target=f'{__name__}:Project')
+  server = daemon.Daemon(str(tmp_path / 'daemon.sock'))
+
+  assert server.run(request) == daemon.Response('version 0.0.0\n', '', 0)
+  [cached] = server._scripts.values()
+  code = cached.code
+
+  # Touching the file without changing it only updates the cached stat.
+  os.utime(script, ns=(cached.mtime_ns + 10**9, cached.mtime_ns + 10**9))
+  assert server.run(request).stdout == 'version 0.0.0\n'
+  assert cached.code is code
+
+  script.write_text('import sys\nprint("failed", file=sys.stderr)\nsys.exit(3)\n')
+  assert server.run(request) == daemon.Response('', 'failed\n', 3)
+  [cached] = server._scripts.values()
+  assert cached.code is not code
+
+  script.write_text('undefined_name\n')
+  response = server.run(request)
+  assert response.status == 1
+  assert "NameError: 'undefined_name'" in response.stderr
+
+
+def test_daemon_socket(tmp_path):
+  socket_path = str(tmp_path / 'daemon.sock')
+  thread = threading.Thread(target=daemon.Daemon(socket_path).serve_forever)
+  thread.start()
+  try:
+    while not daemon.is_running(socket_path):
+      pass
+    request = daemon.Request('<stdin>', 'def double = x -> x * 2\nprint(double(21))\n', cwd=str(tmp_path))
+    response = daemon.submit(request, socket_path)
+    assert response == daemon.Response('42\n', '', 0)
+  finally:
+    daemon.submit(daemon.Request('', stop=True), socket_path)
+    thread.join()
+  assert not os.path.exists(socket_path)
+
+
+def test_daemon_survives_invalid_requests(tmp_path):
+  socket_path = str(tmp_path / 'daemon.sock')
+  thread = threading.Thread(target=daemon.Daemon(socket_path).serve_forever)
+  thread.start()
+  try:
+    while not daemon.is_running(socket_path):
+      pass
+
+    def send(data):
+      with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        conn.sendall(data)
+        return daemon._recv_message(conn)
+
+    for data in [b'{"filename": "x", "bogus": 1}\n', b'not json\n', b'[1]\n']:
+      response = daemon.Response(**send(data))
+      assert response.status == 1 and response.stderr.startswith('invalid request: ')
+
+    request = daemon.Request('<stdin>', 'print(42)\n', cwd=str(tmp_path))
+    assert daemon.submit(request, socket_path) == daemon.Response('42\n', '', 0)
+  finally:
+    daemon.submit(daemon.Request('', stop=True), socket_path)
+    thread.join()
+  assert not os.path.exists(socket_path)
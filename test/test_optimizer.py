@@ -0,0 +1,223 @@
+
+import ast
+import dataclasses
+import sys
+import typing as t
+
+import pytest
+from builddsl.api import Context
+from builddsl.closure import LazyClosureFunction, NameStats, StatelessClosureFunction
+from builddsl.optimizer import OptimizationPass
+from builddsl.stats import Stats
+from builddsl.targets import ObjectTarget
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 8), reason='the optimizer requires assignment expressions')
+
+
+class Project:
+
+  name = 'builddsl'
+  count = 0
+
+  def __init__(self):
+    self.lines = []
+
+  def emit(self, *values):
+    self.lines.append(values)
+
+  def rename(self):
+    self.name = 'renamed'
+
+  def task(self, name, closure):
+    closure(self)
+
+  def on_event(self, callback):
+    self.lines.append(callback)
+
+
+def _exec(code: str, stats: t.Optional[Stats] = None, **options: t.Any) -> t.Tuple[Project, NameStats]:
+  class OptimizedContext(Context):
+    OPTIONS = dataclasses.replace(Context.OPTIONS, **options)
+
+  project = Project()
+  name_stats = NameStats()
+  OptimizedContext(ObjectTarget(project)).exec(code, '<string>', stats, name_stats)
+  return project, name_stats
+
+
+def _lookups(name_stats: NameStats, name: str) -> int:
+  return sum(count for (op, key, _), count in name_stats.counts.items() if op == 'get' and key == name)
+
+
+def test_common_lookups_in_statement() -> None:
+  code = 'emit name, name, [name]\ncount = count + 1\nemit count, count\n'
+  stats = Stats()
+  project, name_stats = _exec(code, stats, optimize=1, optimize_snapshot=True)
+  assert project.lines == [('builddsl', 'builddsl', ['builddsl']), (1, 1)]
+  assert _lookups(name_stats, 'name') == 1
+  assert _lookups(name_stats, 'count') == 2
+  assert 'optimize' in [p.name for p in stats.phases]
+
+  project, name_stats = _exec(code, optimize=1)
+  assert _lookups(name_stats, 'name') == 3
+  assert _lookups(name_stats, 'count') == 3
+
+
+def test_common_lookups_require_snapshot() -> None:
+  class CountingProject(Project):
+    reads = 0
+
+    @property
+    def counter(self):
+      self.reads += 1
+      return self.reads
+
+  def run(**options: t.Any) -> t.List[t.Tuple[t.Any, ...]]:
+    class OptimizedContext(Context):
+      OPTIONS = dataclasses.replace(Context.OPTIONS, **options)
+
+    project = CountingProject()
+    OptimizedContext(ObjectTarget(project)).exec('emit counter, counter\n')
+    return project.lines
+
+  assert run(optimize=0) == [(1, 2)]
+  assert run(optimize=1) == [(1, 2)]
+  assert run(optimize=2) == [(1, 2)]
+
+
+def test_common_lookups_are_not_reused_across_calls() -> None:
+  project, name_stats = _exec('emit name, rename(), name\n', optimize=2)
+  assert project.lines == [('builddsl', None, 'renamed')]
+  assert _lookups(name_stats, 'name') == 2
+
+
+def test_loop_invariant_lookups_require_snapshot() -> None:
+  code = 'for i in range(3):\n  emit name\n'
+  project, name_stats = _exec(code, optimize=1)
+  assert project.lines == [('builddsl',)] * 3
+  assert _lookups(name_stats, 'name') == 3
+
+  project, name_stats = _exec(code, optimize=1, optimize_snapshot=True)
+  assert project.lines == [('builddsl',)] * 3
+  assert _lookups(name_stats, 'name') == 1
+
+
+def test_snapshot_does_not_cache_assigned_names() -> None:
+  code = 'for i in range(3):\n  emit count, name\n  count = count + 1\n'
+  project, name_stats = _exec(code, optimize=1, optimize_snapshot=True)
+  assert project.lines == [(0, 'builddsl'), (1, 'builddsl'), (2, 'builddsl')]
+  assert _lookups(name_stats, 'count') == 6
+  assert _lookups(name_stats, 'name') == 1
+
+
+def test_bind_builtins_only_at_level_2() -> None:
+  code = 'emit len(name)\n'
+  project, name_stats = _exec(code, optimize=1)
+  assert _lookups(name_stats, 'len') == 1
+
+  project, name_stats = _exec(code, optimize=2)
+  assert project.lines == [(8,)]
+  assert _lookups(name_stats, 'len') == 0
+
+
+@pytest.mark.skipif(sys.version_info >= (3, 11), reason='the bound __getitem__() is slower since Python 3.11')
+def test_bind_getitem() -> None:
+  class OptimizedContext(Context):
+    OPTIONS = dataclasses.replace(Context.OPTIONS, optimize=1)
+
+  assert '__closure_getitem__(' in OptimizedContext.transpile('emit name\nemit count\n')
+
+
+def test_custom_optimizer_passes() -> None:
+  runs = []
+
+  class RecordPass(OptimizationPass):
+    def run(self, module: ast.Module) -> ast.Module:
+      runs.append(type(self))
+      return module
+
+  class ExpensivePass(RecordPass):
+    level = 3
+
+  _exec('emit name\n', optimize=2, optimizer_passes=[RecordPass, ExpensivePass])
+  assert runs == [RecordPass]
+
+
+def test_prefetch_free_names() -> None:
+  code = 'task "a" {\n  emit name, name\n  count = count + 1\n  emit count\n}\n'
+  project, name_stats = _exec(code, prefetch_free_names=True)
+  assert project.lines == [('builddsl', 'builddsl'), (1,)]
+  assert _lookups(name_stats, 'name') == 1
+  assert _lookups(name_stats, 'emit') == 1
+  assert _lookups(name_stats, 'count') == 2
+
+
+def test_prefetch_free_names_raises_on_entry() -> None:
+  code = 'task "a" {\n  emit "entered"\n  undefined_name\n}\n'
+  with pytest.raises(NameError) as excinfo:
+    _exec(code, prefetch_free_names=True)
+  assert "'undefined_name'" in str(excinfo.value)
+
+
+def test_hoist_closures_out_of_loops() -> None:
+  code = 'for i in range(3):\n  on_event e -> e + i\n'
+  project, _ = _exec(code, optimize=0)
+  assert len({id(callback) for callback in project.lines}) == 3
+
+  project, _ = _exec(code, optimize=1)
+  assert len({id(callback) for callback in project.lines}) == 1
+  assert [callback(1) for callback in project.lines] == [3, 3, 3]
+
+
+def test_hoist_closures_out_of_functions() -> None:
+  code = 'for i in range(2):\n  task "a" {\n    on_event e -> e * 2\n    def n = 3\n    on_event e -> e * n\n  }\n'
+  project, _ = _exec(code, optimize=1)
+  assert [callback(2) for callback in project.lines] == [4, 6, 4, 6]
+  assert project.lines[0] is project.lines[2]
+  assert project.lines[1] is not project.lines[3]
+
+
+def test_ignore_unused_arguments() -> None:
+  class OptimizedContext(Context):
+    OPTIONS = dataclasses.replace(Context.OPTIONS, optimize=1)
+
+  assert '*arguments' not in OptimizedContext.transpile('on_event {\n  emit self\n}\n')
+  assert '*arguments' in OptimizedContext.transpile('on_event {\n  emit self, arguments\n}\n')
+
+  project, _ = _exec('on_event {\n  emit self\n}\n', optimize=1)
+  callback = project.lines.pop()
+  callback('a')
+  callback('b', 1, 2, key=3)
+  assert project.lines == [('a',), ('b',)]
+
+
+def test_keep_arguments_that_are_used() -> None:
+  project, _ = _exec('on_event {\n  emit self, arguments, kwarguments\n}\n', optimize=1)
+  project.lines.pop()('a', 1, key=2)
+  assert project.lines == [('a', (1,), {'key': 2})]
+
+
+def test_skip_closure_state() -> None:
+  project, name_stats = _exec('on_event x -> x % 2\non_event x -> x % count\n', optimize=1)
+  even, modulo = project.lines
+  assert isinstance(even, StatelessClosureFunction)
+  assert not isinstance(modulo, StatelessClosureFunction)
+  assert [even(3), even(4)] == [1, 0]
+  assert even.map(range(4)) == [0, 1, 0, 1]
+  with pytest.raises(ZeroDivisionError):
+    modulo(3)
+
+
+@pytest.mark.parametrize('optimize', [1, 2])
+@pytest.mark.parametrize('intern_closures', [False, True])
+def test_skip_closure_state_with_lazy_closures(optimize: int, intern_closures: bool) -> None:
+  code = 'def inc = x -> x + 1\nemit inc(1)\non_event x -> x % 2\non_event x -> x % count\n'
+  project, _ = _exec(code, optimize=optimize, lazy_closures=True, intern_closures=intern_closures)
+  even, modulo = project.lines[1:]
+  assert project.lines[0] == (2,)
+  assert [even(3), even(4)] == [1, 0]
+  assert isinstance(even, StatelessClosureFunction) and isinstance(even, LazyClosureFunction)
+  assert even.map(range(4)) == [0, 1, 0, 1]
+  with pytest.raises(ZeroDivisionError):
+    modulo(3)
+  assert not isinstance(modulo, StatelessClosureFunction)
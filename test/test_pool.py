@@ -0,0 +1,33 @@
+
+from builddsl.pool import Job, WorkerPool, run_job
+
+
+class Project:
+
+  name = None
+  values = None
+
+  def result(self):
+    return {'name': self.name, 'values': self.values}
+
+
+def _job(filename, code):
+  return Job(filename, code=code, target=f'{__name__}:Project', result=f'{__name__}:Project.result')
+
+
+def test_run_job():
+  result = run_job(_job('<a>', 'name = "a"\nvalues = list(map(x -> x * 2, range(3)))\n'))
+  assert result.ok, result.error
+  assert result.value == {'name': 'a', 'values': [0, 2, 4]}
+
+
+def test_worker_pool():
+  jobs = [_job('<a>', 'name = "a"\n'), _job('<b>', 'undefined_name\n')]
+  with WorkerPool(2, [__name__]) as pool:
+    results = pool.map(jobs)
+    assert pool.submit(jobs[0]).get().value == {'name': 'a', 'values': None}
+
+  assert [result.filename for result in results] == ['<a>', '<b>']
+  assert results[0].value == {'name': 'a', 'values': None}
+  assert not results[1].ok
+  assert "NameError: 'undefined_name'" in results[1].error
@@ -1,8 +1,9 @@
 
 from pathlib import Path
+import typing as t
 
 import pytest
-from builddsl.rewriter import Rewriter, SyntaxError
+from builddsl.rewriter import Closure, Rewriter, SyntaxError, _scan_string_literal
 
 from .utils.testcaseparser import CaseData, cases_from
 
@@ -28,3 +29,84 @@ def test_parser(case_data: CaseData) -> None:
     print(result)
     print('=' * 30, 'REWRITE RESULT')
     assert result == case_data.expects
+
+
+def test_rewriter_does_not_backtrack_on_unambiguous_code() -> None:
+  rewriter = Rewriter('print "a", b\nitems = [\n  1,\n  [2, 3]\n]\nfoo x -> x\n', '<string>')
+  assert rewriter.rewrite().code == 'print("a", b)\nitems = [\n  1,\n  [2, 3]\n]\nfoo(_closure_1)\n'
+  assert rewriter.backtrack_count == 0
+
+
+def test_rewriter_counts_backtracks() -> None:
+  rewriter = Rewriter('foo {\n  print "a"\n}\nbar(a, b)\n', '<string>')
+  rewriter.rewrite()
+  assert rewriter.backtrack_count == 2  # The dictionary test and the closure arglist `(a, b)`
+
+
+def test_rewriter_speculative_syntax_errors_are_not_rendered() -> None:
+  rewriter = Rewriter('foo\n', '<string>')
+  with rewriter._speculate():
+    assert rewriter._syntax_error("a") is rewriter._syntax_error("b") is rewriter._speculative_error
+  error = rewriter._syntax_error("c")
+  assert error is not rewriter._speculative_error
+  assert (error.message, error.filename, error.line) == ("c", "<string>", 1)
+
+
+@pytest.mark.parametrize('make_code', [
+  lambda d: (
+    ''.join(' ' * i + 'foo {\n' for i in range(d)) + ' ' * d + 'bar()\n'
+    + ''.join(' ' * i + '}\n' for i in reversed(range(d)))
+  ),
+  lambda d: 'x = ' + 'f({ ' * d + '1' + ' })' * d + '\n',
+  lambda d: 'x = ' + '{"a": ' * d + '1' + '}' * d + '\n',
+  lambda d: 'x = ' + 'f(' * d + '1' + ')' * d + '\n',
+  lambda d: 'x = ' + '[' * d + '1' + ']' * d + '\n',
+  lambda d: 'x = ' + ' + '.join(['1'] * d) + '\n',
+], ids=['closures', 'closures_in_calls', 'dicts', 'calls', 'lists', 'operators'])
+def test_rewriter_scales_linearly_with_nesting_depth(make_code) -> None:
+  # The number of tokens that the rewriter extracts, including tokens that are extracted again after
+  # backtracking, grows linearly with the nesting depth and does not depend on the recursion limit.
+  token_counts = {}
+  for depth in (100, 1000):
+    rewriter = Rewriter(make_code(depth), '<string>')
+    rewriter.rewrite()
+    token_counts[depth] = rewriter.tokenizer.token_count
+  assert token_counts[1000] < 11 * token_counts[100]
+
+
+@pytest.mark.parametrize('code,length', [
+  ('"a\\"b" c', 6),
+  ('"a\nb"', None),
+  ('"""a\n"b""c""" d', 13),
+  ("'unterminated", None),
+  ('Rb"x"', 5),
+  ('f"{a["k"]}" b', 11),
+  ("f'{x:{w}.{p}}' y", 14),
+  ('f"{{x}}" y', 8),
+  ("f\"{'}'}\" y", 8),
+  ('rf"\\{{x}}" y', 10),
+  ('f"\\N{DASH}{x}" y', 14),
+  ('F"{f"{1}"}" y', 11),
+  ('f"""{\n x # }\n}""" y', 17),
+  ('f"{x', None),
+])
+def test_scan_string_literal(code: str, length: t.Optional[int]) -> None:
+  assert _scan_string_literal(code, 0) == length
+
+
+def test_rewriter_extracts_large_string_literals_as_one_token() -> None:
+  code = 'sh """\n' + 'echo "{x}" \\\n' * 100000 + '"""\n'
+  rewriter = Rewriter(code, '<string>')
+  assert rewriter.rewrite().code == 'sh(' + code[3:-1] + ')\n'
+  assert rewriter.tokenizer.token_count < 20
+
+
+def test_rewriter_closures_share_their_source() -> None:
+  closures = Rewriter('foo {\n  bar x -> x + 1\n}\nbaz {}\n', '<string>').rewrite().closures
+  assert list(closures) == ['_closure_2', '_closure_1']
+  outer, inner = closures.values()
+  assert inner.source is outer.source
+  assert (inner.parameters, inner.expr, inner.body) == (('x',), 'x + 1', None)
+  assert (outer.expr, outer.body, outer.nested) == (None, '\n  bar(_closure_1)\n', ('_closure_1',))
+  expected = inner._replace(source='x + 1', start=0, end=5)
+  assert Closure.from_text('_closure_1', 2, 7, ['x'], True, [], 'x + 1') == expected
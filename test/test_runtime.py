@@ -1,8 +1,15 @@
+import asyncio
+import concurrent.futures
+import dataclasses
+import traceback
 from types import SimpleNamespace
 
 import pytest
+from builddsl import exec_concurrently
 from builddsl.api import Context
-from builddsl.targets import ObjectTarget
+from builddsl.closure import ClosureCodeCache, ClosureState, LazyClosures, NameStats
+from builddsl.stats import Stats
+from builddsl.targets import ChainedTarget, MutableMappingTarget, ObjectTarget
 
 code = """
 task "foobar" do: {
@@ -55,3 +62,285 @@ def test_closure_bad_delete():
   with pytest.raises(NameError) as excinfo:
     Context(None).exec("del foobar", "<string>")
   assert str(excinfo.value) == "unclear where to delete 'foobar'"
+
+
+def test_lookup_many():
+  project = Project()
+  chained = ChainedTarget(MutableMappingTarget({'a': 1}), ObjectTarget(project))
+  assert chained.lookup_many(['n_times', 'a', 'b']) == {'a': 1, 'n_times': 10}
+
+  state = ClosureState(MutableMappingTarget({'a': 1}), None, ClosureState(ObjectTarget(project)))
+  assert state.lookup_many(['a', 'n_times', 'len', 'missing']) == {'a': 1, 'n_times': 10, 'len': len}
+  assert state.prefetch(('len', 'a')) == (len, 1)
+  with pytest.raises(NameError) as excinfo:
+    state.prefetch(('a', 'missing'))
+  assert "'missing'" in str(excinfo.value)
+
+
+def test_prefetch_free_names_with_structural_target():
+  class DictTarget:  # Implements the Target protocol without subclassing it, thus has no lookup_many().
+
+    def __init__(self, values):
+      self.values = values
+
+    def get(self):
+      return self.values
+
+    def __getitem__(self, key):
+      if key in self.values:
+        return self.values[key]
+      raise NameError(key)
+
+    def __setitem__(self, key, value):
+      self.values[key] = value
+
+  class PrefetchContext(Context):
+    OPTIONS = dataclasses.replace(Context.OPTIONS, prefetch_free_names=True)
+
+  target = DictTarget({'offset': 1, 'result': None})
+  PrefetchContext(target).exec('def add = x -> x + offset\nresult = add(2)\n')
+  assert target.values['result'] == 3
+
+
+def test_closure_ignore_extra_arguments():
+  def func(__closure__, self):
+    return __closure__['n_times']
+
+  state = ClosureState(None, None, ObjectTarget(Project()))
+  with pytest.raises(TypeError):
+    state.definition(func)(SimpleNamespace(), key=4)
+
+  closure = state.definition(ClosureState.ignore_extra_arguments(func))
+  assert closure(SimpleNamespace(n_times=3)) == 3
+  assert closure(SimpleNamespace(n_times=3), 1, 2, key=4) == 3
+
+
+def test_closure_target_is_created_on_first_lookup():
+  created = []
+
+  def target_factory(value):
+    created.append(value)
+    return ObjectTarget(value)
+
+  project = Project()
+  Context(ObjectTarget(project), target_factory).exec('task "a" do: { return 42 }\ntask "b" do: { return n_times }\n')
+  obj = SimpleNamespace(n_times=3)
+  assert project.tasks['a'](obj) == 42
+  assert created == []
+  assert project.tasks['b'](obj) == 3
+  assert created == [obj]
+
+
+def test_lazy_closures():
+  class LazyContext(Context):
+    OPTIONS = dataclasses.replace(Context.OPTIONS, lazy_closures=True)
+
+  code = """
+def offset = 10
+for name in ["a", "b"]:
+  task name, do: {
+    def scale = 2
+    return self.n_times * scale + offset
+  }
+task "c", do: {
+  offset = 1
+  return (() -> offset + n_times)()
+}
+"""
+
+  project = Project()
+  LazyContext(ObjectTarget(project)).exec(code)
+  assert all(task.func.__name__ == '_uncompiled' for task in project.tasks.values())
+
+  assert project.tasks['a'](SimpleNamespace(n_times=3)) == 16
+  assert project.tasks['b'](SimpleNamespace(n_times=4)) == 18
+  assert project.tasks['a'].func.__code__ is project.tasks['b'].func.__code__
+  assert project.tasks['c'](SimpleNamespace()) == 11
+
+  # Closures read the variables of the functions that enclose the function in which they are defined.
+  code = """
+def make(a):
+  def b = 2
+  def inner():
+    return () -> a + b
+  return inner()
+result = make(1)()
+"""
+  scope = {'result': None}
+  LazyContext(MutableMappingTarget(scope)).exec(code)
+  assert scope['result'] == 3
+
+
+def test_intern_closures():
+  class InternContext(Context):
+    OPTIONS = dataclasses.replace(Context.OPTIONS, lazy_closures=True, intern_closures=True)
+
+  closure = 'task "t", do: {\n  def scale = 2\n  return (() -> self.n_times * scale / divisor)()\n}\n'
+  code_cache = ClosureCodeCache()
+  projects = []
+  for filename, prefix in [('a.dsl', ''), ('b.dsl', 'task "x", do: { 0 }\n\n')]:
+    project = Project()
+    project.divisor = 1
+    lazy_closures = LazyClosures(InternContext.OPTIONS, code_cache)
+    InternContext(ObjectTarget(project), lazy_closures=lazy_closures).exec(prefix + closure, filename)
+    projects.append(project)
+
+  assert projects[0].tasks['t'](SimpleNamespace(n_times=3)) == 6
+  assert projects[1].tasks['t'](SimpleNamespace(n_times=4)) == 8
+  assert (code_cache.hits, code_cache.misses) == (2, 2)
+  code_a, code_b = (p.tasks['t'].func.__code__ for p in projects)
+  assert code_a.co_code == code_b.co_code and code_a.co_names is code_b.co_names
+  assert (code_a.co_filename, code_b.co_filename) == ('a.dsl', 'b.dsl')
+
+  # The nested closure is relocated as well, it fails at the same location as without interning.
+  def failing_location(project):
+    project.divisor = 0
+    with pytest.raises(ZeroDivisionError) as excinfo:
+      project.tasks['t'](SimpleNamespace(n_times=4))
+    frame = traceback.extract_tb(excinfo.tb)[-1]
+    return frame.filename, frame.lineno
+
+  class LazyContext(Context):
+    OPTIONS = dataclasses.replace(Context.OPTIONS, lazy_closures=True)
+
+  project = Project()
+  LazyContext(ObjectTarget(project)).exec(prefix + closure, 'b.dsl')
+  assert failing_location(projects[1]) == failing_location(project)
+
+  # Syntax errors are reported at the same location as without interning as well.
+  def syntax_error_location(context_type):
+    project = Project()
+    context_type(ObjectTarget(project)).exec(prefix + 'task "s", do: {\n  print(**x, *y)\n}\n', 'b.dsl')
+    with pytest.raises(SyntaxError) as excinfo:
+      project.tasks['s'](SimpleNamespace())
+    return excinfo.value.filename, excinfo.value.lineno
+
+  assert syntax_error_location(InternContext) == syntax_error_location(LazyContext)
+  assert syntax_error_location(InternContext)[0] == 'b.dsl'
+
+
+def test_closure_map():
+  class LazyContext(Context):
+    OPTIONS = dataclasses.replace(Context.OPTIONS, lazy_closures=True)
+
+  code = """
+task "scale" do: {
+  def factor = 2
+  n_times = n_times * factor
+  return (() -> n_times + offset)()
+}
+task "increment" do: x -> x + offset
+"""
+  for context_type in [Context, LazyContext]:
+    project = Project()
+    project.offset = 1
+    context_type(ObjectTarget(project)).exec(code)
+
+    objects = [SimpleNamespace(n_times=i) for i in range(10)]
+    assert project.tasks['scale'].map(objects) == [i * 2 + 1 for i in range(10)]
+    assert [o.n_times for o in objects] == [i * 2 for i in range(10)]
+    assert project.tasks['increment'].map(range(3)) == [1, 2, 3]
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+      objects = [SimpleNamespace(n_times=i) for i in range(100)]
+      assert project.tasks['scale'].map(objects, executor, chunksize=7) == [i * 2 + 1 for i in range(100)]
+      with pytest.raises(TypeError):
+        project.tasks['scale'].map([SimpleNamespace(n_times=1), SimpleNamespace(n_times=None)], executor, chunksize=1)
+
+
+def test_exec_async_with_top_level_await_and_async_closures():
+  class Store:
+    def __init__(self):
+      self.closures = []
+      self.log = []
+
+    async def fetch(self, name):
+      await asyncio.sleep(0)
+      return name.upper()
+
+    def artifact(self, closure):
+      self.closures.append(closure)
+
+  code = """
+artifact {
+  log.append(await fetch("a"))
+}
+artifact { log.append("sync") }
+def x = await fetch("top")
+log.append(x)
+"""
+
+  store = Store()
+  asyncio.run(Context(ObjectTarget(store)).exec_async(code))
+  assert store.log == ['TOP']
+  assert [c.is_async for c in store.closures] == [True, False]
+
+  async def run_all():
+    await asyncio.gather(*(c.call_async(store) for c in store.closures))
+
+  asyncio.run(run_all())
+  assert store.log == ['TOP', 'sync', 'A']
+
+
+def test_exec_concurrently_stress():
+  code = """
+def n = index
+for i in range(50):
+  task "t" + str(i) do: {
+    return n * 100 + int(self)
+  }
+"""
+
+  class IndexedProject(Project):
+    def __init__(self, index):
+      super().__init__()
+      self.index = index
+
+  projects = [IndexedProject(i) for i in range(200)]
+  exec_concurrently([(Context(ObjectTarget(p)), code, f"<project-{p.index}>") for p in projects], max_workers=8)
+
+  for project in projects:
+    assert len(project.tasks) == 50
+    assert [project.tasks[f"t{i}"](i) for i in range(50)] == [project.index * 100 + i for i in range(50)]
+
+
+def test_exec_concurrently_reraises_first_error():
+  with pytest.raises(NameError) as excinfo:
+    exec_concurrently([(Context(ObjectTarget(Project())), f"del x{i}", "<string>") for i in range(3)])
+  assert str(excinfo.value) == "unclear where to delete 'x0'"
+
+
+def test_exec_records_stats():
+  stats = Stats()
+  Context(ObjectTarget(Project())).exec(code, "<string>", stats)
+
+  assert [p.name for p in stats.phases] == [
+    "rewrite", "parse", "transform", "compile", "exec"
+  ]
+  rewrite = stats.phases[0]
+  assert rewrite.counters["closures"] == 4
+  assert rewrite.counters["tokens"] > 0
+  assert all(p.filename == "<string>" for p in stats.phases)
+  assert "transform" in stats.report()
+  assert {e["name"] for e in stats.to_chrome_trace()} == {p.name for p in stats.phases}
+
+
+def test_exec_records_name_stats():
+  name_stats = NameStats()
+  project = Project()
+  Context(ObjectTarget(project)).exec(code, "<string>", name_stats=name_stats)
+  assert project.tasks['foobar'](SimpleNamespace(n_times=3)) == 3
+  assert project.tasks['foobar'](SimpleNamespace()) == 10
+  assert project.tasks['cheeky'](SimpleNamespace()) == 1
+
+  assert name_stats.counts[("get", "task", "parent[1]")] == 3
+  assert name_stats.counts[("get", "n_times", "target")] == 1
+  assert name_stats.counts[("get", "n_times", "parent[2]")] == 1
+  assert name_stats.misses["n_times"] == 1
+  assert name_stats.by_level() == {"parent[1]": 3, "target": 1, "parent[2]": 1}
+  assert name_stats.report().splitlines()[1].split()[:3] == ["task", "get", "3"]
+
+  with pytest.raises(NameError) as excinfo:
+    Context(None).exec("del foobar", "<string>", name_stats=name_stats)
+  assert str(excinfo.value) == "unclear where to delete 'foobar'"
+  assert name_stats.counts[("del", "foobar", "unresolved")] == 1
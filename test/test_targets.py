@@ -0,0 +1,150 @@
+import dataclasses
+import functools
+import sys
+import threading
+
+import pytest
+from builddsl.api import Context
+from builddsl.targets import LazyTarget, MutableMappingTarget, ObjectTarget, Provider, chain, lazy, provider
+from builddsl.tasks import TaskGraph
+
+
+def test_provider_is_computed_once_and_memoized():
+  calls = []
+  version = provider(lambda: calls.append(1) or '1.2.3')
+  archive = version.map(lambda v: f'app-{v}.tar.gz')
+  path = archive.flat_map(lambda name: Provider(lambda: 'dist/' + name))
+  assert not version.computed and not calls
+
+  assert path.get() == 'dist/app-1.2.3.tar.gz'
+  assert archive.get() == 'app-1.2.3.tar.gz'
+  assert version.get() == '1.2.3'
+  assert calls == [1] and version.computed
+  assert repr(version) == "Provider('1.2.3')"
+
+
+def test_provider_retries_after_an_exception_and_detects_cycles():
+  attempts = []
+
+  def compute():
+    attempts.append(1)
+    if len(attempts) == 1:
+      raise OSError('not yet')
+    return 42
+
+  value = Provider(compute)
+  with pytest.raises(OSError):
+    value.get()
+  assert value.get() == 42 and len(attempts) == 2
+
+  cycle = Provider(lambda: cycle.get())
+  with pytest.raises(RuntimeError, match='depends on itself'):
+    cycle.get()
+
+
+def test_provider_is_computed_once_by_concurrent_threads():
+  barrier = threading.Barrier(8)
+  calls = []
+  value = Provider(lambda: calls.append(1) or len(calls))
+  results = []
+
+  def worker():
+    barrier.wait()
+    results.append(value.get())
+
+  threads = [threading.Thread(target=worker) for _ in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert results == [1] * 8 and calls == [1]
+
+
+class Project:
+
+  def __init__(self):
+    self.computed = []
+    self.version = provider(lambda: self.computed.append('version') or '1.2.3')
+    self.sources = provider(lambda: self.computed.append('sources') or ['main.c'])
+
+  @property
+  def checksum(self):
+    self.computed.append('checksum')
+    return 'abc'
+
+  @checksum.setter
+  def checksum(self, value):
+    pass
+
+
+def test_lazy_target_computes_values_when_the_task_is_executed():
+  code = """
+task "compile" do: {
+  compiled.extend(sources)
+}
+task "package" {
+  depends_on "compile"
+  do { archives.append(archive) }
+}
+archive = provider(() -> "app-" + version + ".tar.gz")
+"""
+  project = Project()
+  project.archives, project.compiled, project.archive = [], [], None
+  graph = TaskGraph()
+  functions = MutableMappingTarget({'provider': provider})
+  Context(chain(lazy(ObjectTarget(project)), ObjectTarget(graph), functions)).exec(code)
+  assert project.computed == []
+
+  assert graph.execute(['compile']).ok
+  assert project.computed == ['sources'] and project.compiled == ['main.c']
+
+  assert graph.execute(['package']).ok
+  assert project.computed == ['sources', 'version'] and project.archives == ['app-1.2.3.tar.gz']
+
+
+def test_lazy_target_lookup_and_assignment():
+  project = Project()
+  target = LazyTarget(ObjectTarget(project))
+  assert target.lookup_many(['version', 'missing']) == {'version': '1.2.3'}
+  assert target.get() is project
+
+  # Assigning a property or a provider does not compute its current value.
+  target['checksum'] = None
+  target['sources'] = ['util.c']
+  assert target['sources'] == ['util.c']
+  assert project.computed == ['version']
+  with pytest.raises(NameError):
+    target['missing'] = 1
+
+
+@pytest.mark.skipif(sys.version_info < (3, 8), reason='functools.cached_property requires Python 3.8')
+def test_object_target_sets_cached_property_without_computing_it():
+  class Config:
+    calls = 0
+
+    @functools.cached_property
+    def files(self):
+      Config.calls += 1
+      return ['a']
+
+  config = Config()
+  ObjectTarget(config)['files'] = ['b']
+  assert config.files == ['b'] and Config.calls == 0
+
+
+def test_lazy_target_rejects_prefetch_free_names():
+  class PrefetchContext(Context):
+    OPTIONS = dataclasses.replace(Context.OPTIONS, prefetch_free_names=True)
+
+  code = 'def get_version = x -> {\n  if x:\n    return version\n  return None\n}\nresult = get_version(False)\n'
+  project = Project()
+  project.result = 'unset'
+  with pytest.raises(RuntimeError, match="cannot prefetch 'version'"):
+    PrefetchContext(lazy(ObjectTarget(project))).exec(code)
+  assert project.computed == []
+
+  # Without prefetching, the provider is not computed. Names without a provider are prefetched as usual.
+  Context(lazy(ObjectTarget(project))).exec(code)
+  assert project.result is None and project.computed == []
+  PrefetchContext(lazy(ObjectTarget(project))).exec(code.replace('version', 'checksum'))
+  assert project.computed == ['checksum']
@@ -0,0 +1,108 @@
+import concurrent.futures
+import threading
+import time
+
+import pytest
+from builddsl.api import Context
+from builddsl.targets import ObjectTarget
+from builddsl.tasks import TaskGraph
+
+code = """
+task "compile" do: {
+  log.append(self.name)
+}
+
+task "lint" do: {
+  log.append(self.name)
+}
+
+task "test" {
+  depends_on task("compile"), "lint"
+  weight = 3
+  do {
+    log.append(self.name)
+  }
+}
+
+task "package" {
+  depends_on "test"
+  do { raise RuntimeError("boom") }
+}
+
+task "publish" {
+  depends_on "package"
+}
+"""
+
+
+def _graph(code):
+  graph = TaskGraph()
+  graph.log = []
+  Context(ObjectTarget(graph)).exec(code)
+  return graph
+
+
+def test_task_graph_from_dsl():
+  graph = _graph(code)
+  assert list(graph.tasks) == ['compile', 'lint', 'test', 'package', 'publish']
+  assert [t.name for t in graph.tasks['test'].dependencies] == ['compile', 'lint']
+  assert graph.critical_path_lengths() == {'compile': 6, 'lint': 6, 'test': 5, 'package': 2, 'publish': 1}
+
+  result = graph.execute(max_workers=2)
+  assert sorted(graph.log[:2]) == ['compile', 'lint'] and graph.log[2] == 'test'
+  assert not result.ok
+  assert [(r.name, r.status) for r in result.results][-2:] == [('package', 'failed'), ('publish', 'skipped')]
+  assert str(result['package'].error) == 'boom'
+  assert 'publish' in result.report()
+
+  graph.log.clear()
+  assert graph.execute(['test'], max_workers=1).ok
+  assert graph.log == ['compile', 'lint', 'test']
+
+
+def test_dependency_cycle():
+  graph = TaskGraph()
+  graph.task('a').depends_on('b')
+  graph.task('b').depends_on('a')
+  graph.task('c')
+  with pytest.raises(ValueError) as excinfo:
+    graph.execute()
+  assert str(excinfo.value) == 'dependency cycle between tasks a, b'
+
+
+def test_critical_path_first():
+  # With one worker, the task at the start of the longest chain must run first even though it is defined last.
+  graph = TaskGraph()
+  order = []
+  graph.task('short', do=lambda task: order.append(task.name))
+  graph.task('long-1', do=lambda task: order.append(task.name))
+  graph.task('long-2', do=lambda task: order.append(task.name)).depends_on('long-1')
+  graph.tasks['long-1'].weight = 2
+  assert graph.execute(max_workers=1).ok
+  assert order == ['long-1', 'short', 'long-2']
+
+
+def test_tasks_run_concurrently():
+  barrier = threading.Barrier(3, timeout=5)
+  graph = TaskGraph()
+  for name in 'abc':
+    graph.task(name, do=lambda task: barrier.wait())
+  graph.task('d', do=lambda task: time.sleep(0)).depends_on('a', 'b', 'c')
+  with concurrent.futures.ThreadPoolExecutor(3) as executor:
+    result = graph.execute(executor=executor)
+  assert result.ok, result.report()
+  assert [r.name for r in result.results][-1] == 'd'
+
+
+def _task_name(task):
+  return task.name.upper()
+
+
+def test_process_pool():
+  graph = TaskGraph()
+  graph.task('a', do=_task_name)
+  graph.task('b', do=_task_name).depends_on('a')
+  with concurrent.futures.ProcessPoolExecutor(2) as executor:
+    result = graph.execute(executor=executor)
+  assert result.ok, result.report()
+  assert [(r.name, r.value) for r in result.results] == [('a', 'A'), ('b', 'B')]
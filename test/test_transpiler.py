@@ -1,9 +1,13 @@
+import ast
 import contextlib
+import dataclasses
 import io
 from pathlib import Path
 
+import pytest
 from builddsl.api import Context, execute
-from builddsl.transpiler import transpile_to_source
+from builddsl.rewriter import scan_statements
+from builddsl.transpiler import transpile_to_ast, transpile_to_source
 
 from .utils.testcaseparser import CaseData, cases_from
 
@@ -35,3 +39,78 @@ def test_transpiler(case_data: CaseData) -> None:
     print(fp.getvalue())
 
     assert fp.getvalue().strip() == case_data.outputs.strip()
+
+
+def test_transpile_to_ast_locates_all_nodes() -> None:
+  module = transpile_to_ast('def a = 1\nfoo { print(a) }\nprint(a,\n  bar)\n', '<string>', Context.OPTIONS)
+  for node in ast.walk(module):
+    if 'lineno' in node._attributes:
+      assert hasattr(node, 'lineno'), ast.dump(node)
+
+  # Names that are looked up dynamically are replaced by nodes located at the name.
+  bar = next(n for n in ast.walk(module) if isinstance(n, ast.Constant) and n.value == 'bar')
+  assert (bar.lineno, bar.col_offset) == (4, 2)
+
+
+@cases_from(Path(__file__).parent / 'rewriter_testcases', can_have_outputs=False)
+def test_pure_python_fast_path_produces_the_same_code(case_data: CaseData) -> None:
+  if case_data.expects_syntax_error:
+    pytest.skip('the fast path may accept code that the rewriter rejects')
+  options = dataclasses.replace(Context.OPTIONS, pure_python_fast_path=True)
+  try:
+    expected = transpile_to_ast(case_data.input, case_data.filename, Context.OPTIONS)
+  except SyntaxError:
+    with pytest.raises(SyntaxError):
+      transpile_to_ast(case_data.input, case_data.filename, options)
+    return
+  actual = transpile_to_ast(case_data.input, case_data.filename, options)
+  assert ast.dump(actual) == ast.dump(expected)
+
+
+def test_scan_statements() -> None:
+  code = (
+    'import os\n'            # 1
+    'x = {"a": 1, **{}}\n'   # 2
+    '@decorator\n'           # 3
+    'def f():\n'             # 4
+    '  build\n'              # 5
+    'if x:\n'                # 6
+    '  pass\n'               # 7
+    'else:\n'                # 8
+    '  y = x - 1\n'          # 9
+    'def z = 1\n'            # 10
+    'print(f"{x}")\n'        # 11
+  )
+  assert scan_statements(code) == [(1, 3, True), (3, 6, False), (6, 10, True), (10, 11, False), (11, 12, True)]
+  assert scan_statements('foo -1\nfoo - 1\nfoo\nfoo.bar\nNone\n{1, 2}\n{}\nx -> x\n') == [
+    (1, 2, False), (2, 3, True), (3, 7, False), (7, 8, True), (8, 9, False)
+  ]
+  assert scan_statements('foo(\n') is None
+
+
+def test_pure_python_fast_path_locates_segments() -> None:
+  options = dataclasses.replace(Context.OPTIONS, pure_python_fast_path=True)
+  module = transpile_to_ast('foo {\n  a = 1\n}\nb = 2\nbar {\n  c = 3\n}\n', '<string>', options)
+  # The rewriter joins the lines of a closure, plain statements after it keep their line number.
+  assert next(n for n in ast.walk(module) if isinstance(n, ast.Constant) and n.value == 2).lineno == 4
+  assert [n.name for n in ast.walk(module) if isinstance(n, ast.FunctionDef)] == ['_closure_1', '_closure_2']
+
+
+@pytest.mark.parametrize('fast_path', [False, True])
+def test_pure_python_fast_path_error_positions(fast_path: bool) -> None:
+  options = dataclasses.replace(Context.OPTIONS, pure_python_fast_path=fast_path)
+  with pytest.raises(SyntaxError) as excinfo:
+    transpile_to_ast('a = 1\n\n\ndef x = 1\nf(**x, *y)\n', '<string>', options)
+  assert excinfo.value.lineno == 5
+
+  # The rewriter reports the position of the token at which it failed.
+  with pytest.raises(AssertionError) as excinfo:
+    transpile_to_ast('a = 1\n\nfoo {\n  b = )\n}\n', '<string>', options)
+  assert excinfo.value.args[0].pos.line == 3
+
+  # Closures in a segment after the first are located like without the fast path.
+  code = 'a = 1\n\nfoo {\n  b = 7\n}\n'
+  slow, fast = (transpile_to_ast(code, '<string>', Context.OPTIONS), transpile_to_ast(code, '<string>', options))
+  assert [(type(n).__name__, getattr(n, 'lineno', None)) for n in ast.walk(fast)] == [
+    (type(n).__name__, getattr(n, 'lineno', None)) for n in ast.walk(slow)
+  ]